@@ -0,0 +1,72 @@
+-- ============================================================
+-- Yggdrasil – Daily activity rollup for the heatmap
+-- Run this in the Supabase SQL Editor after social_tables.sql
+-- ============================================================
+
+-- 1. One bucket per user per UTC day
+CREATE TABLE IF NOT EXISTS activity_daily (
+    user_id UUID NOT NULL REFERENCES auth.users(id) ON DELETE CASCADE,
+    day DATE NOT NULL,
+    points INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ DEFAULT now(),
+    PRIMARY KEY (user_id, day)
+);
+
+-- 2. Keep buckets in step with activity_log writes
+CREATE OR REPLACE FUNCTION public.rollup_activity()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO public.activity_daily (user_id, day, points, updated_at)
+        VALUES (NEW.user_id, (NEW.created_at AT TIME ZONE 'UTC')::date, NEW.points, now())
+        ON CONFLICT (user_id, day) DO UPDATE
+            SET points = activity_daily.points + EXCLUDED.points,
+                updated_at = now();
+    END IF;
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        UPDATE public.activity_daily
+            SET points = points - OLD.points,
+                updated_at = now()
+            WHERE user_id = OLD.user_id
+              AND day = (OLD.created_at AT TIME ZONE 'UTC')::date;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+DROP TRIGGER IF EXISTS on_activity_logged ON activity_log;
+CREATE TRIGGER on_activity_logged
+    AFTER INSERT OR UPDATE OF points, created_at OR DELETE ON activity_log
+    FOR EACH ROW EXECUTE FUNCTION public.rollup_activity();
+
+-- 3. Backfill from existing activity
+INSERT INTO activity_daily (user_id, day, points)
+SELECT user_id, (created_at AT TIME ZONE 'UTC')::date, SUM(points)
+FROM activity_log
+GROUP BY 1, 2
+ON CONFLICT (user_id, day) DO UPDATE SET points = EXCLUDED.points;
+
+-- ============================================================
+-- Row-Level Security (mirrors activity_log)
+-- ============================================================
+
+ALTER TABLE activity_daily ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view own daily activity"
+    ON activity_daily FOR SELECT
+    USING (auth.uid() = user_id);
+
+CREATE POLICY "Friends can view public daily activity"
+    ON activity_daily FOR SELECT
+    USING (
+        EXISTS (
+            SELECT 1 FROM friendships f
+            WHERE f.status = 'accepted'
+              AND ((f.user_id = auth.uid() AND f.friend_id = activity_daily.user_id)
+                OR (f.friend_id = auth.uid() AND f.user_id = activity_daily.user_id))
+        )
+        AND EXISTS (
+            SELECT 1 FROM profiles p
+            WHERE p.id = activity_daily.user_id AND p.is_activity_public = true
+        )
+    );
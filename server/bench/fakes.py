@@ -0,0 +1,311 @@
+"""Local stand-ins for yt-dlp, Gemini and Supabase used by the benchmark.
+
+The profile comes from the ``BENCH_PROFILE`` environment variable (JSON) so
+that spawned job workers pick up the same settings as the harness. Latencies
+are in seconds; ``*_error_rate`` values are probabilities per call.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import shutil
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+
+from google.api_core import exceptions
+
+DEFAULT_PROFILE = {
+    "video_path": None,
+    "audio_path": None,
+    "duration": 60,
+    "probe_latency": 0.5,
+    "probe_error_rate": 0.0,
+    "download_latency": 0.5,
+    "gemini_latency": 8.0,
+    "gemini_jitter": 0.25,
+    "gemini_error_rate": 0.0,
+    "db_latency": 0.05,
+}
+
+CANNED_RESULT = json.dumps({
+    "title": "Benchmark clip",
+    "summary": "A synthetic test pattern with a steady tone.",
+    "transcript": "This is a benchmark transcript. " * 40,
+    "claims": [
+        {
+            "claim": f"Synthetic claim {i}",
+            "type": "spoken",
+            "timestamp": f"0:{i * 5:02d}",
+            "verdict": "unverified" if i % 3 else "misleading",
+            "confidence": 0.5,
+            "explanation": "Generated by the benchmark Gemini stub.",
+            "evidence_for": [],
+            "evidence_against": [],
+            "sources": [],
+        }
+        for i in range(6)
+    ],
+    "perspectives": {"left": "n/a", "center": "n/a", "right": "n/a"},
+    "bias_analysis": {
+        "overall_bias": "none",
+        "manipulation_tactics": [],
+        "misleading_visuals": [],
+    },
+    "content_type": "informational",
+})
+
+_installed = False
+
+
+def profile() -> dict:
+    return {**DEFAULT_PROFILE, **json.loads(os.getenv("BENCH_PROFILE", "{}"))}
+
+
+def _latency(name: str, settings: dict) -> float:
+    base = settings[f"{name}_latency"]
+    jitter = settings.get(f"{name}_jitter", 0.0)
+    return max(0.0, random.uniform(base * (1 - jitter), base * (1 + jitter)))
+
+
+def _fails(name: str, settings: dict) -> bool:
+    return random.random() < settings.get(f"{name}_error_rate", 0.0)
+
+
+class FakeYoutubeDL:
+    """Resolves every URL to the local benchmark clip as separate video and audio tracks."""
+
+    def __init__(self, opts: dict | None = None):
+        self.opts = opts or {}
+        self.settings = profile()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def extract_info(self, url: str, download: bool = False) -> dict:
+        time.sleep(_latency("probe", self.settings))
+        if _fails("probe", self.settings):
+            raise RuntimeError("bench: probe failed")
+        video_id = hashlib.sha1(url.encode()).hexdigest()[:11]
+        duration = self.settings["duration"]
+        video, audio = self.settings["video_path"], self.settings["audio_path"]
+        return {
+            "id": video_id,
+            "extractor_key": "Bench",
+            "title": f"Bench {video_id}",
+            "duration": duration,
+            "webpage_url": url,
+            "formats": [
+                {
+                    "format_id": "v", "url": f"file://{video}", "protocol": "file",
+                    "ext": "mp4", "vcodec": "h264", "acodec": "none",
+                    "width": 854, "height": 480, "filesize": os.path.getsize(video),
+                },
+                {
+                    "format_id": "a", "url": f"file://{audio}", "protocol": "file",
+                    "ext": "m4a", "vcodec": "none", "acodec": "aac",
+                    "filesize": os.path.getsize(audio),
+                },
+            ],
+        }
+
+    def sanitize_info(self, info: dict) -> dict:
+        return info
+
+    def process_info(self, info: dict) -> None:
+        time.sleep(_latency("download", self.settings))
+        target = self.opts["outtmpl"] % info
+        shutil.copyfile(info["url"].removeprefix("file://"), target)
+
+
+class FakeModel:
+    """Gemini stub returning a canned analysis after a simulated latency."""
+
+    def __init__(self, settings: dict):
+        self.settings = settings
+
+    async def generate_content_async(self, contents, request_options=None):
+        from services.analyzer import VERIFY_PROMPT
+
+        await asyncio.sleep(_latency("gemini", self.settings))
+        if _fails("gemini", self.settings):
+            raise exceptions.ResourceExhausted("bench: simulated 429")
+        if contents[0] == VERIFY_PROMPT:
+            return SimpleNamespace(text=_verdicts(json.loads(contents[1])["claims"]))
+        return SimpleNamespace(text=CANNED_RESULT)
+
+
+def _verdicts(claims: list[dict]) -> str:
+    return json.dumps({
+        "claims": [
+            {
+                "index": claim["index"],
+                "verdict": "misleading",
+                "confidence": 0.9,
+                "explanation": "Verified by the benchmark Gemini stub.",
+                "evidence_for": [],
+                "evidence_against": [],
+                "sources": [],
+            }
+            for claim in claims
+        ]
+    })
+
+
+class _Query:
+    def __init__(self, store: "FakeSupabase", table: str):
+        self.store = store
+        self.table = table
+        self.filters: list[tuple[str, object]] = []
+        self.row: dict | None = None
+        self.max_rows: int | None = None
+        self.sort: tuple[str, bool] | None = None
+
+    def select(self, columns: str = "*"):
+        return self
+
+    def eq(self, column: str, value):
+        self.filters.append((column, value))
+        return self
+
+    def order(self, column: str, desc: bool = False):
+        self.sort = (column, desc)
+        return self
+
+    def limit(self, n: int):
+        self.max_rows = n
+        return self
+
+    def upsert(self, row: dict):
+        self.row = row
+        return self
+
+    def execute(self):
+        self.store.delay()
+        with self.store.lock:
+            rows = self.store.tables.setdefault(self.table, {})
+            if self.row is not None:
+                key = self.row.get("url_hash") or self.row.get("user_id") or str(uuid.uuid4())
+                stored = {**rows.get(key, {"id": str(uuid.uuid4())}), **self.row}
+                rows[key] = stored
+                return SimpleNamespace(data=[dict(stored)])
+            data = [
+                dict(r) for r in rows.values()
+                if all(r.get(col) == value for col, value in self.filters)
+            ]
+        if self.sort:
+            column, desc = self.sort
+            data.sort(key=lambda r: str(r.get(column)), reverse=desc)
+        return SimpleNamespace(data=data[: self.max_rows] if self.max_rows else data)
+
+
+class _Call:
+    def __init__(self, store: "FakeSupabase", fn, params: dict):
+        self.store, self.fn, self.params = store, fn, params
+
+    def execute(self):
+        self.store.delay()
+        with self.store.lock:
+            return SimpleNamespace(data=self.fn(self.params))
+
+
+class FakeSupabase:
+    """In-memory stand-in for the Supabase tables and RPCs the server uses, one per process."""
+
+    def __init__(self, settings: dict):
+        self.settings = settings
+        self.tables: dict[str, dict] = {}
+        self.lock = threading.Lock()
+        self.applied: set[str] = set()
+        # routes/social.py authenticates each per-user client with the caller's JWT.
+        self.postgrest = SimpleNamespace(auth=lambda token: None)
+
+    def delay(self) -> None:
+        time.sleep(_latency("db", self.settings))
+        if _fails("db", self.settings):
+            raise RuntimeError("bench: simulated Supabase error")
+
+    def table(self, name: str) -> _Query:
+        return _Query(self, name)
+
+    def rpc(self, name: str, params: dict) -> _Call:
+        handlers = {
+            "apply_score_batch": self._apply_score_batch,
+            "claim_lookup": self._claim_lookup,
+            "claim_record": self._claim_record,
+            "fingerprint_lookup": self._fingerprint_lookup,
+            "fingerprint_record": self._fingerprint_record,
+        }
+        if name not in handlers:
+            raise NotImplementedError(name)
+        return _Call(self, handlers[name], params)
+
+    def _claim_lookup(self, params: dict) -> list[dict]:
+        hashes, bands = set(params["p_hashes"]), set(params["p_bands"])
+        rows = self.tables.setdefault("claim_index", {}).values()
+        return [
+            dict(r) for r in rows if r["text_hash"] in hashes or bands & set(r["bands"])
+        ][: params["p_limit"]]
+
+    def _claim_record(self, params: dict) -> None:
+        rows = self.tables.setdefault("claim_index", {})
+        for claim in params["claims"]:
+            rows[claim["text_hash"]] = dict(claim)
+
+    def _fingerprint_lookup(self, params: dict) -> list[dict]:
+        bands = set(params["p_bands"])
+        # Newest first, then most shared bands first, as in media_fingerprints.sql.
+        rows = reversed(list(self.tables.setdefault("media_fingerprints", {}).values()))
+        found = sorted(
+            (r for r in rows if bands & set(r["bands"])),
+            key=lambda r: -len(bands & set(r["bands"])),
+        )
+        return [dict(r) for r in found][: params["p_limit"]]
+
+    def _fingerprint_record(self, params: dict) -> None:
+        row = params["fingerprint"]
+        self.tables.setdefault("media_fingerprints", {})[row["analysis_id"]] = dict(row)
+
+    def _apply_score_batch(self, params: dict) -> list[dict]:
+        scores = self.tables.setdefault("user_scores", {})
+        touched = {}
+        for entry in params["entries"]:
+            if entry["id"] in self.applied:
+                continue
+            self.applied.add(entry["id"])
+            row = scores.setdefault(entry["user_id"], {"user_id": entry["user_id"], "current_score": 0})
+            row["current_score"] += entry["points"]
+            row["tree_state"] = "seedling"
+            touched[entry["user_id"]] = row
+        return [dict(r) for r in touched.values()]
+
+
+def install() -> None:
+    """Swap the real clients in this process for the fakes; safe to call repeatedly."""
+    global _installed
+    if _installed:
+        return
+    from routes import social
+    from services import analyzer, cache, downloader
+
+    settings = profile()
+    downloader.yt_dlp = SimpleNamespace(YoutubeDL=FakeYoutubeDL)
+    analyzer._model = FakeModel(settings)
+    analyzer.GEMINI_UPLOAD_MODE = "inline"
+    cache._client = FakeSupabase(settings)
+    # Every caller's client shares the store; the JWT is checked by the route.
+    social.create_client = lambda *args, **kwargs: cache._client
+    _installed = True
+
+
+def process_video(*args) -> None:
+    """Job handler for spawned workers: install the fakes, then run the real pipeline."""
+    install()
+    from routes import analyze
+
+    analyze.process_video(*args)
@@ -0,0 +1,446 @@
+"""Offline end-to-end benchmark of the analysis pipeline.
+
+Runs the real app, job workers, ffmpeg extraction and cache/ledger code against
+the local fakes in ``bench.fakes``. It drives ``POST /api/analyze`` plus
+``/api/status`` polling at a fixed client concurrency. From ``server/``::
+
+    python -m bench.run --jobs 40 --concurrency 8 --gemini-latency 5
+
+It reports throughput, end-to-end latency, per-stage p50/p99 (from the
+``yggdrasil_stage_seconds`` histograms) and peak RSS of the API and worker
+processes. State goes to a throwaway directory, so a run never touches the
+real job database or media directory.
+
+With ``--social N`` it instead keeps N clients on ``GET /api/activity/{id}``
+for ``--social-seconds`` while probing ``/api/health``, and reports both
+latencies; ``--db-latency`` sets how long each fake Supabase query takes::
+
+    python -m bench.run --social 300 --db-latency 0.3
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import multiprocessing
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+BENCH_USER = "00000000-0000-4000-8000-000000000000"
+BENCH_JWT_SECRET = "bench-jwt-secret-not-used-outside-the-bench"
+HEALTH_INTERVAL = 0.05
+
+PROFILE_KEYS = (
+    "duration",
+    "probe_latency",
+    "probe_error_rate",
+    "download_latency",
+    "gemini_latency",
+    "gemini_jitter",
+    "gemini_error_rate",
+    "db_latency",
+)
+
+
+def _parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--jobs", type=int, default=20, help="analyze requests to submit")
+    parser.add_argument("--concurrency", type=int, default=4, help="concurrent clients")
+    parser.add_argument(
+        "--duplicates", type=float, default=0.0,
+        help="fraction of requests that reuse an already submitted URL",
+    )
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument(
+        "--stream", action="store_true",
+        help="follow jobs through /api/status/{id}/events instead of polling",
+    )
+    parser.add_argument(
+        "--fingerprint", action="store_true",
+        help="fingerprint media, so later jobs on a worker reuse its first result",
+    )
+    parser.add_argument(
+        "--social", type=int, default=0,
+        help="saturate /api/activity with this many clients and measure /api/health instead",
+    )
+    parser.add_argument("--social-seconds", type=float, default=10.0)
+    parser.add_argument("--timeout", type=float, default=600.0, help="per-job deadline")
+    parser.add_argument("--duration", type=float, default=60, help="clip length in seconds")
+    parser.add_argument("--probe-latency", type=float, default=0.5)
+    parser.add_argument("--probe-error-rate", type=float, default=0.0)
+    parser.add_argument("--download-latency", type=float, default=0.5)
+    parser.add_argument("--gemini-latency", type=float, default=8.0)
+    parser.add_argument("--gemini-jitter", type=float, default=0.25)
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0)
+    parser.add_argument("--db-latency", type=float, default=0.05)
+    parser.add_argument("--workdir", help="keep state and media here instead of a temp dir")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    return parser.parse_args(argv)
+
+
+def _make_media(workdir: Path, duration: float) -> tuple[Path, Path]:
+    """Render a test-pattern video track and a tone audio track once per workdir."""
+    video = workdir / f"bench_{duration:g}s.mp4"
+    audio = workdir / f"bench_{duration:g}s.m4a"
+    if not video.exists():
+        subprocess.run(
+            ["ffmpeg", "-y", "-f", "lavfi", "-i", "testsrc=size=854x480:rate=10",
+             "-t", str(duration), "-an", "-c:v", "libx264", "-preset", "ultrafast",
+             "-crf", "35", "-g", "60", str(video)],
+            capture_output=True, check=True,
+        )
+    if not audio.exists():
+        subprocess.run(
+            ["ffmpeg", "-y", "-f", "lavfi", "-i", "sine=frequency=440:sample_rate=44100",
+             "-t", str(duration), "-vn", "-c:a", "aac", "-b:a", "96k", str(audio)],
+            capture_output=True, check=True,
+        )
+    return video, audio
+
+
+def _rss_kb(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+class _RssSampler(threading.Thread):
+    """Tracks peak RSS of this process, of any one worker and of the whole pool."""
+
+    def __init__(self, interval: float = 0.2):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.stop = threading.Event()
+        self.api = self.worker = self.total = 0
+
+    def run(self) -> None:
+        while not self.stop.wait(self.interval):
+            api = _rss_kb(os.getpid())
+            workers = [_rss_kb(p.pid) for p in multiprocessing.active_children()]
+            self.api = max(self.api, api)
+            self.worker = max([self.worker, *workers])
+            self.total = max(self.total, api + sum(workers))
+
+
+def _quantile(buckets: list[tuple[float, float]], q: float) -> float | None:
+    """Interpolated quantile over cumulative ``(le, count)`` buckets, as histogram_quantile."""
+    if not buckets or buckets[-1][1] == 0:
+        return None
+    rank = q * buckets[-1][1]
+    prev_le, prev_count = 0.0, 0.0
+    for le, count in buckets:
+        if count >= rank:
+            if math.isinf(le):
+                return prev_le
+            if count == prev_count:
+                return le
+            return prev_le + (le - prev_le) * (rank - prev_count) / (count - prev_count)
+        prev_le, prev_count = le, count
+    return prev_le
+
+
+def _stage_report() -> dict:
+    from prometheus_client import CollectorRegistry, multiprocess
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    buckets: dict[str, list[tuple[float, float]]] = {}
+    sums: dict[str, float] = {}
+    for family in registry.collect():
+        if family.name != "yggdrasil_stage_seconds":
+            continue
+        for sample in family.samples:
+            stage = sample.labels["stage"]
+            if sample.name.endswith("_bucket"):
+                buckets.setdefault(stage, []).append((float(sample.labels["le"]), sample.value))
+            elif sample.name.endswith("_sum"):
+                sums[stage] = sample.value
+    report = {}
+    for stage, rows in sorted(buckets.items()):
+        rows.sort()
+        count = rows[-1][1]
+        report[stage] = {
+            "count": int(count),
+            "mean": sums.get(stage, 0.0) / count if count else None,
+            "p50": _quantile(rows, 0.50),
+            "p99": _quantile(rows, 0.99),
+        }
+    return report
+
+
+def _percentile(values: list[float], q: float) -> float | None:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(math.ceil(q * len(values))) - 1)]
+
+
+async def _follow(http, job_id: str, timeout: float) -> dict:
+    """Read the job's event stream until its ``result`` event."""
+    event = None
+    try:
+        async with asyncio.timeout(timeout):
+            async with http.stream("GET", f"/api/status/{job_id}/events") as response:
+                async for line in response.aiter_lines():
+                    if line.startswith("event: "):
+                        event = line[len("event: "):]
+                    elif line.startswith("data: ") and event == "result":
+                        return json.loads(line[len("data: "):])
+    except TimeoutError:
+        pass
+    return {}
+
+
+async def _drive(app, urls: list[str], args) -> list[dict]:
+    import httpx
+
+    pending: asyncio.Queue = asyncio.Queue()
+    for url in urls:
+        pending.put_nowait(url)
+    outcomes: list[dict] = []
+
+    async def client(http: httpx.AsyncClient) -> None:
+        while not pending.empty():
+            url = pending.get_nowait()
+            started = time.monotonic()
+            outcome = {"url": url, "status": "error", "polls": 0}
+            response = await http.post("/api/analyze", json={"url": url, "user_id": BENCH_USER})
+            if response.status_code != 200:
+                outcome["error"] = response.text
+            elif args.stream:
+                job_id = response.json()["job_id"]
+                status = await _follow(http, job_id, args.timeout)
+                outcome["polls"] += 1
+                outcome["status"] = status.get("status", "timeout")
+                outcome["error"] = status.get("error")
+            else:
+                job_id = response.json()["job_id"]
+                while time.monotonic() - started < args.timeout:
+                    status = (await http.get(f"/api/status/{job_id}")).json()
+                    outcome["polls"] += 1
+                    if status["status"] in ("complete", "failed"):
+                        outcome["status"] = status["status"]
+                        outcome["error"] = status.get("error")
+                        break
+                    await asyncio.sleep(args.poll_interval)
+                else:
+                    outcome["status"] = "timeout"
+            outcome["seconds"] = time.monotonic() - started
+            outcomes.append(outcome)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as http:
+        await asyncio.gather(*(client(http) for _ in range(args.concurrency)))
+    return outcomes
+
+
+async def _drive_social(app, args) -> dict:
+    """Keep ``args.social`` users on /api/activity while timing /api/health."""
+    import httpx
+    import jwt
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    deadline = time.monotonic() + args.social_seconds
+    social: list[float] = []
+    health: list[float] = []
+    errors: list[str] = []
+
+    async def user(http: httpx.AsyncClient, i: int) -> None:
+        token = jwt.encode(
+            {"sub": f"00000000-0000-4000-8000-{i:012d}", "aud": "authenticated",
+             "exp": int(time.time()) + 3600},
+            BENCH_JWT_SECRET,
+            algorithm="HS256",
+        )
+        headers = {"Authorization": f"Bearer {token}"}
+        while time.monotonic() < deadline:
+            started = time.monotonic()
+            response = await http.get(f"/api/activity/{BENCH_USER}", headers=headers)
+            if response.status_code == 200:
+                social.append(time.monotonic() - started)
+            else:
+                errors.append(response.text)
+
+    async def prober(http: httpx.AsyncClient) -> None:
+        while time.monotonic() < deadline:
+            started = time.monotonic()
+            await http.get("/api/health")
+            health.append(time.monotonic() - started)
+            await asyncio.sleep(HEALTH_INTERVAL)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as http:
+        await asyncio.gather(prober(http), *(user(http, i) for i in range(args.social)))
+    return {
+        "clients": args.social,
+        "requests": len(social),
+        "errors": sorted(set(errors))[:5],
+        "activity": {
+            "p50": _percentile(social, 0.50),
+            "p99": _percentile(social, 0.99),
+        },
+        "health": {
+            "count": len(health),
+            "p50": _percentile(health, 0.50),
+            "p99": _percentile(health, 0.99),
+            "max": max(health, default=None),
+        },
+    }
+
+
+def run(args) -> dict:
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix="yggdrasil_bench_"))
+    workdir.mkdir(parents=True, exist_ok=True)
+    video, audio = _make_media(workdir, args.duration)
+
+    state = Path(tempfile.mkdtemp(prefix="state_", dir=workdir))
+    settings = {key: getattr(args, key) for key in PROFILE_KEYS}
+    settings.update(video_path=str(video), audio_path=str(audio))
+    # Must be in place before config is imported, here and in the spawned workers.
+    os.environ["BENCH_PROFILE"] = json.dumps(settings)
+    os.environ["JOB_DB_PATH"] = str(state / "jobs.db")
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = str(state / "metrics")
+    os.environ["TEMP_DIR"] = str(state / "media")
+    # Every bench URL serves the same clip, so all fingerprints would match.
+    os.environ["FINGERPRINT_SECONDS"] = "30" if args.fingerprint else "0"
+    os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+    os.environ.setdefault("SUPABASE_KEY", "bench.bench.bench")
+    os.environ.setdefault("GEMINI_API_KEY", "bench")
+    os.environ.setdefault("CLAIM_INDEX", "1")
+    os.environ["SUPABASE_JWT_SECRET"] = BENCH_JWT_SECRET
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+    import main
+    from bench import fakes
+    from routes import analyze
+
+    fakes.install()
+    # Workers resolve the handler by name, then install the fakes themselves.
+    analyze.process_video = fakes.process_video
+    main.startup()
+
+    if args.social:
+        started = time.monotonic()
+        try:
+            report = asyncio.run(_drive_social(main.app, args))
+        finally:
+            elapsed = time.monotonic() - started
+            main.shutdown()
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+        report["elapsed_seconds"] = elapsed
+        report["profile"] = {key: getattr(args, key) for key in PROFILE_KEYS}
+        return report
+
+    distinct = max(1, round(args.jobs * (1 - args.duplicates)))
+    urls = [f"https://bench.invalid/video/{i}" for i in range(distinct)]
+    urls += [random.choice(urls) for _ in range(args.jobs - distinct)]
+    random.shuffle(urls)
+
+    sampler = _RssSampler()
+    sampler.start()
+    started = time.monotonic()
+    try:
+        outcomes = asyncio.run(_drive(main.app, urls, args))
+    finally:
+        elapsed = time.monotonic() - started
+        sampler.stop.set()
+        sampler.join()
+        main.shutdown()
+
+    stages = _stage_report()
+    if not args.workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    latencies = [o["seconds"] for o in outcomes if o["status"] == "complete"]
+    errors = [o.get("error") for o in outcomes if o["status"] != "complete"]
+    return {
+        "jobs": len(outcomes),
+        "complete": len(latencies),
+        "failed": len(errors),
+        "errors": sorted({str(e) for e in errors})[:5],
+        "elapsed_seconds": elapsed,
+        "jobs_per_second": len(latencies) / elapsed if elapsed else 0.0,
+        "status_polls": sum(o["polls"] for o in outcomes),
+        "end_to_end": {
+            "p50": _percentile(latencies, 0.50),
+            "p99": _percentile(latencies, 0.99),
+        },
+        "stages": stages,
+        "peak_rss_mb": {
+            "api": sampler.api / 1024,
+            "worker": sampler.worker / 1024,
+            "total": sampler.total / 1024,
+        },
+        "profile": {key: getattr(args, key) for key in PROFILE_KEYS},
+    }
+
+
+def _fmt(value: float | None) -> str:
+    return "-" if value is None else f"{value:.3f}"
+
+
+def _print_social(report: dict) -> None:
+    print(
+        f"{report['requests']} /api/activity requests from {report['clients']} clients"
+        f" in {report['elapsed_seconds']:.1f}s"
+    )
+    for error in report["errors"]:
+        print(f"  error: {error}")
+    activity, health = report["activity"], report["health"]
+    print(f"activity  p50 {_fmt(activity['p50'])}s  p99 {_fmt(activity['p99'])}s")
+    print(
+        f"health    p50 {_fmt(health['p50'])}s  p99 {_fmt(health['p99'])}s"
+        f"  max {_fmt(health['max'])}s  ({health['count']} probes)"
+    )
+
+
+def _print(report: dict) -> None:
+    if "health" in report:
+        _print_social(report)
+        return
+    print(
+        f"{report['complete']}/{report['jobs']} jobs complete in "
+        f"{report['elapsed_seconds']:.1f}s ({report['jobs_per_second']:.2f} jobs/s, "
+        f"{report['status_polls']} status requests)"
+    )
+    for error in report["errors"]:
+        print(f"  error: {error}")
+    e2e = report["end_to_end"]
+    print(f"end-to-end  p50 {_fmt(e2e['p50'])}s  p99 {_fmt(e2e['p99'])}s")
+    print(f"{'stage':<20}{'count':>7}{'mean':>10}{'p50':>10}{'p99':>10}")
+    for stage, row in report["stages"].items():
+        print(
+            f"{stage:<20}{row['count']:>7}{_fmt(row['mean']):>10}"
+            f"{_fmt(row['p50']):>10}{_fmt(row['p99']):>10}"
+        )
+    rss = report["peak_rss_mb"]
+    print(
+        f"peak RSS  api {rss['api']:.0f}MB  worker {rss['worker']:.0f}MB"
+        f"  total {rss['total']:.0f}MB"
+    )
+
+
+def main(argv=None) -> None:
+    args = _parse_args(argv)
+    report = run(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        _print(report)
+
+
+if __name__ == "__main__":
+    main()
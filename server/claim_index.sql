@@ -0,0 +1,76 @@
+-- ============================================================
+-- Yggdrasil – Cross-video claim index
+-- Run this in the Supabase SQL Editor after setup_supabase.sql,
+-- then set CLAIM_INDEX=1.
+-- claim_record is limited to the service-role key; with any other
+-- SUPABASE_KEY the index is only read, never added to.
+-- ============================================================
+
+-- 1. One row per normalized claim text with its latest confident verdict.
+-- bands holds the LSH band keys of the claim's MinHash signature (computed
+-- by services/claim_index.py), so near-duplicates are found by overlap.
+CREATE TABLE IF NOT EXISTS claim_index (
+    text_hash TEXT PRIMARY KEY,
+    claim TEXT NOT NULL,
+    normalized TEXT NOT NULL,
+    bands TEXT[] NOT NULL,
+    verdict TEXT NOT NULL,
+    confidence REAL NOT NULL DEFAULT 0,
+    explanation TEXT NOT NULL DEFAULT '',
+    evidence_for JSONB NOT NULL DEFAULT '[]'::jsonb,
+    evidence_against JSONB NOT NULL DEFAULT '[]'::jsonb,
+    sources JSONB NOT NULL DEFAULT '[]'::jsonb,
+    verified_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_claim_index_bands ON claim_index USING GIN (bands);
+CREATE INDEX IF NOT EXISTS idx_claim_index_verified ON claim_index(verified_at);
+
+ALTER TABLE claim_index ENABLE ROW LEVEL SECURITY;
+
+-- 2. Every claim verified within p_max_age seconds that has one of the
+-- exact hashes or shares an LSH band; the caller picks the closest match.
+CREATE OR REPLACE FUNCTION claim_lookup(
+    p_hashes TEXT[],
+    p_bands TEXT[],
+    p_max_age INTEGER,
+    p_limit INTEGER
+)
+RETURNS SETOF claim_index AS $$
+    SELECT * FROM claim_index
+    WHERE (text_hash = ANY(p_hashes) OR bands && p_bands)
+      AND verified_at > now() - make_interval(secs => p_max_age)
+    ORDER BY text_hash = ANY(p_hashes) DESC, verified_at DESC
+    LIMIT p_limit;
+$$ LANGUAGE sql STABLE SECURITY DEFINER;
+
+-- 3. Upsert a batch of {text_hash, claim, normalized, bands, verdict, ...};
+-- a re-verified claim takes the newer verdict and restarts its age.
+CREATE OR REPLACE FUNCTION claim_record(claims JSONB)
+RETURNS VOID AS $$
+    INSERT INTO claim_index (
+        text_hash, claim, normalized, bands, verdict, confidence,
+        explanation, evidence_for, evidence_against, sources
+    )
+    SELECT e->>'text_hash',
+           e->>'claim',
+           e->>'normalized',
+           ARRAY(SELECT jsonb_array_elements_text(e->'bands')),
+           e->>'verdict',
+           COALESCE((e->>'confidence')::real, 0),
+           COALESCE(e->>'explanation', ''),
+           COALESCE(e->'evidence_for', '[]'::jsonb),
+           COALESCE(e->'evidence_against', '[]'::jsonb),
+           COALESCE(e->'sources', '[]'::jsonb)
+    FROM jsonb_array_elements(claims) AS e
+    ON CONFLICT (text_hash) DO UPDATE
+    SET verdict = EXCLUDED.verdict,
+        confidence = EXCLUDED.confidence,
+        explanation = EXCLUDED.explanation,
+        evidence_for = EXCLUDED.evidence_for,
+        evidence_against = EXCLUDED.evidence_against,
+        sources = EXCLUDED.sources,
+        verified_at = now();
+$$ LANGUAGE sql SECURITY DEFINER;
+
+REVOKE EXECUTE ON FUNCTION claim_record(JSONB) FROM PUBLIC, anon, authenticated;
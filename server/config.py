@@ -5,10 +5,71 @@ from dotenv import load_dotenv
 load_dotenv()
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_API_BASE = os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com")
+GEMINI_UPLOAD_MODE = os.getenv("GEMINI_UPLOAD_MODE", "auto")
+INLINE_MAX_BYTES = int(os.getenv("INLINE_MAX_BYTES", str(256 * 1024)))
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+UPLOAD_HANDLE_TTL = 47 * 3600
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+SOCIAL_CLIENT_CACHE_SIZE = int(os.getenv("SOCIAL_CLIENT_CACHE_SIZE", "1024"))
+SOCIAL_DB_THREADS = int(os.getenv("SOCIAL_DB_THREADS", "16"))
 MAX_VIDEO_DURATION = int(os.getenv("MAX_VIDEO_DURATION", "600"))
 MAX_CONCURRENT_JOBS = int(os.getenv("MAX_CONCURRENT_JOBS", "3"))
-TEMP_DIR = "/tmp/yggdrasil_videos"
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", str(MAX_CONCURRENT_JOBS * 2)))
+GEMINI_MIN_CONCURRENCY = 1
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", str(JOB_WORKERS)))
+GEMINI_LATENCY_TARGET = float(os.getenv("GEMINI_LATENCY_TARGET", "45"))
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "120"))
+GEMINI_MAX_ATTEMPTS = int(os.getenv("GEMINI_MAX_ATTEMPTS", "4"))
+SEGMENT_THRESHOLD = float(os.getenv("SEGMENT_THRESHOLD", "300"))
+SEGMENT_LENGTH = float(os.getenv("SEGMENT_LENGTH", "180"))
+SEGMENT_OVERLAP = float(os.getenv("SEGMENT_OVERLAP", "10"))
+# Off (0) unless media_fingerprints.sql is installed; 30 is a good length.
+FINGERPRINT_SECONDS = float(os.getenv("FINGERPRINT_SECONDS", "0"))
+MAX_DOWNLOAD_BYTES = int(os.getenv("MAX_DOWNLOAD_BYTES", str(50 * 1024 * 1024)))
+TEMP_DIR = os.getenv("TEMP_DIR", "/tmp/yggdrasil_videos")
+TEMP_RAM_DIR = os.getenv("TEMP_RAM_DIR")
+TEMP_DISK_BUDGET = int(os.getenv("TEMP_DISK_BUDGET", str(2 * 1024 * 1024 * 1024)))
+TEMP_DISK_HEADROOM = int(os.getenv("TEMP_DISK_HEADROOM", str(512 * 1024 * 1024)))
+TEMP_DISK_WAIT = float(os.getenv("TEMP_DISK_WAIT", "300"))
 MAX_KEYFRAMES = 30
 KEYFRAME_INTERVAL = 3
+KEYFRAME_WIDTH = 720
+SCENE_THRESHOLD = float(os.getenv("SCENE_THRESHOLD", "0.3"))
+PHASH_DISTANCE = int(os.getenv("PHASH_DISTANCE", "6"))
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", "/tmp/yggdrasil_jobs/jobs.db")
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+JOB_BACKEND = os.getenv("JOB_BACKEND", "sqlite")
+JOB_SLOTS = int(os.getenv("JOB_SLOTS", str(JOB_WORKERS)))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "900"))
+JOB_HEARTBEAT_INTERVAL = JOB_LEASE_SECONDS / 3
+JOB_TTL = float(os.getenv("JOB_TTL", str(24 * 3600)))
+JOB_MAX_FINISHED = int(os.getenv("JOB_MAX_FINISHED", "10000"))
+JOB_PRUNE_INTERVAL = 300
+JOB_SUPERVISE_INTERVAL = 5.0
+PROGRESS_POLL_INTERVAL = float(os.getenv("PROGRESS_POLL_INTERVAL", "0.25"))
+PROGRESS_HEARTBEAT = 15.0
+METRICS_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "/tmp/yggdrasil_metrics")
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_TTL = float(os.getenv("CACHE_TTL", "3600"))
+CACHE_NEGATIVE_TTL = float(os.getenv("CACHE_NEGATIVE_TTL", "15"))
+# Off unless claim_index.sql is installed and SUPABASE_KEY is the service-role key.
+CLAIM_INDEX = os.getenv("CLAIM_INDEX", "0") == "1"
+CLAIM_MATCH_THRESHOLD = float(os.getenv("CLAIM_MATCH_THRESHOLD", "0.8"))
+CLAIM_MIN_CONFIDENCE = float(os.getenv("CLAIM_MIN_CONFIDENCE", "0.7"))
+CLAIM_MAX_AGE = int(os.getenv("CLAIM_MAX_AGE", str(30 * 24 * 3600)))
+CLAIM_CACHE_ENTRIES = int(os.getenv("CLAIM_CACHE_ENTRIES", "4096"))
+CLAIM_CACHE_BYTES = int(os.getenv("CLAIM_CACHE_BYTES", str(16 * 1024 * 1024)))
+PROBE_TTL = float(os.getenv("PROBE_TTL", "300"))
+PROBE_CACHE_ENTRIES = int(os.getenv("PROBE_CACHE_ENTRIES", "256"))
+PROBE_CACHE_BYTES = int(os.getenv("PROBE_CACHE_BYTES", str(16 * 1024 * 1024)))
+PROBE_FAILURE_TTL = float(os.getenv("PROBE_FAILURE_TTL", "30"))
+# Only used when leaderboard_versions.sql is not installed.
+LEADERBOARD_TTL = float(os.getenv("LEADERBOARD_TTL", "5"))
+LEDGER_FLUSH_INTERVAL = float(os.getenv("LEDGER_FLUSH_INTERVAL", "2"))
+LEDGER_BATCH_SIZE = 500
+LEDGER_MAX_ATTEMPTS = 5
+LEDGER_MAX_BACKOFF = 60.0
@@ -0,0 +1,267 @@
+-- ============================================================
+-- Yggdrasil – Shared job state for multi-node deployments
+-- Run this in the Supabase SQL Editor, then set JOB_BACKEND=supabase
+-- and use the service-role key as SUPABASE_KEY.
+-- ============================================================
+
+-- 1. Job records; finished results are stored once per URL hash
+CREATE TABLE IF NOT EXISTS analysis_jobs (
+    id TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    url_hash TEXT,
+    leader_id TEXT,
+    user_id TEXT,
+    probe JSONB,
+    status TEXT NOT NULL,
+    stage TEXT,
+    error TEXT,
+    worker_id TEXT,
+    lease_until TIMESTAMPTZ,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS analysis_job_results (
+    key TEXT PRIMARY KEY,
+    results JSONB NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_analysis_jobs_queued
+    ON analysis_jobs(created_at) WHERE status = 'queued' AND leader_id IS NULL;
+CREATE INDEX IF NOT EXISTS idx_analysis_jobs_processing
+    ON analysis_jobs(lease_until) WHERE status = 'processing' AND leader_id IS NULL;
+CREATE INDEX IF NOT EXISTS idx_analysis_jobs_url_hash
+    ON analysis_jobs(url_hash) WHERE status IN ('queued', 'processing') AND leader_id IS NULL;
+CREATE INDEX IF NOT EXISTS idx_analysis_jobs_leader ON analysis_jobs(leader_id);
+CREATE INDEX IF NOT EXISTS idx_analysis_jobs_finished ON analysis_jobs(status, updated_at);
+CREATE INDEX IF NOT EXISTS idx_analysis_jobs_hash_all ON analysis_jobs(url_hash);
+
+-- Only the server reaches these tables, through the functions below
+ALTER TABLE analysis_jobs ENABLE ROW LEVEL SECURITY;
+ALTER TABLE analysis_job_results ENABLE ROW LEVEL SECURITY;
+
+-- 2. Insert a job, attaching it to an in-flight leader for the same URL hash.
+-- The advisory lock on the hash serializes this with job_finish, so a job
+-- never attaches to a leader that has just finished.
+CREATE OR REPLACE FUNCTION job_create(
+    p_id TEXT,
+    p_url TEXT,
+    p_user_id TEXT,
+    p_url_hash TEXT,
+    p_status TEXT,
+    p_results JSONB,
+    p_probe JSONB
+)
+RETURNS TABLE (status TEXT, leader_id TEXT) AS $$
+#variable_conflict use_column
+DECLARE
+    v_status TEXT := p_status;
+    v_stage TEXT;
+    v_leader TEXT;
+BEGIN
+    IF p_url_hash IS NOT NULL THEN
+        PERFORM pg_advisory_xact_lock(hashtext(p_url_hash));
+    END IF;
+    IF p_url_hash IS NOT NULL AND p_status = 'queued' THEN
+        SELECT j.id, j.status, j.stage INTO v_leader, v_status, v_stage
+        FROM analysis_jobs j
+        WHERE j.url_hash = p_url_hash AND j.leader_id IS NULL
+          AND j.status IN ('queued', 'processing')
+        LIMIT 1
+        FOR UPDATE;
+        IF NOT FOUND THEN
+            v_status := p_status;
+        END IF;
+    END IF;
+    IF p_results IS NOT NULL THEN
+        INSERT INTO analysis_job_results (key, results)
+        VALUES (COALESCE(p_url_hash, p_id), p_results)
+        ON CONFLICT (key) DO NOTHING;
+    END IF;
+    INSERT INTO analysis_jobs (id, url, url_hash, leader_id, user_id, probe, status, stage)
+    VALUES (
+        p_id, p_url, p_url_hash, v_leader, p_user_id,
+        CASE WHEN v_leader IS NULL THEN p_probe END, v_status, v_stage
+    );
+    RETURN QUERY SELECT v_status, v_leader;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+CREATE OR REPLACE FUNCTION job_get(p_id TEXT)
+RETURNS JSONB AS $$
+    SELECT to_jsonb(j) || jsonb_build_object('results', r.results)
+    FROM analysis_jobs j
+    LEFT JOIN analysis_job_results r ON r.key = COALESCE(j.url_hash, j.id)
+    WHERE j.id = p_id;
+$$ LANGUAGE sql STABLE SECURITY DEFINER;
+
+-- Leader a job for p_url_hash would attach to, checked before probing a URL
+CREATE OR REPLACE FUNCTION job_leader(p_url_hash TEXT)
+RETURNS TEXT AS $$
+    SELECT j.id FROM analysis_jobs j
+    WHERE j.url_hash = p_url_hash AND j.leader_id IS NULL
+      AND j.status IN ('queued', 'processing')
+    LIMIT 1;
+$$ LANGUAGE sql STABLE SECURITY DEFINER;
+
+-- Stored results for a URL hash, checked before trusting a cached miss
+CREATE OR REPLACE FUNCTION job_results(p_key TEXT)
+RETURNS JSONB AS $$
+    SELECT r.results FROM analysis_job_results r WHERE r.key = p_key;
+$$ LANGUAGE sql STABLE SECURITY DEFINER;
+
+-- 3. Stage changes also renew the leader's lease
+CREATE OR REPLACE FUNCTION job_set_stage(p_id TEXT, p_stage TEXT, p_lease_seconds INTEGER)
+RETURNS VOID AS $$
+    UPDATE analysis_jobs
+    SET stage = p_stage,
+        updated_at = now(),
+        lease_until = CASE
+            WHEN id = p_id THEN now() + make_interval(secs => p_lease_seconds)
+            ELSE lease_until
+        END
+    WHERE id = p_id OR leader_id = p_id;
+$$ LANGUAGE sql SECURITY DEFINER;
+
+-- Heartbeat from the worker holding the job, so one long stage cannot
+-- outlive the lease; returns false once the lease has passed to another worker
+CREATE OR REPLACE FUNCTION job_renew(p_id TEXT, p_worker TEXT, p_lease_seconds INTEGER)
+RETURNS BOOLEAN AS $$
+    WITH renewed AS (
+        UPDATE analysis_jobs
+        SET lease_until = now() + make_interval(secs => p_lease_seconds)
+        WHERE id = p_id AND status = 'processing' AND worker_id = p_worker
+        RETURNING id
+    )
+    SELECT EXISTS (SELECT 1 FROM renewed);
+$$ LANGUAGE sql SECURITY DEFINER;
+
+CREATE OR REPLACE FUNCTION job_snapshots(p_ids TEXT[])
+RETURNS TABLE (id TEXT, status TEXT, stage TEXT) AS $$
+    SELECT j.id, j.status, j.stage FROM analysis_jobs j WHERE j.id = ANY(p_ids);
+$$ LANGUAGE sql STABLE SECURITY DEFINER;
+
+CREATE OR REPLACE FUNCTION job_finish(p_id TEXT, p_status TEXT, p_results JSONB, p_error TEXT)
+RETURNS VOID AS $$
+DECLARE
+    v_hash TEXT;
+BEGIN
+    SELECT url_hash INTO v_hash FROM analysis_jobs WHERE id = p_id;
+    IF NOT FOUND THEN
+        RETURN;
+    END IF;
+    IF v_hash IS NOT NULL THEN
+        PERFORM pg_advisory_xact_lock(hashtext(v_hash));
+    END IF;
+    IF p_results IS NOT NULL THEN
+        INSERT INTO analysis_job_results (key, results)
+        VALUES (COALESCE(v_hash, p_id), p_results)
+        ON CONFLICT (key) DO UPDATE SET results = EXCLUDED.results, updated_at = now();
+    END IF;
+    UPDATE analysis_jobs
+    SET status = p_status, error = p_error, probe = NULL, worker_id = NULL,
+        lease_until = NULL, updated_at = now()
+    WHERE id = p_id OR leader_id = p_id;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+CREATE OR REPLACE FUNCTION job_followers(p_id TEXT)
+RETURNS TABLE (user_id TEXT) AS $$
+    SELECT DISTINCT j.user_id FROM analysis_jobs j
+    WHERE j.leader_id = p_id AND j.user_id IS NOT NULL;
+$$ LANGUAGE sql STABLE SECURITY DEFINER;
+
+-- 4. Global admission: requeue expired leases, then claim the oldest queued
+-- job only while fewer than p_slots leaders are processing on any node.
+CREATE OR REPLACE FUNCTION job_claim(p_worker TEXT, p_slots INTEGER, p_lease_seconds INTEGER)
+RETURNS JSONB AS $$
+DECLARE
+    v_id TEXT;
+    v_active INTEGER;
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('analysis_jobs_claim'));
+
+    WITH expired AS (
+        SELECT id FROM analysis_jobs
+        WHERE status = 'processing' AND leader_id IS NULL AND lease_until < now()
+    )
+    UPDATE analysis_jobs
+    SET status = 'queued', stage = NULL, worker_id = NULL, lease_until = NULL, updated_at = now()
+    WHERE id IN (SELECT id FROM expired) OR leader_id IN (SELECT id FROM expired);
+
+    SELECT count(*) INTO v_active FROM analysis_jobs
+    WHERE status = 'processing' AND leader_id IS NULL;
+    IF v_active >= p_slots THEN
+        RETURN NULL;
+    END IF;
+
+    SELECT id INTO v_id FROM analysis_jobs
+    WHERE status = 'queued' AND leader_id IS NULL
+    ORDER BY created_at
+    LIMIT 1
+    FOR UPDATE SKIP LOCKED;
+    IF v_id IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    UPDATE analysis_jobs
+    SET status = 'processing', worker_id = p_worker,
+        lease_until = now() + make_interval(secs => p_lease_seconds), updated_at = now()
+    WHERE id = v_id OR leader_id = v_id;
+    RETURN job_get(v_id);
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+CREATE OR REPLACE FUNCTION job_counts()
+RETURNS TABLE (status TEXT, value INTEGER) AS $$
+    SELECT j.status, count(*)::int FROM analysis_jobs j
+    WHERE j.leader_id IS NULL AND j.status IN ('queued', 'processing')
+    GROUP BY j.status;
+$$ LANGUAGE sql STABLE SECURITY DEFINER;
+
+-- 5. Evict finished jobs by age and count, then results nothing refers to
+CREATE OR REPLACE FUNCTION job_prune(p_ttl_seconds INTEGER, p_max_finished INTEGER)
+RETURNS INTEGER AS $$
+DECLARE
+    v_removed INTEGER;
+    v_overflow INTEGER;
+BEGIN
+    DELETE FROM analysis_jobs
+    WHERE status IN ('complete', 'failed')
+      AND updated_at < now() - make_interval(secs => p_ttl_seconds);
+    GET DIAGNOSTICS v_removed = ROW_COUNT;
+
+    DELETE FROM analysis_jobs WHERE id IN (
+        SELECT id FROM analysis_jobs
+        WHERE status IN ('complete', 'failed')
+        ORDER BY updated_at DESC
+        OFFSET p_max_finished
+    );
+    GET DIAGNOSTICS v_overflow = ROW_COUNT;
+    v_removed := v_removed + v_overflow;
+
+    IF v_removed > 0 THEN
+        DELETE FROM analysis_job_results r
+        WHERE NOT EXISTS (SELECT 1 FROM analysis_jobs j WHERE j.url_hash = r.key)
+          AND NOT EXISTS (SELECT 1 FROM analysis_jobs j WHERE j.id = r.key);
+    END IF;
+    RETURN v_removed;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- 6. Keep the functions away from anon/authenticated API callers
+REVOKE EXECUTE ON FUNCTION
+    job_create(TEXT, TEXT, TEXT, TEXT, TEXT, JSONB, JSONB),
+    job_get(TEXT),
+    job_leader(TEXT),
+    job_results(TEXT),
+    job_set_stage(TEXT, TEXT, INTEGER),
+    job_renew(TEXT, TEXT, INTEGER),
+    job_snapshots(TEXT[]),
+    job_finish(TEXT, TEXT, JSONB, TEXT),
+    job_followers(TEXT),
+    job_claim(TEXT, INTEGER, INTEGER),
+    job_counts(),
+    job_prune(INTEGER, INTEGER)
+FROM PUBLIC, anon, authenticated;
@@ -0,0 +1,69 @@
+-- ============================================================
+-- Yggdrasil – Change counters behind the cached friend leaderboards
+-- Run this in the Supabase SQL Editor after social_tables.sql.
+-- Without it the API trusts a cached leaderboard for LEADERBOARD_TTL.
+-- ============================================================
+
+-- 1. One counter per user, bumped by every change to what their row shows
+CREATE TABLE IF NOT EXISTS leaderboard_versions (
+    user_id UUID PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0
+);
+
+ALTER TABLE leaderboard_versions ENABLE ROW LEVEL SECURITY;
+
+CREATE OR REPLACE FUNCTION public.bump_leaderboard_version(p_user UUID)
+RETURNS VOID AS $$
+    INSERT INTO public.leaderboard_versions AS v (user_id, version)
+    VALUES (p_user, 1)
+    ON CONFLICT (user_id) DO UPDATE SET version = v.version + 1;
+$$ LANGUAGE sql SECURITY DEFINER;
+
+-- 2. Score and profile writes (from the API or straight from the client)
+-- and friendship changes all bump the users involved
+CREATE OR REPLACE FUNCTION public.leaderboard_changed()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'friendships' THEN
+        PERFORM public.bump_leaderboard_version(COALESCE(NEW.user_id, OLD.user_id));
+        PERFORM public.bump_leaderboard_version(COALESCE(NEW.friend_id, OLD.friend_id));
+    ELSIF TG_TABLE_NAME = 'profiles' THEN
+        PERFORM public.bump_leaderboard_version(COALESCE(NEW.id, OLD.id));
+    ELSE
+        PERFORM public.bump_leaderboard_version(COALESCE(NEW.user_id, OLD.user_id));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+DROP TRIGGER IF EXISTS on_score_changed ON user_scores;
+CREATE TRIGGER on_score_changed
+    AFTER INSERT OR UPDATE OR DELETE ON user_scores
+    FOR EACH ROW EXECUTE FUNCTION public.leaderboard_changed();
+
+DROP TRIGGER IF EXISTS on_profile_changed ON profiles;
+CREATE TRIGGER on_profile_changed
+    AFTER UPDATE OF display_name, avatar_url ON profiles
+    FOR EACH ROW EXECUTE FUNCTION public.leaderboard_changed();
+
+DROP TRIGGER IF EXISTS on_friendship_changed ON friendships;
+CREATE TRIGGER on_friendship_changed
+    AFTER INSERT OR UPDATE OF status OR DELETE ON friendships
+    FOR EACH ROW EXECUTE FUNCTION public.leaderboard_changed();
+
+-- 3. Fingerprint of the caller's leaderboard: it changes whenever the
+-- caller, any accepted friend or the set of friends changes
+CREATE OR REPLACE FUNCTION leaderboard_version()
+RETURNS TEXT AS $$
+    SELECT md5(COALESCE(string_agg(v.user_id::text || ':' || v.version, ',' ORDER BY v.user_id), ''))
+    FROM leaderboard_versions v
+    WHERE v.user_id = auth.uid() OR v.user_id IN (
+        SELECT CASE WHEN f.user_id = auth.uid() THEN f.friend_id ELSE f.user_id END
+        FROM friendships f
+        WHERE f.status = 'accepted'
+          AND (f.user_id = auth.uid() OR f.friend_id = auth.uid())
+    );
+$$ LANGUAGE sql STABLE SECURITY DEFINER;
+
+REVOKE EXECUTE ON FUNCTION public.bump_leaderboard_version(UUID)
+FROM PUBLIC, anon, authenticated;
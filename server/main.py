@@ -5,9 +5,12 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from config import TEMP_DIR
-from routes import analyze, health, social
+from routes import analyze, health, metrics, social
+from services import cache, disk, jobs
+from services import metrics as metrics_store
 
 logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Mind Bloom Truth Seeker API")
 
@@ -21,12 +24,26 @@ app.add_middleware(
 
 app.include_router(analyze.router)
 app.include_router(health.router)
+app.include_router(metrics.router)
 app.include_router(social.router)
 
 
 @app.on_event("startup")
 def startup():
     os.makedirs(TEMP_DIR, exist_ok=True)
+    try:
+        disk.sweep()
+    except Exception as e:
+        logger.warning("Temp directory sweep failed: %s", e)
+    metrics_store.reset()
+    jobs.start_workers(analyze.process_video)
+    cache.start_score_flusher()
+
+
+@app.on_event("shutdown")
+def shutdown():
+    jobs.stop_workers()
+    cache.stop_score_flusher()
 
 
 @app.get("/")
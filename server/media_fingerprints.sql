@@ -0,0 +1,55 @@
+-- ============================================================
+-- Yggdrasil – Content fingerprints for reposted media
+-- Run this in the Supabase SQL Editor after setup_supabase.sql,
+-- then set FINGERPRINT_SECONDS (30 works well).
+-- fingerprint_record is limited to the service-role key; with any
+-- other SUPABASE_KEY fingerprints are only matched, never added.
+-- ============================================================
+
+-- 1. One fingerprint per analyzed video (see services/fingerprints.py):
+-- loudness-step bits of the first seconds of audio, hex dHashes of frames
+-- sampled once a second, and 8-bit slices of the audio bits as LSH bands.
+CREATE TABLE IF NOT EXISTS media_fingerprints (
+    analysis_id UUID PRIMARY KEY REFERENCES video_analyses(id) ON DELETE CASCADE,
+    duration REAL,
+    audio TEXT NOT NULL,
+    frames TEXT[] NOT NULL,
+    bands TEXT[] NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_media_fingerprints_bands
+    ON media_fingerprints USING GIN (bands);
+
+ALTER TABLE media_fingerprints ENABLE ROW LEVEL SECURITY;
+
+-- 2. Fingerprints sharing any band, closest first: bands are fixed slices
+-- of the audio bits, so more shared bands means fewer differing bits. Ties
+-- go to the newest. The caller compares audio and frames.
+CREATE OR REPLACE FUNCTION fingerprint_lookup(p_bands TEXT[], p_limit INTEGER)
+RETURNS SETOF media_fingerprints AS $$
+    SELECT * FROM media_fingerprints
+    WHERE bands && p_bands
+    ORDER BY (SELECT count(*) FROM unnest(bands) AS b WHERE b = ANY(p_bands)) DESC,
+             created_at DESC
+    LIMIT p_limit;
+$$ LANGUAGE sql STABLE SECURITY DEFINER;
+
+CREATE OR REPLACE FUNCTION fingerprint_record(fingerprint JSONB)
+RETURNS VOID AS $$
+    INSERT INTO media_fingerprints (analysis_id, duration, audio, frames, bands)
+    VALUES (
+        (fingerprint->>'analysis_id')::uuid,
+        (fingerprint->>'duration')::real,
+        fingerprint->>'audio',
+        ARRAY(SELECT jsonb_array_elements_text(fingerprint->'frames')),
+        ARRAY(SELECT jsonb_array_elements_text(fingerprint->'bands'))
+    )
+    ON CONFLICT (analysis_id) DO UPDATE
+    SET duration = EXCLUDED.duration,
+        audio = EXCLUDED.audio,
+        frames = EXCLUDED.frames,
+        bands = EXCLUDED.bands;
+$$ LANGUAGE sql SECURITY DEFINER;
+
+REVOKE EXECUTE ON FUNCTION fingerprint_record(JSONB) FROM PUBLIC, anon, authenticated;
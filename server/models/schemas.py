@@ -1,20 +1,38 @@
 from enum import Enum
 from typing import Optional
+from uuid import UUID
 
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
 
 
 class AnalyzeRequest(BaseModel):
     url: str
     user_id: Optional[str] = None
 
+    @field_validator("user_id")
+    @classmethod
+    def _user_id_is_uuid(cls, value: Optional[str]) -> Optional[str]:
+        # Scores are keyed by Supabase auth user ids; anything else would be
+        # rejected when the score ledger is applied.
+        if value is None:
+            return value
+        return str(UUID(value))
+
 
 class JobStatus(str, Enum):
+    QUEUED = "queued"
     PROCESSING = "processing"
     COMPLETE = "complete"
     FAILED = "failed"
 
 
+class JobStage(str, Enum):
+    DOWNLOADING = "downloading"
+    EXTRACTING = "extracting"
+    ANALYZING = "analyzing"
+    STORING = "storing"
+
+
 class Claim(BaseModel):
     claim: str = ""
     type: str = "spoken"
@@ -64,5 +82,6 @@ class JobResponse(BaseModel):
 class StatusResponse(BaseModel):
     job_id: str
     status: JobStatus
+    stage: Optional[JobStage] = None
     results: Optional[AnalysisResult] = None
     error: Optional[str] = None
@@ -1,101 +1,196 @@
+import asyncio
+import json
 import logging
 import uuid
 
-from fastapi import APIRouter, BackgroundTasks, HTTPException
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 
-from config import MAX_CONCURRENT_JOBS
 from models.schemas import (
     AnalyzeRequest,
     AnalysisResult,
     JobResponse,
+    JobStage,
     JobStatus,
     StatusResponse,
 )
-from services import analyzer, cache, downloader
+from services import analyzer, cache, disk, downloader, jobs, metrics, progress, urls
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api")
 
-jobs: dict[str, dict] = {}
+
+def _probe(url: str) -> dict | None:
+    try:
+        return downloader.probe(url)
+    except Exception as e:
+        logger.warning("Probe failed for %s: %s", url, e)
+        return None
 
 
 @router.post("/analyze")
-def analyze_video(
-    request: AnalyzeRequest, background_tasks: BackgroundTasks
-) -> JobResponse:
+def analyze_video(request: AnalyzeRequest) -> JobResponse:
     url = request.url
 
-    cached = cache.get_cached(url)
+    # The URL alone identifies most videos; other links need the probe's
+    # extractor id for their key. Either way a URL is probed at most once here.
+    info = None
+    probed = urls.canonicalize(url) is None
+    if probed:
+        info = _probe(url)
+    url_hash = cache.url_hash(url, info)
+
+    cached = cache.get_cached(url, info)
     if cached:
         job_id = uuid.uuid4().hex
-        jobs[job_id] = {
-            "status": JobStatus.COMPLETE,
-            "results": cached,
-            "error": None,
-        }
+        jobs.create_job(
+            job_id,
+            url,
+            request.user_id,
+            url_hash=url_hash,
+            status=JobStatus.COMPLETE,
+            results=cached,
+        )
         return JobResponse(job_id=job_id, status=JobStatus.COMPLETE)
 
-    active = sum(1 for j in jobs.values() if j["status"] == JobStatus.PROCESSING)
-    if active >= MAX_CONCURRENT_JOBS:
-        raise HTTPException(
-            status_code=429, detail="Too many concurrent jobs. Try again shortly."
-        )
+    # A job already queued or running for this video passed its limits check
+    # and will carry this one as a follower, so there is nothing to probe.
+    if not jobs.in_flight(url_hash):
+        if not probed:
+            info = _probe(url)
+        if info is not None:
+            try:
+                downloader.check_limits(info)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
 
     job_id = uuid.uuid4().hex
-    jobs[job_id] = {"status": JobStatus.PROCESSING, "results": None, "error": None}
-
-    background_tasks.add_task(process_video, job_id, url, request.user_id)
-
-    return JobResponse(job_id=job_id, status=JobStatus.PROCESSING)
+    status = jobs.create_job(
+        job_id,
+        url,
+        request.user_id,
+        url_hash=url_hash,
+        probe=info,
+    )
 
+    return JobResponse(job_id=job_id, status=status)
 
-@router.get("/status/{job_id}")
-def get_status(job_id: str) -> StatusResponse:
-    job = jobs.get(job_id)
-    if not job:
-        raise HTTPException(status_code=404, detail="Job not found")
 
+def _status_response(job: dict) -> StatusResponse:
     results = None
     if job["results"]:
-        if isinstance(job["results"], AnalysisResult):
-            results = job["results"]
-        else:
-            results = AnalysisResult(**job["results"])
+        results = AnalysisResult(**job["results"])
+        if job["url_hash"]:
+            cache.remember(job["url_hash"], job["results"])
 
     return StatusResponse(
-        job_id=job_id,
+        job_id=job["id"],
         status=job["status"],
+        stage=job["stage"],
         results=results,
         error=job.get("error"),
     )
 
 
-def process_video(job_id: str, url: str, user_id: str | None) -> None:
-    try:
-        media = downloader.download_and_extract(job_id, url)
+@router.get("/status/{job_id}")
+def get_status(job_id: str) -> StatusResponse:
+    job = jobs.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _status_response(job)
 
-        result = analyzer.analyze(
-            media["audio_path"],
-            media["keyframe_paths"],
-        )
 
-        result.platform = media["platform"]
-        result.duration_seconds = int(media["duration"]) if media["duration"] else None
-        if not result.title or result.title == "Unknown":
-            result.title = media["title"]
+def _sse(event: str, data: str) -> str:
+    return f"event: {event}\ndata: {data}\n\n"
 
-        analysis_id = cache.store_result(url, result)
 
-        if user_id and analysis_id:
-            cache.record_user_analysis(user_id, analysis_id, result.points_awarded)
+def _progress_event(job_id: str, snapshot: dict) -> str:
+    stage = snapshot["stage"]
+    return _sse("progress", json.dumps({
+        "job_id": job_id,
+        "status": snapshot["status"].value,
+        "stage": stage.value if stage else None,
+    }))
 
-        jobs[job_id]["status"] = JobStatus.COMPLETE
-        jobs[job_id]["results"] = result
 
+async def _events(job: dict):
+    job_id = job["id"]
+    yield _progress_event(job_id, job)
+    if job["status"] not in progress.TERMINAL:
+        async for snapshot in progress.watch(job_id, job["status"], job["stage"]):
+            if snapshot is None:
+                yield ": keepalive\n\n"
+                continue
+            yield _progress_event(job_id, snapshot)
+        job = await asyncio.to_thread(jobs.get_job, job_id)
+    yield _sse("result", _status_response(job).model_dump_json())
+
+
+@router.get("/status/{job_id}/events")
+async def stream_status(job_id: str) -> StreamingResponse:
+    """Server-sent events: ``progress`` on every stage change, then one ``result``."""
+    job = await asyncio.to_thread(jobs.get_job, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return StreamingResponse(
+        _events(job),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def process_video(
+    job_id: str, url: str, user_id: str | None, info: dict | None = None
+) -> None:
+    try:
+        disk.reserve(job_id, downloader.disk_estimate(info))
+        with metrics.timed("job"):
+            _run_job(job_id, url, user_id, info)
+        metrics.jobs_finished.labels(JobStatus.COMPLETE.value).inc()
     except Exception as e:
         logger.exception("Job %s failed", job_id)
-        jobs[job_id]["status"] = JobStatus.FAILED
-        jobs[job_id]["error"] = str(e)
+        jobs.fail_job(job_id, str(e))
+        metrics.jobs_finished.labels(JobStatus.FAILED.value).inc()
     finally:
         downloader.cleanup(job_id)
+        disk.release(job_id)
+
+
+def _run_job(job_id: str, url: str, user_id: str | None, info: dict | None) -> None:
+    def advance(stage: JobStage) -> None:
+        jobs.set_stage(job_id, stage)
+
+    advance(JobStage.DOWNLOADING)
+    media = downloader.download_and_extract(
+        job_id, url, info, advance, cache.find_reupload
+    )
+
+    if media["reused"]:
+        result = AnalysisResult(**media["reused"])
+    else:
+        advance(JobStage.ANALYZING)
+        result = analyzer.analyze(
+            media["audio_path"],
+            media["keyframe_paths"],
+            media["segments"],
+        )
+
+    result.platform = media["platform"]
+    result.duration_seconds = int(media["duration"]) if media["duration"] else None
+    if not result.title or result.title == "Unknown":
+        result.title = media["title"]
+
+    advance(JobStage.STORING)
+    analysis_id = cache.store_result(url, result, media)
+    if analysis_id and media["fingerprint"] and not media["reused"]:
+        cache.store_fingerprint(analysis_id, media["fingerprint"])
+
+    jobs.complete_job(job_id, result.model_dump())
+
+    if analysis_id:
+        user_ids = jobs.follower_user_ids(job_id)
+        if user_id:
+            user_ids.insert(0, user_id)
+        for uid in dict.fromkeys(user_ids):
+            cache.record_user_analysis(uid, analysis_id, result.points_awarded)
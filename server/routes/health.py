@@ -1,8 +1,10 @@
 from fastapi import APIRouter
 
+from services import cache
+
 router = APIRouter(prefix="/api")
 
 
 @router.get("/health")
-def health():
-    return {"status": "ok", "version": "1.0.0"}
+async def health():
+    return {"status": "ok", "version": "1.0.0", "cache": cache.stats()}
@@ -0,0 +1,40 @@
+from fastapi import APIRouter, Response
+from prometheus_client.core import GaugeMetricFamily
+
+from services import cache, disk, jobs, limiter, metrics
+
+router = APIRouter(prefix="/api")
+
+
+class _LiveGauges:
+    """Values read from shared state at scrape time rather than recorded by workers."""
+
+    def collect(self):
+        gauges = {
+            "yggdrasil_queue_depth": ("Jobs waiting for a worker.", jobs.queue_depth()),
+            "yggdrasil_active_jobs": ("Jobs being processed.", jobs.active_count()),
+            "yggdrasil_job_workers": ("Live job worker processes.", jobs.worker_count()),
+        }
+        gemini = limiter.gemini.stats()
+        gauges["yggdrasil_gemini_concurrency_limit"] = (
+            "Current adaptive Gemini concurrency limit.", gemini["limit"]
+        )
+        gauges["yggdrasil_gemini_in_flight"] = ("Gemini calls in flight.", gemini["in_flight"])
+        memory = cache.stats()
+        gauges["yggdrasil_cache_hit_ratio"] = (
+            "Hit ratio of the API process's in-memory result cache.", memory["hit_ratio"]
+        )
+        gauges["yggdrasil_cache_entries"] = ("Entries in the in-memory result cache.", memory["entries"])
+        gauges["yggdrasil_cache_bytes"] = ("Approximate size of the in-memory result cache.", memory["bytes"])
+        gauges["yggdrasil_temp_reserved_bytes"] = (
+            "Temporary disk reserved by running jobs on this node.", disk.reserved_bytes()
+        )
+        gauges["yggdrasil_temp_free_bytes"] = ("Free space on the TEMP_DIR filesystem.", disk.free_bytes())
+        for name, (documentation, value) in gauges.items():
+            yield GaugeMetricFamily(name, documentation, value=value)
+
+
+@router.get("/metrics")
+def get_metrics() -> Response:
+    body, content_type = metrics.render(_LiveGauges())
+    return Response(content=body, media_type=content_type)
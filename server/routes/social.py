@@ -1,23 +1,129 @@
+import asyncio
+import functools
+import hashlib
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from typing import Optional
 
-from fastapi import APIRouter, HTTPException, Header
+import httpx
+import jwt
+from fastapi import APIRouter, HTTPException, Header, Request
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel
-from supabase import create_client
-
-from config import SUPABASE_URL, SUPABASE_KEY
+from supabase import ClientOptions, create_client
+
+from config import (
+    SOCIAL_CLIENT_CACHE_SIZE,
+    SOCIAL_DB_THREADS,
+    SUPABASE_JWT_SECRET,
+    SUPABASE_KEY,
+    SUPABASE_URL,
+)
+from services import leaderboards
+from services.lru import MISSING, TTLCache
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api", tags=["social"])
 
+# One connection pool shared by every per-user client.
+_http = httpx.Client(
+    timeout=httpx.Timeout(30.0, connect=10.0),
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+)
+
+# The supabase client is synchronous; its calls run here so a slow PostgREST
+# request never blocks the event loop or starves the default thread pool
+# that sync endpoints such as /api/health and /api/status run on.
+_db_pool = ThreadPoolExecutor(max_workers=SOCIAL_DB_THREADS, thread_name_prefix="supabase")
+
+# token -> (client, uid), each entry expiring with its JWT.
+_clients = TTLCache(SOCIAL_CLIENT_CACHE_SIZE, SOCIAL_CLIENT_CACHE_SIZE, ttl=3600)
+
+# Set once leaderboard_version has failed, so a missing function warns once.
+_version_warned = False
+
+
+async def _offload(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_pool, functools.partial(fn, *args, **kwargs))
+
+
+async def _execute(query):
+    return await _offload(query.execute)
+
+
+def _identify(token: str, client) -> tuple[str, float]:
+    """Return the caller's uid and token expiry.
+
+    With SUPABASE_JWT_SECRET set the token is verified locally; otherwise
+    Supabase is asked once and the answer is cached until the token expires.
+    """
+    try:
+        if SUPABASE_JWT_SECRET:
+            claims = jwt.decode(
+                token, SUPABASE_JWT_SECRET, algorithms=["HS256"], audience="authenticated"
+            )
+            return claims["sub"], claims["exp"]
+        claims = jwt.decode(token, options={"verify_signature": False})
+    except jwt.InvalidTokenError:
+        raise HTTPException(401, "Invalid token")
+    try:
+        user = client.auth.get_user(token)
+    except Exception:
+        raise HTTPException(401, "Invalid token")
+    return user.user.id, claims.get("exp", time.time() + 60)
+
+
+def _new_client(token: str):
+    client = create_client(
+        SUPABASE_URL,
+        SUPABASE_KEY,
+        options=ClientOptions(
+            httpx_client=_http,
+            auto_refresh_token=False,
+            persist_session=False,
+        ),
+    )
+    client.postgrest.auth(token)
+    uid, exp = _identify(token, client)
+    ttl = exp - time.time()
+    if ttl <= 0:
+        raise HTTPException(401, "Token expired")
+    _clients.put(token, (client, uid), ttl=ttl, size=1)
+    return client, uid
 
-def _get_client(authorization: str):
-    """Create a Supabase client authenticated with the user's JWT."""
+
+async def _get_client(authorization: str):
+    """Return a cached Supabase client authenticated with the user's JWT, and the uid."""
     token = authorization.replace("Bearer ", "")
-    client = create_client(SUPABASE_URL, SUPABASE_KEY)
-    client.auth.set_session(token, token)
-    client.postgrest.auth(token)
-    return client, token
+    cached = _clients.get(token)
+    if cached is not MISSING:
+        return cached
+    return await _offload(_new_client, token)
+
+
+async def _load_users(
+    client, ids: list[str], profiles: dict[str, dict] | None = None
+) -> tuple[dict[str, dict], dict[str, dict]]:
+    """Fetch profiles and scores for many users: one ``in_`` query per table, run concurrently.
+
+    ``profiles`` seeds rows already embedded in an earlier select so they are
+    not fetched again.
+    """
+    profiles = dict(profiles or {})
+    if not ids:
+        return profiles, {}
+    queries = [client.table("user_scores").select("*").in_("user_id", ids)]
+    missing = [i for i in ids if i not in profiles]
+    if missing:
+        queries.append(client.table("profiles").select("*").in_("id", missing))
+    results = await asyncio.gather(*(_execute(q) for q in queries))
+    scores = {row["user_id"]: row for row in results[0].data}
+    if missing:
+        profiles.update({row["id"]: row for row in results[1].data})
+    return profiles, scores
 
 
 class FriendRequest(BaseModel):
@@ -40,29 +146,25 @@ async def send_friend_request(
     body: FriendRequest,
     authorization: str = Header(...),
 ):
-    client, _ = _get_client(authorization)
-    user = client.auth.get_user()
-    uid = user.user.id
+    client, uid = await _get_client(authorization)
 
     if uid == body.friend_id:
         raise HTTPException(400, "Cannot friend yourself")
 
-    existing = (
+    existing = await _execute(
         client.table("friendships")
         .select("*")
         .or_(
             f"and(user_id.eq.{uid},friend_id.eq.{body.friend_id}),"
             f"and(user_id.eq.{body.friend_id},friend_id.eq.{uid})"
         )
-        .execute()
     )
     if existing.data:
         raise HTTPException(400, "Friendship already exists")
 
-    result = (
+    result = await _execute(
         client.table("friendships")
         .insert({"user_id": uid, "friend_id": body.friend_id, "status": "pending"})
-        .execute()
     )
     return {"ok": True, "friendship": result.data[0]}
 
@@ -72,79 +174,108 @@ async def respond_to_request(
     body: FriendResponse,
     authorization: str = Header(...),
 ):
-    client, _ = _get_client(authorization)
+    client, _ = await _get_client(authorization)
     new_status = "accepted" if body.accept else "declined"
-    result = (
+    result = await _execute(
         client.table("friendships")
         .update({"status": new_status})
         .eq("id", body.friendship_id)
-        .execute()
     )
     if not result.data:
         raise HTTPException(404, "Friendship not found or not authorized")
-    return {"ok": True, "friendship": result.data[0]}
+    friendship = result.data[0]
+    await _offload(
+        leaderboards.set_friendship,
+        friendship["user_id"],
+        friendship["friend_id"],
+        body.accept,
+    )
+    return {"ok": True, "friendship": friendship}
 
 
 @router.get("/friends")
 async def list_friends(authorization: str = Header(...)):
-    client, _ = _get_client(authorization)
-    user = client.auth.get_user()
-    uid = user.user.id
+    client, uid = await _get_client(authorization)
 
-    rows = (
+    rows = await _execute(
         client.table("friendships")
-        .select("*, profiles!friendships_friend_id_fkey(*), user_scores!inner(*)")
+        .select("*, profiles!friendships_friend_id_fkey(*)")
         .or_(f"user_id.eq.{uid},friend_id.eq.{uid}")
         .eq("status", "accepted")
-        .execute()
     )
 
-    friends = []
+    others = []
+    embedded = {}
     for row in rows.data:
         other_id = row["friend_id"] if row["user_id"] == uid else row["user_id"]
-        profile = (
-            client.table("profiles").select("*").eq("id", other_id).single().execute()
-        )
-        score = (
-            client.table("user_scores").select("*").eq("user_id", other_id).single().execute()
-        )
-        friends.append({
+        others.append((other_id, row["id"]))
+        # The embed follows friend_id, so it is the other user's profile only
+        # when the caller sent the request.
+        if other_id == row["friend_id"] and row.get("profiles"):
+            embedded[other_id] = row["profiles"]
+
+    profiles, scores = await _load_users(
+        client, list(dict.fromkeys(o for o, _ in others)), embedded
+    )
+
+    friends = [
+        {
             "id": other_id,
-            "profile": profile.data,
-            "score": score.data,
-            "friendship_id": row["id"],
-        })
+            "profile": profiles.get(other_id),
+            "score": scores.get(other_id),
+            "friendship_id": friendship_id,
+        }
+        for other_id, friendship_id in others
+    ]
     return {"friends": friends}
 
 
 @router.get("/friends/pending")
 async def list_pending(authorization: str = Header(...)):
-    client, _ = _get_client(authorization)
-    user = client.auth.get_user()
-    uid = user.user.id
+    client, uid = await _get_client(authorization)
 
-    incoming = (
+    incoming = await _execute(
         client.table("friendships")
         .select("*, profiles!friendships_user_id_fkey(*)")
         .eq("friend_id", uid)
         .eq("status", "pending")
-        .execute()
     )
     return {"pending": incoming.data}
 
 
-@router.get("/leaderboard")
-async def leaderboard(authorization: str = Header(...)):
-    client, _ = _get_client(authorization)
-    user = client.auth.get_user()
-    uid = user.user.id
+async def _leaderboard_version(client) -> str | None:
+    """Fingerprint of the caller's friends and their scores, or None if unavailable."""
+    global _version_warned
+    try:
+        return (await _execute(client.rpc("leaderboard_version", {}))).data
+    except Exception as e:
+        log = logger.debug if _version_warned else logger.warning
+        log("leaderboard_version unavailable, using LEADERBOARD_TTL: %s", e)
+        _version_warned = True
+        return None
 
-    friendships = (
+
+@router.get("/leaderboard")
+async def leaderboard(request: Request, authorization: str = Header(...)):
+    client, uid = await _get_client(authorization)
+
+    # Read before anything is loaded: scores are also written straight from
+    # the client and by other nodes, which no local bump would see.
+    source = await _leaderboard_version(client)
+    tag = await _offload(leaderboards.etag, uid, source)
+    if tag and request.headers.get("if-none-match") == tag:
+        return Response(status_code=304, headers={"ETag": tag})
+
+    cached = await _offload(leaderboards.read, uid, source)
+    if cached:
+        entries, tag = cached
+        return JSONResponse({"leaderboard": entries}, headers={"ETag": tag})
+
+    friendships = await _execute(
         client.table("friendships")
         .select("user_id, friend_id")
         .or_(f"user_id.eq.{uid},friend_id.eq.{uid}")
         .eq("status", "accepted")
-        .execute()
     )
 
     friend_ids = set()
@@ -152,81 +283,87 @@ async def leaderboard(authorization: str = Header(...)):
         friend_ids.add(f["friend_id"] if f["user_id"] == uid else f["user_id"])
     friend_ids.add(uid)
 
+    profiles, scores = await _load_users(client, list(friend_ids))
+
     entries = []
     for fid in friend_ids:
-        score = client.table("user_scores").select("*").eq("user_id", fid).single().execute()
-        profile = client.table("profiles").select("*").eq("id", fid).single().execute()
-        if score.data and profile.data:
+        score = scores.get(fid)
+        profile = profiles.get(fid)
+        if score and profile:
             entries.append({
                 "user_id": fid,
-                "display_name": profile.data.get("display_name", "Anon"),
-                "avatar_url": profile.data.get("avatar_url"),
-                "current_score": score.data.get("current_score", 0),
-                "tree_state": score.data.get("tree_state", "seedling"),
-                "streak_days": score.data.get("streak_days", 0),
+                "display_name": profile.get("display_name", "Anon"),
+                "avatar_url": profile.get("avatar_url"),
+                "current_score": score.get("current_score", 0),
+                "tree_state": score.get("tree_state", "seedling"),
+                "streak_days": score.get("streak_days", 0),
                 "is_you": fid == uid,
             })
 
-    entries.sort(key=lambda e: e["current_score"], reverse=True)
+    tag = await _offload(leaderboards.build, uid, entries, source)
+
+    entries.sort(key=lambda e: (-e["current_score"], e["user_id"]))
     for i, entry in enumerate(entries):
         entry["rank"] = i + 1
 
-    return {"leaderboard": entries}
+    return JSONResponse({"leaderboard": entries}, headers={"ETag": tag})
 
 
 @router.get("/activity/{user_id}")
 async def get_activity(user_id: str, authorization: str = Header(...)):
-    client, _ = _get_client(authorization)
+    client, _ = await _get_client(authorization)
 
-    activity = (
+    activity = await _execute(
         client.table("activity_log")
         .select("*")
         .eq("user_id", user_id)
         .order("created_at", desc=True)
         .limit(100)
-        .execute()
     )
     return {"activity": activity.data}
 
 
 @router.get("/activity/{user_id}/heatmap")
-async def get_heatmap(user_id: str, authorization: str = Header(...)):
-    client, _ = _get_client(authorization)
+async def get_heatmap(user_id: str, request: Request, authorization: str = Header(...)):
+    client, _ = await _get_client(authorization)
 
-    activity = (
-        client.table("activity_log")
-        .select("points, created_at")
+    since = (datetime.now(timezone.utc).date() - timedelta(days=365)).isoformat()
+    buckets = await _execute(
+        client.table("activity_daily")
+        .select("day, points")
         .eq("user_id", user_id)
-        .gte("created_at", "now() - interval '365 days'")
-        .order("created_at", desc=False)
-        .execute()
+        .gte("day", since)
+        .order("day", desc=False)
     )
 
-    daily: dict[str, int] = {}
-    for row in activity.data:
-        date_str = row["created_at"][:10]
-        daily[date_str] = daily.get(date_str, 0) + row["points"]
+    daily = {row["day"]: row["points"] for row in buckets.data if row["points"]}
 
-    return {"heatmap": daily}
+    digest = hashlib.sha1(repr(sorted(daily.items())).encode()).hexdigest()[:16]
+    tag = f'W/"{digest}"'
+    headers = {"ETag": tag, "Cache-Control": "private, no-cache"}
+    if request.headers.get("if-none-match") == tag:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse({"heatmap": daily}, headers=headers)
 
 
 @router.get("/profile/{user_id}")
 async def get_profile(user_id: str, authorization: str = Header(...)):
-    client, _ = _get_client(authorization)
-    profile = client.table("profiles").select("*").eq("id", user_id).single().execute()
-    score = client.table("user_scores").select("*").eq("user_id", user_id).single().execute()
+    client, _ = await _get_client(authorization)
+    profile, score = await asyncio.gather(
+        _execute(client.table("profiles").select("*").eq("id", user_id).single()),
+        _execute(client.table("user_scores").select("*").eq("user_id", user_id).single()),
+    )
     return {"profile": profile.data, "score": score.data}
 
 
 @router.put("/profile")
 async def update_profile(body: ProfileUpdate, authorization: str = Header(...)):
-    client, _ = _get_client(authorization)
-    user = client.auth.get_user()
-    uid = user.user.id
+    client, uid = await _get_client(authorization)
 
     updates = {k: v for k, v in body.model_dump().items() if v is not None}
     if not updates:
         raise HTTPException(400, "No fields to update")
 
-    result = client.table("profiles").update(updates).eq("id", uid).execute()
+    result = await _execute(client.table("profiles").update(updates).eq("id", uid))
+    await _offload(leaderboards.update_user, uid, **updates)
     return {"ok": True, "profile": result.data[0] if result.data else None}
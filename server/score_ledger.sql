@@ -0,0 +1,36 @@
+-- ============================================================
+-- Yggdrasil – Batched, idempotent score accounting
+-- Run this in the Supabase SQL Editor after setup_supabase.sql
+-- ============================================================
+
+-- Applies a batch of {id, user_id, analysis_id, points} entries in one
+-- statement. Entry ids become user_analyses ids, so replaying a batch after
+-- a lost response adds nothing twice. Increments are summed per user and
+-- applied with a single atomic upsert per user.
+CREATE OR REPLACE FUNCTION apply_score_batch(entries JSONB)
+RETURNS TABLE (user_id UUID, current_score INTEGER, tree_state TEXT) AS $$
+    WITH inserted AS (
+        INSERT INTO user_analyses (id, user_id, analysis_id, points_earned)
+        SELECT (e->>'id')::uuid,
+               (e->>'user_id')::uuid,
+               NULLIF(e->>'analysis_id', '')::uuid,
+               (e->>'points')::int
+        FROM jsonb_array_elements(entries) AS e
+        ON CONFLICT (id) DO NOTHING
+        RETURNING user_analyses.user_id, user_analyses.points_earned
+    ),
+    totals AS (
+        SELECT i.user_id, SUM(i.points_earned)::int AS points, COUNT(*)::int AS analyses
+        FROM inserted i
+        GROUP BY i.user_id
+    )
+    INSERT INTO user_scores AS s (user_id, current_score, total_analyses, tree_state, updated_at)
+    SELECT t.user_id, t.points, t.analyses, get_tree_state(t.points), now()
+    FROM totals t
+    ON CONFLICT (user_id) DO UPDATE
+        SET current_score = s.current_score + EXCLUDED.current_score,
+            total_analyses = s.total_analyses + EXCLUDED.total_analyses,
+            tree_state = get_tree_state(s.current_score + EXCLUDED.current_score),
+            updated_at = now()
+    RETURNING s.user_id, s.current_score, s.tree_state;
+$$ LANGUAGE sql;
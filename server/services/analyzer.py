@@ -1,16 +1,40 @@
+import asyncio
 import base64
 import json
 import logging
+import os
+import random
+import time
 
 import google.generativeai as genai
+from google.api_core import exceptions
 
-from config import GEMINI_API_KEY
+from config import (
+    CLAIM_INDEX,
+    GEMINI_API_KEY,
+    GEMINI_MAX_ATTEMPTS,
+    GEMINI_TIMEOUT,
+    GEMINI_UPLOAD_MODE,
+    INLINE_MAX_BYTES,
+)
 from models.schemas import AnalysisResult
+from services import cache, claim_index, limiter, metrics, segments, uploads
 
 logger = logging.getLogger(__name__)
 
 genai.configure(api_key=GEMINI_API_KEY)
 
+THROTTLE_ERRORS = (exceptions.TooManyRequests, exceptions.ResourceExhausted)
+RETRYABLE_ERRORS = THROTTLE_ERRORS + (
+    exceptions.InternalServerError,
+    exceptions.ServiceUnavailable,
+    exceptions.DeadlineExceeded,
+    asyncio.TimeoutError,
+)
+
+_model = None
+_loop = None
+
 PROMPT = """You are a world-class video fact-checker and media literacy analyst for an app called Mind Bloom.
 
 You are given the audio track and key visual frames from a video posted on social media.
@@ -89,6 +113,66 @@ Respond ONLY with valid JSON matching this exact structure (no markdown, no back
 }"""
 
 
+SEGMENT_NOTE = """
+
+## Segment:
+This input is one segment of a longer video, covering {start} to {end} of it.
+Analyze only this segment. Give every timestamp relative to the start of this
+segment (0:00 here is {start} in the full video)."""
+
+CLAIMS_NOTE = """
+
+## Claim verification:
+Claims are verified in a separate step. Still extract every verifiable claim,
+but for each one give only "claim", "type" and "timestamp": set "verdict" to
+"unverified", "confidence" to 0.0, "explanation" to "" and leave the evidence
+and source lists empty."""
+
+VERIFY_PROMPT = """You are a world-class fact-checker for an app called Mind Bloom.
+
+You are given numbered claims made in a social media video, with the video's title and summary for context. For each claim provide:
+- Verdict: "true", "misleading", "false", or "unverified"
+- Confidence score from 0.0 to 1.0
+- Clear explanation of why you gave that verdict
+- Evidence supporting the claim
+- Evidence contradicting the claim
+- Source URLs you are confident about (real, well-known sources only — do NOT fabricate URLs)
+
+## CRITICAL RULES:
+- Be objective and evidence-based
+- If you cannot verify a claim, mark it "unverified" — do NOT guess
+- Do NOT fabricate source URLs. Only include URLs you are confident are real.
+
+Respond ONLY with valid JSON matching this exact structure (no markdown, no backticks, no preamble):
+{
+  "claims": [
+    {
+      "index": 0,
+      "verdict": "true|misleading|false|unverified",
+      "confidence": 0.0,
+      "explanation": "why this verdict",
+      "evidence_for": ["supporting evidence"],
+      "evidence_against": ["contradicting evidence"],
+      "sources": ["https://real-source-url.com"]
+    }
+  ]
+}"""
+
+SYNTHESIS_PROMPT = """You are given the per-segment analyses of one long video, in order, as JSON.
+Write the overall title, a 2-3 sentence summary of the whole video, and the three perspectives on its main topic.
+
+Respond ONLY with valid JSON matching this exact structure (no markdown, no backticks, no preamble):
+{
+  "title": "descriptive title for this video",
+  "summary": "2-3 sentence summary",
+  "perspectives": {
+    "left": "left perspective",
+    "center": "center perspective",
+    "right": "right perspective"
+  }
+}"""
+
+
 def _parse_json(text: str) -> dict:
     text = text.strip()
     if text.startswith("```"):
@@ -107,42 +191,225 @@ def _calculate_points(claims: list[dict], content_type: str) -> int:
 
 
 def _inline_part(path: str, mime_type: str) -> dict:
-    data = open(path, "rb").read()
+    with metrics.timed("encode"):
+        with open(path, "rb") as f:
+            data = base64.b64encode(f.read()).decode()
+    metrics.bytes_to_gemini.labels("inline").inc(len(data))
     return {
         "inline_data": {
             "mime_type": mime_type,
-            "data": base64.b64encode(data).decode(),
+            "data": data,
         }
     }
 
 
-def analyze(audio_path: str, keyframe_paths: list[str]) -> AnalysisResult:
-    contents = [PROMPT]
-    contents.append(_inline_part(audio_path, "audio/mpeg"))
+def _media_part(path: str, mime_type: str) -> dict:
+    """Upload large media through the Files API; inline only small parts."""
+    if GEMINI_UPLOAD_MODE == "inline" or os.path.getsize(path) <= INLINE_MAX_BYTES:
+        return _inline_part(path, mime_type)
+    try:
+        return uploads.upload(path, mime_type)
+    except Exception as e:
+        logger.warning("Upload of %s failed, sending inline: %s", path, e)
+        return _inline_part(path, mime_type)
+
+
+def _get_model():
+    global _model
+    if _model is None:
+        _model = genai.GenerativeModel(
+            "gemini-2.0-flash",
+            generation_config=genai.GenerationConfig(
+                response_mime_type="application/json"
+            ),
+        )
+    return _model
+
+
+def _backoff(attempt: int) -> float:
+    return random.uniform(0, min(30.0, 2.0 ** attempt))
+
+
+async def _generate(contents: list) -> str:
+    """One Gemini call under the shared limiter, retrying 429/5xx with jittered backoff."""
+    model = _get_model()
+    for attempt in range(GEMINI_MAX_ATTEMPTS):
+        slot = await limiter.gemini.acquire()
+        started = time.monotonic()
+        outcome = limiter.OK
+        try:
+            with metrics.timed("gemini"):
+                response = await asyncio.wait_for(
+                    model.generate_content_async(
+                        contents, request_options={"timeout": GEMINI_TIMEOUT}
+                    ),
+                    GEMINI_TIMEOUT,
+                )
+            return response.text
+        except RETRYABLE_ERRORS as e:
+            outcome = limiter.THROTTLED if isinstance(e, THROTTLE_ERRORS) else limiter.SLOW
+            if attempt == GEMINI_MAX_ATTEMPTS - 1:
+                raise
+            logger.warning("Gemini call failed (%s), retrying...", type(e).__name__)
+        finally:
+            await limiter.gemini.release(slot, time.monotonic() - started, outcome)
+        await asyncio.sleep(_backoff(attempt))
+    raise RuntimeError("Gemini returned no valid response")
+
+
+def _contents(prompt: str, audio_path: str, keyframe_paths: list[str]) -> list:
+    contents = [prompt]
+    contents.append(_media_part(audio_path, "audio/mpeg"))
     for path in keyframe_paths:
-        contents.append(_inline_part(path, "image/jpeg"))
+        contents.append(_media_part(path, "image/jpeg"))
+    return contents
 
-    model = genai.GenerativeModel("gemini-2.0-flash")
-    gen_config = genai.GenerationConfig(response_mime_type="application/json")
 
-    result = None
+async def _request_json(contents: list) -> dict:
     for attempt in range(2):
         try:
-            response = model.generate_content(
-                contents, generation_config=gen_config
-            )
-            result = _parse_json(response.text)
-            break
+            return _parse_json(await _generate(contents))
         except json.JSONDecodeError:
             if attempt == 1:
                 raise
             logger.warning("JSON parse failed, retrying Gemini call...")
+    raise RuntimeError("Gemini returned no valid response")
+
+
+def _prompt() -> str:
+    return PROMPT + CLAIMS_NOTE if CLAIM_INDEX else PROMPT
+
+
+async def _verify_claims(result: dict) -> dict:
+    """Fill in claim verdicts, from the claim index where a claim is already known.
+
+    Only claims the index has no confident verdict for are sent to Gemini, in
+    one text-only call; those verdicts are then added to the index. If that
+    call fails the remaining claims are returned unverified.
+    """
+    claims = result.get("claims") or []
+    if not claims:
+        return result
+    known = await asyncio.to_thread(cache.lookup_claims, [c.get("claim", "") for c in claims])
+    unknown = []
+    for claim, verdict in zip(claims, known):
+        if verdict:
+            claim.update(verdict)
+        else:
+            unknown.append(claim)
+    if not unknown:
+        return result
+
+    request = {
+        "title": result.get("title", ""),
+        "summary": result.get("summary", ""),
+        "claims": [
+            {"index": i, "claim": claim.get("claim", ""), "type": claim.get("type", "spoken")}
+            for i, claim in enumerate(unknown)
+        ],
+    }
+    try:
+        verified = await _request_json([VERIFY_PROMPT, json.dumps(request)])
+    except Exception as e:
+        # The analysis itself succeeded; its claims stay unverified rather
+        # than failing the job, and nothing is added to the index.
+        logger.warning("Claim verification failed, returning claims unverified: %s", e)
+        return result
+    for entry in verified.get("claims") or []:
+        index = entry.get("index")
+        if isinstance(index, int) and 0 <= index < len(unknown):
+            unknown[index].update(
+                {field: entry[field] for field in claim_index.VERDICT_FIELDS if field in entry}
+            )
+    await asyncio.to_thread(cache.store_claims, unknown)
+    return result
 
-    if result is None:
-        raise RuntimeError("Gemini returned no valid response")
 
+def _finish(result: dict) -> AnalysisResult:
     content_type = result.pop("content_type", "entertainment")
     points = _calculate_points(result.get("claims", []), content_type)
     result["points_awarded"] = points
 
     return AnalysisResult(**result)
+
+
+async def analyze_async(audio_path: str, keyframe_paths: list[str]) -> AnalysisResult:
+    contents = await asyncio.to_thread(_contents, _prompt(), audio_path, keyframe_paths)
+    result = await _request_json(contents)
+    if CLAIM_INDEX:
+        result = await _verify_claims(result)
+    return _finish(result)
+
+
+async def _analyze_segment(segment: dict) -> dict:
+    note = SEGMENT_NOTE.format(
+        start=segments.format_timestamp(segment["start"]),
+        end=segments.format_timestamp(segment["end"]),
+    )
+    contents = await asyncio.to_thread(
+        _contents, _prompt() + note, segment["audio_path"], segment["keyframe_paths"]
+    )
+    return await _request_json(contents)
+
+
+async def _synthesize(windows: list[tuple[float, float]], parts: list[dict]) -> dict:
+    overview = [
+        {
+            "from": segments.format_timestamp(start),
+            "to": segments.format_timestamp(end),
+            "title": part.get("title", ""),
+            "summary": part.get("summary", ""),
+            "perspectives": part.get("perspectives", {}),
+        }
+        for (start, end), part in zip(windows, parts)
+    ]
+    return await _request_json([SYNTHESIS_PROMPT, json.dumps(overview)])
+
+
+async def analyze_segments_async(parts: list[dict]) -> AnalysisResult:
+    """Analyze overlapping windows concurrently and merge them into one result.
+
+    Calls share the Gemini limiter with every other job, so a long video
+    widens to as many windows as the limit allows. A final text-only call
+    writes the title, summary and perspectives for the whole video; without
+    it the merge falls back to the first window's. With the claim index on,
+    the merged claims are verified alongside that call, so a claim repeated
+    across windows is checked once.
+    """
+    windows = [(part["start"], part["end"]) for part in parts]
+    results = await asyncio.gather(*(_analyze_segment(part) for part in parts))
+    merged = segments.merge(windows, results)
+    synthesis = asyncio.ensure_future(_synthesize(windows, results))
+    if CLAIM_INDEX:
+        try:
+            merged = await _verify_claims(merged)
+        except BaseException:
+            synthesis.cancel()
+            raise
+    try:
+        overall = await synthesis
+        for key in ("title", "summary", "perspectives"):
+            if overall.get(key):
+                merged[key] = overall[key]
+    except Exception as e:
+        logger.warning("Segment synthesis failed, using merged fields: %s", e)
+    return _finish(merged)
+
+
+@metrics.timed("analyze")
+def analyze(
+    audio_path: str, keyframe_paths: list[str], parts: list[dict] | None = None
+) -> AnalysisResult:
+    """Blocking entry point for worker processes.
+
+    ``parts`` are the windows from ``downloader.download_and_extract`` for
+    long videos; when given they are analyzed instead of the whole track.
+    Each process keeps one event loop so the model's async channel, which is
+    bound to the loop it was first used on, is reused across jobs.
+    """
+    global _loop
+    if _loop is None:
+        _loop = asyncio.new_event_loop()
+    if parts:
+        return _loop.run_until_complete(analyze_segments_async(parts))
+    return _loop.run_until_complete(analyze_async(audio_path, keyframe_paths))
@@ -1,55 +1,118 @@
 import hashlib
 import json
 import logging
-from datetime import datetime, timezone
 
 from supabase import create_client
 
-from config import SUPABASE_URL, SUPABASE_KEY
+from config import (
+    CACHE_MAX_BYTES,
+    CACHE_MAX_ENTRIES,
+    CACHE_NEGATIVE_TTL,
+    CACHE_TTL,
+    SUPABASE_URL,
+    SUPABASE_KEY,
+)
 from models.schemas import AnalysisResult
+from services import claim_index, fingerprints, jobs, ledger, metrics, urls
+from services.lru import MISSING, TTLCache
 
 logger = logging.getLogger(__name__)
 
 _client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
+_memory = TTLCache(CACHE_MAX_ENTRIES, CACHE_MAX_BYTES, CACHE_TTL, CACHE_NEGATIVE_TTL)
 
-def _hash_url(url: str) -> str:
-    return hashlib.sha256(url.encode()).hexdigest()
+RESULT_COLUMNS = (
+    "title,platform,duration_seconds,summary,transcript,"
+    "claims,perspectives,bias_analysis,points_awarded"
+)
 
 
-def get_cached(url: str) -> dict | None:
-    url_hash = _hash_url(url)
+def url_hash(url: str, info: dict | None = None) -> str:
+    """Hash of the canonical URL that results are stored and jobs deduplicated under."""
+    return hashlib.sha256(urls.canonical_key(url, info).encode()).hexdigest()
+
+
+def _result(row: dict) -> dict:
+    return {
+        "title": row.get("title", ""),
+        "platform": row.get("platform", ""),
+        "duration_seconds": row.get("duration_seconds"),
+        "summary": row.get("summary", ""),
+        "transcript": row.get("transcript", ""),
+        "claims": row.get("claims", []),
+        "perspectives": row.get("perspectives", {}),
+        "bias_analysis": row.get("bias_analysis", {}),
+        "points_awarded": row.get("points_awarded", 5),
+    }
+
+
+def _shared_results(key: str) -> dict | None:
     try:
-        response = (
-            _client.table("video_analyses")
-            .select("*")
-            .eq("url_hash", url_hash)
-            .limit(1)
-            .execute()
-        )
+        return jobs.shared_results(key)
+    except Exception as e:
+        logger.warning("Job results read failed: %s", e)
+        return None
+
+
+def get_cached(url: str, info: dict | None = None) -> dict | None:
+    """Stored result for a URL: this process's memory, then Supabase.
+
+    A remembered miss is only honoured after checking the shared job store,
+    where a job finished by another process leaves its result; misses are
+    not remembered at all while a job for the URL is queued or processing.
+    """
+    key = url_hash(url, info)
+    cached = _memory.get(key)
+    if cached is not MISSING:
+        if cached:
+            metrics.cache_lookups.labels("memory", "hit").inc()
+            return cached
+        shared = _shared_results(key)
+        if shared:
+            _memory.put(key, shared)
+            metrics.cache_lookups.labels("jobs", "hit").inc()
+            return shared
+        metrics.cache_lookups.labels("memory", "negative").inc()
+        return None
+    try:
+        with metrics.timed("cache_lookup"):
+            response = (
+                _client.table("video_analyses")
+                .select(RESULT_COLUMNS)
+                .eq("url_hash", key)
+                .limit(1)
+                .execute()
+            )
         if response.data:
-            row = response.data[0]
-            return {
-                "title": row.get("title", ""),
-                "platform": row.get("platform", ""),
-                "duration_seconds": row.get("duration_seconds"),
-                "summary": row.get("summary", ""),
-                "transcript": row.get("transcript", ""),
-                "claims": row.get("claims", []),
-                "perspectives": row.get("perspectives", {}),
-                "bias_analysis": row.get("bias_analysis", {}),
-                "points_awarded": row.get("points_awarded", 5),
-            }
+            result = _result(response.data[0])
+            _memory.put(key, result)
+            metrics.cache_lookups.labels("supabase", "hit").inc()
+            return result
+        if not jobs.in_flight(key):
+            _memory.put_miss(key)
+        metrics.cache_lookups.labels("supabase", "miss").inc()
     except Exception as e:
         logger.warning("Cache read failed: %s", e)
+        metrics.cache_lookups.labels("supabase", "error").inc()
     return None
 
 
-def store_result(url: str, result: AnalysisResult) -> str:
-    url_hash = _hash_url(url)
+def remember(url_hash: str, result: dict) -> None:
+    """Populate the in-process tier with a result stored by another process."""
+    _memory.put(url_hash, result)
+
+
+def stats() -> dict:
+    return _memory.stats()
+
+
+def store_result(url: str, result: AnalysisResult, info: dict | None = None) -> str:
+    key = url_hash(url, info)
+    _memory.put(key, result.model_dump())
     try:
         data = {
-            "url_hash": url_hash,
+            "url_hash": key,
             "url": url,
             "platform": result.platform,
             "title": result.title,
@@ -65,7 +128,8 @@ def store_result(url: str, result: AnalysisResult) -> str:
             ),
             "points_awarded": result.points_awarded,
         }
-        response = _client.table("video_analyses").upsert(data).execute()
+        with metrics.timed("store"):
+            response = _client.table("video_analyses").upsert(data).execute()
         if response.data:
             return response.data[0]["id"]
     except Exception as e:
@@ -73,51 +137,48 @@ def store_result(url: str, result: AnalysisResult) -> str:
     return ""
 
 
-def record_user_analysis(user_id: str, analysis_id: str, points: int) -> None:
+def find_reupload(fingerprint: dict) -> dict | None:
+    """Stored result for media matching ``fingerprint``, whatever URL it came from."""
+    analysis_id = fingerprints.lookup(_client, fingerprint)
+    if not analysis_id:
+        return None
     try:
-        _client.table("user_analyses").insert({
-            "user_id": user_id,
-            "analysis_id": analysis_id,
-            "points_earned": points,
-        }).execute()
-
-        existing = (
-            _client.table("user_scores")
-            .select("current_score,total_analyses")
-            .eq("user_id", user_id)
+        response = (
+            _client.table("video_analyses")
+            .select(RESULT_COLUMNS)
+            .eq("id", analysis_id)
             .limit(1)
             .execute()
         )
+    except Exception as e:
+        logger.warning("Reupload read failed: %s", e)
+        return None
+    return _result(response.data[0]) if response.data else None
+
+
+def store_fingerprint(analysis_id: str, fingerprint: dict) -> None:
+    fingerprints.record(_client, analysis_id, fingerprint)
+
+
+def lookup_claims(texts: list[str]) -> list[dict | None]:
+    """Verdicts already in the claim index for each claim text, or None."""
+    return claim_index.lookup(_client, texts)
 
-        now = datetime.now(timezone.utc).isoformat()
-
-        if existing.data:
-            row = existing.data[0]
-            new_score = row["current_score"] + points
-            new_total = row["total_analyses"] + 1
-            _client.table("user_scores").update({
-                "current_score": new_score,
-                "total_analyses": new_total,
-                "tree_state": _get_tree_state(new_score),
-                "updated_at": now,
-            }).eq("user_id", user_id).execute()
-        else:
-            _client.table("user_scores").insert({
-                "user_id": user_id,
-                "current_score": points,
-                "total_analyses": 1,
-                "tree_state": _get_tree_state(points),
-                "updated_at": now,
-            }).execute()
+
+def store_claims(claims: list[dict]) -> None:
+    claim_index.record(_client, claims)
+
+
+def record_user_analysis(user_id: str, analysis_id: str, points: int) -> None:
+    try:
+        ledger.record(user_id, analysis_id, points)
     except Exception as e:
         logger.warning("Record user analysis failed: %s", e)
 
 
-def _get_tree_state(score: int) -> str:
-    if score < 100:
-        return "seedling"
-    if score < 500:
-        return "sapling"
-    if score < 1000:
-        return "healthy"
-    return "blooming"
+def start_score_flusher() -> None:
+    ledger.start_flusher(_client)
+
+
+def stop_score_flusher() -> None:
+    ledger.stop_flusher(_client)
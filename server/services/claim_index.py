@@ -0,0 +1,209 @@
+import hashlib
+import logging
+import random
+
+from config import (
+    CACHE_NEGATIVE_TTL,
+    CACHE_TTL,
+    CLAIM_CACHE_BYTES,
+    CLAIM_CACHE_ENTRIES,
+    CLAIM_MATCH_THRESHOLD,
+    CLAIM_MAX_AGE,
+    CLAIM_MIN_CONFIDENCE,
+)
+from services import metrics
+from services.lru import MISSING, TTLCache
+from services.segments import normalize_text
+
+logger = logging.getLogger(__name__)
+
+VERDICT_FIELDS = (
+    "verdict",
+    "confidence",
+    "explanation",
+    "evidence_for",
+    "evidence_against",
+    "sources",
+)
+
+SHINGLE_SIZE = 5
+BANDS = 16
+ROWS = 4
+CANDIDATE_LIMIT = 500
+
+_PRIME = (1 << 61) - 1
+# Seeded so that every process and deployment derives the same permutations;
+# changing the seed, BANDS or ROWS invalidates the stored band keys.
+_rng = random.Random(20240601)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _PRIME), _rng.randrange(_PRIME)) for _ in range(BANDS * ROWS)
+]
+_NEGATIONS = frozenset(
+    ("not", "no", "never", "none", "nobody", "nothing", "neither", "nor", "without")
+)
+
+_memory = TTLCache(CLAIM_CACHE_ENTRIES, CLAIM_CACHE_BYTES, CACHE_TTL, CACHE_NEGATIVE_TTL)
+
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+def text_hash(normalized: str) -> str:
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+def shingles(normalized: str) -> set[str]:
+    """Overlapping character k-grams; robust to a changed word in a short claim."""
+    if len(normalized) <= SHINGLE_SIZE:
+        return {normalized}
+    return {
+        normalized[i:i + SHINGLE_SIZE]
+        for i in range(len(normalized) - SHINGLE_SIZE + 1)
+    }
+
+
+def bands(shingle_set: set[str]) -> list[str]:
+    """LSH band keys of the MinHash signature; similar claims share at least one."""
+    hashes = [_hash64(s) for s in shingle_set]
+    signature = [min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS]
+    return [
+        f"{i}:{_hash64(','.join(map(str, signature[i * ROWS:(i + 1) * ROWS]))):016x}"
+        for i in range(BANDS)
+    ]
+
+
+def jaccard(a: set[str], b: set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _polarity(normalized: str) -> list[str]:
+    """Numbers and negations, which must agree for two claims to be the same.
+
+    "X is not Y" and "X rose 4%" / "X rose 14%" are near-identical as text but
+    carry opposite or different verdicts.
+    """
+    return sorted(
+        token for token in normalized.split()
+        if token.isdigit() or token in _NEGATIONS or token.endswith("n't")
+    )
+
+
+def _verdict(row: dict) -> dict:
+    return {field: row[field] for field in VERDICT_FIELDS if row.get(field) is not None}
+
+
+def _prepare(candidates: list[dict]) -> list[tuple[dict, set[str], list[str]]]:
+    return [
+        (row, shingles(row["normalized"]), _polarity(row["normalized"]))
+        for row in candidates
+    ]
+
+
+def _best_match(normalized: str, digest: str, candidates: list[tuple]) -> dict | None:
+    best, best_score = None, CLAIM_MATCH_THRESHOLD
+    own = shingles(normalized)
+    polarity = _polarity(normalized)
+    for row, row_shingles, row_polarity in candidates:
+        if row["text_hash"] == digest:
+            return row
+        if row_polarity != polarity:
+            continue
+        score = jaccard(own, row_shingles)
+        if score >= best_score:
+            best, best_score = row, score
+    return best
+
+
+def lookup(client, texts: list[str]) -> list[dict | None]:
+    """Stored verdict fields for each claim text, or None where it is unknown.
+
+    Exact repeats are answered from memory; the rest go to Supabase in one
+    call that returns every row sharing a hash or an LSH band, and the
+    closest row above CLAIM_MATCH_THRESHOLD (by shingle Jaccard) wins.
+    """
+    found: list[dict | None] = [None] * len(texts)
+    pending: dict[str, tuple[str, list[int]]] = {}
+    for i, text in enumerate(texts):
+        normalized = normalize_text(text or "")
+        if not normalized:
+            continue
+        digest = text_hash(normalized)
+        cached = _memory.get(digest)
+        if cached is not MISSING:
+            metrics.claim_lookups.labels("memory", "hit" if cached else "negative").inc()
+            found[i] = cached
+            continue
+        pending.setdefault(digest, (normalized, []))[1].append(i)
+    if not pending:
+        return found
+
+    band_keys: dict[str, list[str]] = {
+        digest: bands(shingles(normalized)) for digest, (normalized, _) in pending.items()
+    }
+    try:
+        with metrics.timed("claim_lookup"):
+            candidates = client.rpc("claim_lookup", {
+                "p_hashes": list(pending),
+                "p_bands": sorted({key for keys in band_keys.values() for key in keys}),
+                "p_max_age": CLAIM_MAX_AGE,
+                "p_limit": CANDIDATE_LIMIT,
+            }).execute().data or []
+    except Exception as e:
+        logger.warning("Claim index lookup failed: %s", e)
+        metrics.claim_lookups.labels("supabase", "error").inc(len(pending))
+        return found
+
+    candidates = _prepare(candidates)
+    for digest, (normalized, indexes) in pending.items():
+        match = _best_match(normalized, digest, candidates)
+        verdict = _verdict(match) if match else None
+        if verdict:
+            _memory.put(digest, verdict)
+        else:
+            _memory.put_miss(digest)
+        metrics.claim_lookups.labels("supabase", "hit" if verdict else "miss").inc()
+        for i in indexes:
+            found[i] = verdict
+    return found
+
+
+def record(client, claims: list[dict]) -> int:
+    """Add confidently verified claims to the index; returns how many were sent."""
+    rows = {}
+    for claim in claims:
+        if claim.get("verdict", "unverified") == "unverified":
+            continue
+        try:
+            if float(claim.get("confidence") or 0.0) < CLAIM_MIN_CONFIDENCE:
+                continue
+        except (TypeError, ValueError):
+            continue
+        normalized = normalize_text(claim.get("claim", ""))
+        if not normalized:
+            continue
+        digest = text_hash(normalized)
+        rows[digest] = {
+            "text_hash": digest,
+            "claim": claim["claim"],
+            "normalized": normalized,
+            "bands": bands(shingles(normalized)),
+            **_verdict(claim),
+        }
+    if not rows:
+        return 0
+    try:
+        with metrics.timed("claim_record"):
+            client.rpc("claim_record", {"claims": list(rows.values())}).execute()
+    except Exception as e:
+        logger.warning("Claim index write failed: %s", e)
+        return 0
+    for digest, row in rows.items():
+        _memory.put(digest, _verdict(row))
+    return len(rows)
+
+
+def stats() -> dict:
+    return _memory.stats()
@@ -0,0 +1,48 @@
+import os
+import sqlite3
+from contextlib import contextmanager
+
+from config import JOB_DB_PATH
+
+
+def _connect() -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(JOB_DB_PATH) or ".", exist_ok=True)
+    conn = sqlite3.connect(JOB_DB_PATH, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+@contextmanager
+def session():
+    """Short-lived autocommit connection to the local state database."""
+    conn = _connect()
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+@contextmanager
+def transaction(conn: sqlite3.Connection):
+    """Hold the write lock for a read-modify-write sequence."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def pid_alive(pid: int | None) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
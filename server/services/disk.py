@@ -0,0 +1,200 @@
+import logging
+import os
+import re
+import shutil
+import time
+from pathlib import Path
+
+from config import (
+    JOB_POLL_INTERVAL,
+    TEMP_DIR,
+    TEMP_DISK_BUDGET,
+    TEMP_DISK_HEADROOM,
+    TEMP_DISK_WAIT,
+    TEMP_RAM_DIR,
+)
+from services import metrics
+from services.db import pid_alive, session, transaction
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS disk_reservations (
+    job_id TEXT PRIMARY KEY,
+    bytes INTEGER NOT NULL,
+    pid INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+# TEMP_RAM_DIR is only used while this much memory is left in it.
+RAM_MIN_FREE = 256 * 1024 * 1024
+
+# Job directories live in this subdirectory of TEMP_DIR and TEMP_RAM_DIR, so
+# the sweep never looks at anything else in those (possibly shared) paths.
+JOBS_SUBDIR = "jobs"
+JOB_ID = re.compile(r"[0-9a-f]{32}")
+ORPHAN_GRACE = 600
+
+_ready = False
+
+
+def _init(conn) -> None:
+    global _ready
+    if not _ready:
+        conn.executescript(SCHEMA)
+        _ready = True
+
+
+def _drop_dead(conn) -> None:
+    """Forget reservations held by processes that are no longer running."""
+    pid = os.getpid()
+    for row in conn.execute("SELECT DISTINCT pid FROM disk_reservations").fetchall():
+        if row["pid"] != pid and not pid_alive(row["pid"]):
+            conn.execute("DELETE FROM disk_reservations WHERE pid = ?", (row["pid"],))
+
+
+def _free_bytes(path: str) -> int:
+    os.makedirs(path, exist_ok=True)
+    return shutil.disk_usage(path).free
+
+
+def _written(path: Path) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def _try_reserve(job_id: str, size: int) -> bool:
+    with session() as conn:
+        _init(conn)
+        with transaction(conn):
+            _drop_dead(conn)
+            others = conn.execute(
+                "SELECT job_id, bytes FROM disk_reservations WHERE job_id != ?", (job_id,)
+            ).fetchall()
+            if sum(row["bytes"] for row in others) + size > TEMP_DISK_BUDGET:
+                return False
+            # Free space already reflects what other jobs have written; only
+            # the part of their reservations still to come has to be set aside.
+            pending = sum(
+                max(0, row["bytes"] - _written(job_dir(row["job_id"]))) for row in others
+            )
+            if size + pending > _free_bytes(TEMP_DIR) - TEMP_DISK_HEADROOM:
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO disk_reservations (job_id, bytes, pid, created_at)"
+                " VALUES (?, ?, ?, ?)",
+                (job_id, size, os.getpid(), time.time()),
+            )
+    return True
+
+
+def reserve(job_id: str, size: int) -> None:
+    """Block until ``size`` bytes of TEMP_DIR are set aside for ``job_id``.
+
+    Reservations from every process on this node share TEMP_DISK_BUDGET, and
+    none is granted unless TEMP_DISK_HEADROOM would still be free on the
+    filesystem once every outstanding reservation has been written. Gives up
+    after TEMP_DISK_WAIT seconds.
+    """
+    if size > TEMP_DISK_BUDGET:
+        raise RuntimeError(
+            f"Video needs ~{size / 1e6:.0f}MB of temporary disk, over the"
+            f" {TEMP_DISK_BUDGET / 1e6:.0f}MB budget."
+        )
+    deadline = time.monotonic() + TEMP_DISK_WAIT
+    with metrics.timed("disk_wait"):
+        while not _try_reserve(job_id, size):
+            if time.monotonic() > deadline:
+                raise RuntimeError("Server is short of temporary disk space, try again later.")
+            time.sleep(JOB_POLL_INTERVAL)
+
+
+def release(job_id: str) -> None:
+    with session() as conn:
+        _init(conn)
+        conn.execute("DELETE FROM disk_reservations WHERE job_id = ?", (job_id,))
+
+
+def reserved_bytes() -> int:
+    with session() as conn:
+        _init(conn)
+        return conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM disk_reservations").fetchone()[0]
+
+
+def free_bytes() -> int:
+    return _free_bytes(TEMP_DIR)
+
+
+def _jobs_root(base: str) -> Path:
+    return Path(base) / JOBS_SUBDIR
+
+
+def job_dir(job_id: str) -> Path:
+    return _jobs_root(TEMP_DIR) / job_id
+
+
+def scratch_dir(job_id: str) -> Path:
+    """Directory for a job's small intermediates (keyframes, fingerprint buffers).
+
+    That is TEMP_RAM_DIR when it is configured and has memory to spare,
+    otherwise the job's directory under TEMP_DIR.
+    """
+    if TEMP_RAM_DIR:
+        try:
+            if _free_bytes(TEMP_RAM_DIR) > RAM_MIN_FREE:
+                return _jobs_root(TEMP_RAM_DIR) / job_id
+        except OSError as e:
+            logger.warning("TEMP_RAM_DIR unavailable, using disk: %s", e)
+    return job_dir(job_id)
+
+
+def job_dirs(job_id: str) -> list[Path]:
+    return [_jobs_root(root) / job_id for root in (TEMP_DIR, TEMP_RAM_DIR) if root]
+
+
+def sweep() -> int:
+    """Remove orphaned job directories under the ``jobs`` subdirectories.
+
+    Only entries named like a job id, untouched for ORPHAN_GRACE seconds and
+    without a reservation from a live process are removed. Directories are
+    listed before reservations are read: a job reserves before creating its
+    directory, so anything listed that is still in use shows up as reserved.
+    """
+    cutoff = time.time() - ORPHAN_GRACE
+    entries = []
+    for root in (TEMP_DIR, TEMP_RAM_DIR):
+        if not root:
+            continue
+        try:
+            listing = list(os.scandir(_jobs_root(root)))
+        except FileNotFoundError:
+            continue
+        for entry in listing:
+            # Jobs finish and clean up while this runs; a vanished entry is skipped.
+            try:
+                if not JOB_ID.fullmatch(entry.name) or not entry.is_dir(follow_symlinks=False):
+                    continue
+                if entry.stat(follow_symlinks=False).st_mtime < cutoff:
+                    entries.append(entry)
+            except OSError:
+                continue
+    with session() as conn:
+        _init(conn)
+        with transaction(conn):
+            _drop_dead(conn)
+        live = {row["job_id"] for row in conn.execute("SELECT job_id FROM disk_reservations")}
+    removed = 0
+    for entry in entries:
+        if entry.name not in live and os.path.isdir(entry.path):
+            shutil.rmtree(entry.path, ignore_errors=True)
+            removed += 1
+    if removed:
+        logger.info("Removed %d orphaned job directories", removed)
+    return removed
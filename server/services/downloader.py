@@ -1,113 +1,441 @@
 import logging
 import shutil
 import subprocess
+import threading
+import time
 from pathlib import Path
-from urllib.parse import urlparse
+from typing import Callable
 
 import yt_dlp
 
-from config import KEYFRAME_INTERVAL, MAX_KEYFRAMES, MAX_VIDEO_DURATION, TEMP_DIR
+from config import (
+    FINGERPRINT_SECONDS,
+    KEYFRAME_WIDTH,
+    MAX_DOWNLOAD_BYTES,
+    MAX_KEYFRAMES,
+    MAX_VIDEO_DURATION,
+    PROBE_CACHE_BYTES,
+    PROBE_CACHE_ENTRIES,
+    PROBE_FAILURE_TTL,
+    PROBE_TTL,
+    TEMP_DISK_BUDGET,
+)
+from models.schemas import JobStage
+from services import disk, fingerprints, keyframes, metrics, segments, urls
+from services.lru import MISSING, TTLCache
+from services.urls import PLATFORM_MAP, detect_platform  # noqa: F401
 
 logger = logging.getLogger(__name__)
 
-PLATFORM_MAP = {
-    "youtube.com": "youtube",
-    "youtu.be": "youtube",
-    "instagram.com": "instagram",
-    "tiktok.com": "tiktok",
-    "twitter.com": "twitter",
-    "x.com": "twitter",
-    "facebook.com": "facebook",
-    "fb.watch": "facebook",
-    "reddit.com": "reddit",
+# Protocols ffmpeg can read directly, so extraction can start while bytes
+# are still arriving instead of after yt-dlp has written a file to disk.
+STREAMABLE_PROTOCOLS = {"http", "https", "m3u8", "m3u8_native"}
+
+YDL_OPTS = {
+    "noplaylist": True,
+    "quiet": True,
+    "no_warnings": True,
+    "extract_flat": False,
+    "socket_timeout": 30,
 }
 
+# Large info-dict fields nothing downstream reads; dropped before caching.
+UNUSED_INFO_KEYS = (
+    "formats",
+    "requested_formats",
+    "requested_downloads",
+    "thumbnails",
+    "subtitles",
+    "automatic_captions",
+    "heatmap",
+    "chapters",
+    "description",
+)
 
-def detect_platform(url: str) -> str:
-    hostname = urlparse(url).hostname or ""
-    for domain, platform in PLATFORM_MAP.items():
-        if hostname.endswith(domain):
-            return platform
-    return "other"
+# Rough per-job output sizes for disk reservations: "-q:a 2" mp3 runs near
+# 190 kbps, and scene detection can emit a few candidate JPEGs per keeper.
+AUDIO_BYTES_PER_SECOND = 24_000
+FRAME_BYTES = 200_000
+FRAME_CANDIDATES = 4 * MAX_KEYFRAMES
 
+_probes = TTLCache(PROBE_CACHE_ENTRIES, PROBE_CACHE_BYTES, PROBE_TTL)
+# Recent probe errors, so a burst for a broken link fails fast instead of
+# each request waiting out another yt-dlp attempt.
+_probe_failures = TTLCache(PROBE_CACHE_ENTRIES, PROBE_CACHE_BYTES, PROBE_FAILURE_TTL)
+# Canonical key -> event set when the probe running for it finishes.
+_probes_running: dict[str, threading.Event] = {}
+_probes_lock = threading.Lock()
 
-def download_and_extract(job_id: str, url: str) -> dict:
-    job_dir = Path(TEMP_DIR) / job_id
-    job_dir.mkdir(parents=True, exist_ok=True)
 
-    with yt_dlp.YoutubeDL({"quiet": True, "no_warnings": True}) as ydl:
-        info = ydl.extract_info(url, download=False)
+def _slim(info: dict) -> dict:
+    slim = {k: v for k, v in info.items() if k not in UNUSED_INFO_KEYS}
+    slim["formats"] = select_formats(info)
+    slim["probed_at"] = time.time()
+    return slim
+
+
+def probe(url: str) -> dict:
+    """Resolve metadata and the formats a job would use, memoized per canonical URL.
+
+    The returned dict is a trimmed yt-dlp info dict whose ``formats`` holds
+    only the formats chosen by ``select_formats``; it can be handed straight
+    to ``download_and_extract`` without resolving the page again. Concurrent
+    calls for one key share a single yt-dlp run, and its failure is reused
+    for PROBE_FAILURE_TTL.
+    """
+    key = urls.canonical_key(url)
+    while True:
+        cached = _probes.get(key)
+        if cached is not MISSING:
+            return cached
+        failure = _probe_failures.get(key)
+        if failure is not MISSING:
+            raise RuntimeError(failure)
+        with _probes_lock:
+            running = _probes_running.get(key)
+            if running is None:
+                _probes_running[key] = threading.Event()
+                break
+        running.wait()
+    try:
+        return _probe(url, key)
+    finally:
+        with _probes_lock:
+            _probes_running.pop(key).set()
+
+
+def _probe(url: str, key: str) -> dict:
+    try:
+        with metrics.timed("probe"), yt_dlp.YoutubeDL(YDL_OPTS) as ydl:
+            info = _slim(ydl.sanitize_info(ydl.extract_info(url, download=False)))
+    except Exception as e:
+        _probe_failures.put(key, str(e) or type(e).__name__)
+        raise
+    _probes.put(key, info)
+    fallback_key = urls.canonical_key(url, info)
+    if fallback_key != key:
+        _probes.put(fallback_key, info)
+    return info
 
+
+def check_limits(info: dict) -> None:
     duration = info.get("duration") or 0
     if duration > MAX_VIDEO_DURATION:
         raise ValueError(
             f"Video too long ({duration}s). Max is {MAX_VIDEO_DURATION}s."
         )
+    size = sum(_est_size(f, duration) for f in info.get("formats") or [])
+    if size > MAX_DOWNLOAD_BYTES:
+        raise ValueError(
+            f"Video too large (~{size / 1e6:.0f}MB). Max is {MAX_DOWNLOAD_BYTES / 1e6:.0f}MB."
+        )
+    if disk_estimate(info) > TEMP_DISK_BUDGET:
+        raise ValueError("Video needs more temporary disk than this server allows.")
 
-    title = info.get("title", "Unknown")
-    platform = detect_platform(url)
 
-    opts = {
-        "format": "bestvideo[filesize<50M]+bestaudio/best[filesize<50M]/worst",
-        "outtmpl": str(job_dir / "video.%(ext)s"),
-        "merge_output_format": "mp4",
-        "noplaylist": True,
-        "quiet": True,
-        "no_warnings": True,
-        "extract_flat": False,
-        "socket_timeout": 30,
-    }
-    with yt_dlp.YoutubeDL(opts) as ydl:
-        ydl.download([url])
+def _streamable(formats: list[dict]) -> bool:
+    """Whether ffmpeg can read every format straight from its URL.
+
+    Formats yt-dlp fetches in ranged chunks (``http_chunk_size``) are
+    throttled or cut off when read in one request, so those are downloaded.
+    """
+    return bool(formats) and all(
+        f.get("protocol") in STREAMABLE_PROTOCOLS
+        and not (f.get("downloader_options") or {}).get("http_chunk_size")
+        for f in formats
+    )
+
+
+def disk_estimate(info: dict | None) -> int:
+    """Bytes a job may write under TEMP_DIR, from its probe; worst case without one."""
+    info = info or {}
+    duration = info.get("duration") or MAX_VIDEO_DURATION
+    formats = info.get("formats") or []
+    size = 0
+    if not _streamable(formats):
+        size += sum(_est_size(f, duration) for f in formats) or MAX_DOWNLOAD_BYTES
+    audio = duration * AUDIO_BYTES_PER_SECOND
+    # Segment cuts copy the audio once more.
+    size += 2 * audio if segments.plan(duration) else audio
+    size += FRAME_CANDIDATES * FRAME_BYTES
+    return int(size)
+
+
+def _has(fmt: dict, kind: str) -> bool:
+    """Whether the format is known to carry this track."""
+    return fmt.get(kind) not in (None, "none")
+
+
+def _lacks(fmt: dict, kind: str) -> bool:
+    """Whether the format is known not to carry this track; None means unknown."""
+    return fmt.get(kind) == "none"
+
+
+def _est_size(fmt: dict, duration: float) -> float:
+    size = fmt.get("filesize") or fmt.get("filesize_approx")
+    if size:
+        return size
+    return (fmt.get("tbr") or 0) * 125 * (duration or 0)
+
+
+def _width(fmt: dict) -> int:
+    return fmt.get("width") or fmt.get("height") or 0
+
+
+def _pick_video(candidates: list[dict], duration: float) -> dict | None:
+    """Smallest rendition that still covers KEYFRAME_WIDTH, else the widest one."""
+    if not candidates:
+        return None
+    wide = [f for f in candidates if _width(f) >= KEYFRAME_WIDTH]
+    if wide:
+        return min(wide, key=lambda f: (_width(f), _est_size(f, duration)))
+    return max(candidates, key=lambda f: (_width(f), -_est_size(f, duration)))
+
+
+def select_formats(info: dict) -> list[dict]:
+    """Choose the cheapest formats that still feed the audio and keyframe extraction.
+
+    Prefers a separate low-resolution video-only track plus the smallest
+    audio-only track, which are fed to ffmpeg as two inputs with no merge.
+    Falls back to a single muxed rendition, then to the best format whose
+    codecs yt-dlp could not tell (direct files and some social platforms
+    report them as unknown), and to audio alone when there is no video.
+    """
+    duration = info.get("duration") or 0
+    formats = [f for f in info.get("formats") or [info] if f.get("url")]
+    audio_only = [f for f in formats if _has(f, "acodec") and _lacks(f, "vcodec")]
+    video_only = [f for f in formats if _has(f, "vcodec") and _lacks(f, "acodec")]
+    muxed = [f for f in formats if _has(f, "acodec") and _has(f, "vcodec")]
+    # Anything else that may carry audio could be muxed; yt-dlp lists formats
+    # worst to best, so the last one is its "best".
+    known = audio_only + video_only + muxed
+    unknown = [f for f in formats if f not in known and not _lacks(f, "acodec")]
+
+    audio = min(audio_only, key=lambda f: _est_size(f, duration), default=None)
+    video = _pick_video(video_only, duration)
+    if audio and video:
+        return [video, audio]
+    if muxed:
+        return [_pick_video(muxed, duration)]
+    if unknown:
+        return [unknown[-1]]
+    if audio:
+        return [audio]
+    raise ValueError("No downloadable audio or video formats found")
+
+
+def _input_args(source: str, headers: dict | None = None) -> list[str]:
+    args = []
+    if headers:
+        args += ["-headers", "".join(f"{k}: {v}\r\n" for k, v in headers.items())]
+    if source.startswith("http"):
+        args += ["-rw_timeout", "30000000"]
+    return args + ["-i", source]
 
-    video_files = list(job_dir.glob("video.*"))
-    if not video_files:
-        raise FileNotFoundError("Video download failed — no output file found")
-    video_path = video_files[0]
+
+def extract_media(
+    inputs: list[tuple[str, dict | None]],
+    audio_index: int,
+    video_index: int | None,
+    audio_path: Path,
+    frames_dir: Path,
+    duration: float,
+) -> list[tuple[float, Path]]:
+    """Write the mp3 and keyframe candidates in one ffmpeg pass, then pick keyframes."""
+    cmd = ["ffmpeg", "-y"]
+    for source, headers in inputs:
+        cmd += _input_args(source, headers)
+    if video_index is not None:
+        cmd += [
+            "-filter_complex", keyframes.filter_graph(video_index, duration, frames_dir)
+        ]
+    cmd += ["-map", f"{audio_index}:a:0", "-q:a", "2", str(audio_path)]
+    if video_index is not None:
+        cmd += keyframes.output_args(frames_dir)
+    with metrics.timed("ffmpeg"):
+        subprocess.run(cmd, capture_output=True, check=True)
+    if video_index is None:
+        return []
+    with metrics.timed("keyframes"):
+        return keyframes.select(frames_dir, duration)
+
+
+def fingerprint(
+    inputs: list[tuple[str, dict | None]],
+    audio_index: int,
+    video_index: int,
+    scratch: Path,
+    duration: float,
+) -> dict | None:
+    """Audio and frame fingerprint of the first FINGERPRINT_SECONDS of media.
+
+    ffmpeg stops reading once that much is decoded, so on streamed inputs
+    this costs a few seconds of transfer rather than the whole video.
+    """
+    pcm_path = scratch / "fingerprint.pcm"
+    frames_path = scratch / "fingerprint.raw"
+    cmd = ["ffmpeg", "-y"]
+    for source, headers in inputs:
+        cmd += _input_args(source, headers)
+    cmd += [
+        "-map", f"{audio_index}:a:0", "-t", f"{FINGERPRINT_SECONDS:g}",
+        "-ac", "1", "-ar", str(fingerprints.SAMPLE_RATE), "-f", "s16le", str(pcm_path),
+        "-map", f"{video_index}:v:0", "-t", f"{FINGERPRINT_SECONDS:g}",
+        "-vf", f"fps=1,scale={keyframes.HASH_W}:{keyframes.HASH_H},format=gray",
+        "-f", "rawvideo", str(frames_path),
+    ]
+    try:
+        with metrics.timed("fingerprint"):
+            subprocess.run(cmd, capture_output=True, check=True)
+            bits = fingerprints.audio_bits(pcm_path.read_bytes())
+            frames = [f"{h:016x}" for h in keyframes.frame_hashes(frames_path)]
+    except (subprocess.CalledProcessError, OSError) as e:
+        logger.warning("Fingerprinting failed: %s", e)
+        return None
+    finally:
+        pcm_path.unlink(missing_ok=True)
+        frames_path.unlink(missing_ok=True)
+    if bits is None or not frames:
+        return None
+    return {"audio": bits, "frames": frames, "duration": duration}
+
+
+def split_audio(
+    audio_path: Path, windows: list[tuple[float, float]], job_dir: Path
+) -> list[Path]:
+    """Cut overlapping windows out of the extracted mp3 without re-encoding."""
+    paths = []
+    with metrics.timed("segment"):
+        for i, (start, end) in enumerate(windows):
+            path = job_dir / f"segment_{i:02d}.mp3"
+            subprocess.run(
+                ["ffmpeg", "-y", "-ss", f"{start:.3f}", "-t", f"{end - start:.3f}",
+                 "-i", str(audio_path), "-c", "copy", str(path)],
+                capture_output=True, check=True,
+            )
+            paths.append(path)
+    return paths
+
+
+def _download_formats(info: dict, formats: list[dict], job_dir: Path) -> list[str]:
+    opts = {**YDL_OPTS, "outtmpl": str(job_dir / "media.%(format_id)s.%(ext)s")}
+    base = {k: v for k, v in info.items() if k not in ("formats", "probed_at")}
+    with metrics.timed("download"), yt_dlp.YoutubeDL(opts) as ydl:
+        for fmt in formats:
+            ydl.process_info({**base, **fmt})
+
+    paths = []
+    for fmt in formats:
+        found = list(job_dir.glob(f"media.{fmt['format_id']}.*"))
+        if not found:
+            raise FileNotFoundError("Video download failed — no output file found")
+        paths.append(str(found[0]))
+        metrics.bytes_downloaded.labels("file").inc(found[0].stat().st_size)
+    return paths
+
+
+@metrics.timed("media")
+def download_and_extract(
+    job_id: str,
+    url: str,
+    info: dict | None = None,
+    progress: Callable[[JobStage], None] | None = None,
+    match: Callable[[dict], dict | None] | None = None,
+) -> dict:
+    """Fetch the media and extract what the analyzer needs.
+
+    With ``match``, the first seconds are fingerprinted before extraction;
+    if ``match`` returns a stored result for that fingerprint, it comes back
+    as ``reused`` and nothing else is extracted.
+    """
+    job_dir = disk.job_dir(job_id)
+    job_dir.mkdir(parents=True, exist_ok=True)
+
+    # Format URLs expire, so a probe taken at admission is only reused while fresh.
+    if not info or time.time() - info.get("probed_at", 0) > PROBE_TTL:
+        info = probe(url)
+    check_limits(info)
+
+    duration = info.get("duration") or 0
+
+    title = info.get("title", "Unknown")
+    platform = detect_platform(url)
 
     audio_path = job_dir / "audio.mp3"
-    subprocess.run(
-        [
-            "ffmpeg", "-i", str(video_path),
-            "-q:a", "2", "-map", "a",
-            "-y", str(audio_path),
-        ],
-        capture_output=True,
-        check=True,
-    )
+    scratch = disk.scratch_dir(job_id)
+    frames_dir = scratch / "frames"
+    frames_dir.mkdir(parents=True, exist_ok=True)
 
-    frames_dir = job_dir / "frames"
-    frames_dir.mkdir(exist_ok=True)
-    subprocess.run(
-        [
-            "ffmpeg", "-i", str(video_path),
-            "-vf", f"fps=1/{KEYFRAME_INTERVAL},scale='min(720,iw)':-1",
-            "-q:v", "3",
-            "-y", str(frames_dir / "frame_%03d.jpg"),
-        ],
-        capture_output=True,
-        check=True,
-    )
+    formats = info["formats"]
+    if _streamable(formats):
+        inputs = [(f["url"], f.get("http_headers")) for f in formats]
+        metrics.bytes_downloaded.labels("stream").inc(
+            sum(_est_size(f, duration) for f in formats)
+        )
+    else:
+        inputs = [(path, None) for path in _download_formats(info, formats, job_dir)]
+    # A single input with unknown codecs is treated as muxed.
+    audio_index = next((i for i, f in enumerate(formats) if not _lacks(f, "acodec")), 0)
+    video_index = next((i for i, f in enumerate(formats) if not _lacks(f, "vcodec")), None)
 
-    keyframe_paths = sorted(frames_dir.glob("frame_*.jpg"))
-    if len(keyframe_paths) > MAX_KEYFRAMES:
-        for extra in keyframe_paths[MAX_KEYFRAMES:]:
-            extra.unlink()
-        keyframe_paths = keyframe_paths[:MAX_KEYFRAMES]
+    if progress:
+        progress(JobStage.EXTRACTING)
 
-    return {
-        "audio_path": str(audio_path),
-        "keyframe_paths": [str(p) for p in keyframe_paths],
+    media = {
         "title": title,
         "platform": platform,
         "duration": duration,
+        "extractor_key": info.get("extractor_key"),
+        "id": info.get("id"),
+        "fingerprint": None,
+        "reused": None,
+    }
+    if match and video_index is not None and FINGERPRINT_SECONDS > 0:
+        media["fingerprint"] = fingerprint(inputs, audio_index, video_index, scratch, duration)
+        if media["fingerprint"]:
+            media["reused"] = match(media["fingerprint"])
+        if media["reused"]:
+            logger.info("Job %s matched previously analyzed media", job_id)
+            return {**media, "audio_path": None, "keyframe_paths": [], "segments": None}
+
+    try:
+        keyframes_at = extract_media(
+            inputs, audio_index, video_index, audio_path, frames_dir, duration
+        )
+    except subprocess.CalledProcessError:
+        if video_index is None or _has(formats[video_index], "vcodec"):
+            raise
+        # The codec was unknown and the input turned out to carry no video.
+        keyframes_at = extract_media(
+            inputs, audio_index, None, audio_path, frames_dir, duration
+        )
+
+    # Long videos are analyzed as overlapping windows; see services/segments.py.
+    windows = segments.plan(duration)
+    parts = None
+    if windows:
+        parts = [
+            {
+                "start": start,
+                "end": end,
+                "audio_path": str(path),
+                "keyframe_paths": [str(p) for t, p in keyframes_at if start <= t < end],
+            }
+            for (start, end), path in zip(windows, split_audio(audio_path, windows, job_dir))
+        ]
+
+    return {
+        **media,
+        "audio_path": str(audio_path),
+        "keyframe_paths": [str(p) for _, p in keyframes_at],
+        "segments": parts,
     }
 
 
 def cleanup(job_id: str) -> None:
-    job_dir = Path(TEMP_DIR) / job_id
-    try:
-        if job_dir.exists():
-            shutil.rmtree(job_dir)
-    except Exception as e:
-        logger.warning("Cleanup failed for %s: %s", job_dir, e)
+    for job_dir in disk.job_dirs(job_id):
+        try:
+            if job_dir.exists():
+                shutil.rmtree(job_dir)
+        except Exception as e:
+            logger.warning("Cleanup failed for %s: %s", job_dir, e)
@@ -0,0 +1,112 @@
+import array
+import logging
+import math
+import sys
+
+from config import PHASH_DISTANCE
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 8000
+BLOCK_SECONDS = 0.1
+AUDIO_BITS = 256
+MIN_AUDIO_BITS = 64
+BAND_BITS = 8
+AUDIO_DISTANCE = 0.1
+FRAME_AGREEMENT = 0.6
+DURATION_TOLERANCE = 2.0
+CANDIDATE_LIMIT = 200
+
+
+def audio_bits(pcm: bytes) -> str | None:
+    """Binary string of whether each 100ms block is louder than the one before.
+
+    Taken from mono 16-bit PCM at SAMPLE_RATE. Loudness steps survive
+    re-encoding, resampling and volume changes, which is what a repost does
+    to the audio; a silent or too-short track yields None.
+    """
+    samples = array.array("h")
+    samples.frombytes(pcm[: len(pcm) - len(pcm) % 2])
+    if sys.byteorder != "little":
+        samples.byteswap()
+    block = int(SAMPLE_RATE * BLOCK_SECONDS)
+    energies = [
+        math.fsum(s * s for s in samples[i:i + block])
+        for i in range(0, len(samples) - block + 1, block)
+    ][: AUDIO_BITS + 1]
+    if len(energies) <= MIN_AUDIO_BITS or not any(energies):
+        return None
+    return "".join("1" if b > a else "0" for a, b in zip(energies, energies[1:]))
+
+
+def bands(bits: str) -> list[str]:
+    """Fixed slices of the audio bits; two tracks within the distance share one."""
+    return [
+        f"{i}:{int(bits[start:start + BAND_BITS], 2):02x}"
+        for i, start in enumerate(range(0, len(bits) - BAND_BITS + 1, BAND_BITS))
+    ]
+
+
+def _hamming(a: str, b: str) -> int:
+    return sum(x != y for x, y in zip(a, b))
+
+
+def _frames_agree(a: list[str], b: list[str]) -> bool:
+    pairs = list(zip(a, b))
+    if not pairs:
+        return False
+    close = sum(bin(int(x, 16) ^ int(y, 16)).count("1") <= PHASH_DISTANCE for x, y in pairs)
+    return close >= FRAME_AGREEMENT * len(pairs)
+
+
+def matches(fingerprint: dict, row: dict) -> bool:
+    """Whether ``row`` is the same media as ``fingerprint``.
+
+    Audio alone is not enough (short-video platforms reuse one sound across
+    thousands of unrelated clips), so the frames sampled at the same
+    offsets have to agree as well.
+    """
+    a, b = fingerprint["audio"], row["audio"]
+    if len(a) != len(b) or _hamming(a, b) > AUDIO_DISTANCE * len(a):
+        return False
+    if fingerprint.get("duration") and row.get("duration"):
+        if abs(fingerprint["duration"] - row["duration"]) > DURATION_TOLERANCE:
+            return False
+    return _frames_agree(fingerprint["frames"], row["frames"])
+
+
+def lookup(client, fingerprint: dict) -> str | None:
+    """Id of an analysis stored for the same media, or None."""
+    try:
+        with metrics.timed("fingerprint_lookup"):
+            rows = client.rpc("fingerprint_lookup", {
+                "p_bands": bands(fingerprint["audio"]),
+                "p_limit": CANDIDATE_LIMIT,
+            }).execute().data or []
+    except Exception as e:
+        logger.warning("Fingerprint lookup failed: %s", e)
+        metrics.cache_lookups.labels("fingerprint", "error").inc()
+        return None
+    best = min(
+        (row for row in rows if matches(fingerprint, row)),
+        key=lambda row: _hamming(fingerprint["audio"], row["audio"]),
+        default=None,
+    )
+    metrics.cache_lookups.labels("fingerprint", "hit" if best else "miss").inc()
+    return best["analysis_id"] if best else None
+
+
+def record(client, analysis_id: str, fingerprint: dict) -> None:
+    try:
+        client.rpc("fingerprint_record", {
+            "fingerprint": {
+                "analysis_id": analysis_id,
+                "duration": fingerprint.get("duration"),
+                "audio": fingerprint["audio"],
+                "frames": fingerprint["frames"],
+                "bands": bands(fingerprint["audio"]),
+            },
+        }).execute()
+    except Exception as e:
+        logger.warning("Fingerprint write failed: %s", e)
@@ -0,0 +1,509 @@
+import json
+import logging
+import os
+import socket
+import sqlite3
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+
+from config import (
+    JOB_BACKEND,
+    JOB_LEASE_SECONDS,
+    JOB_MAX_FINISHED,
+    JOB_SLOTS,
+    JOB_TTL,
+    SUPABASE_KEY,
+    SUPABASE_URL,
+)
+from models.schemas import JobStage, JobStatus
+from services.db import pid_alive, session, transaction
+
+logger = logging.getLogger(__name__)
+
+FINISHED = (JobStatus.COMPLETE, JobStatus.FAILED)
+
+# Leader jobs only; followers mirror their leader and are not counted.
+COUNTED = (JobStatus.QUEUED, JobStatus.PROCESSING)
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobState(ABC):
+    """Where job records, the global processing slots and finished results live.
+
+    Jobs for a URL hash that is already queued or processing attach to that
+    job as followers: they are never claimed and mirror their leader's status,
+    stage and results. At most JOB_SLOTS leaders are processing at once across
+    everything that shares the backend.
+    """
+
+    def init(self) -> None:
+        pass
+
+    @abstractmethod
+    def create(
+        self,
+        job_id: str,
+        url: str,
+        user_id: str | None,
+        url_hash: str | None,
+        status: JobStatus,
+        results: dict | None,
+        probe: dict | None,
+    ) -> tuple[JobStatus, str | None]:
+        """Insert a job; returns its starting status and the leader it attached to."""
+
+    @abstractmethod
+    def get(self, job_id: str) -> dict | None:
+        ...
+
+    @abstractmethod
+    def leader(self, url_hash: str) -> str | None:
+        """Id of the queued or processing job new jobs for ``url_hash`` would attach to."""
+
+    @abstractmethod
+    def results(self, url_hash: str) -> dict | None:
+        """Results a finished job stored for ``url_hash``, if still kept."""
+
+    @abstractmethod
+    def set_stage(self, job_id: str, stage: JobStage) -> None:
+        ...
+
+    def renew(self, job_id: str) -> bool:
+        """Extend the lease on a job this process is running.
+
+        Returns False if the job is no longer held by this process. Backends
+        that track the worker's pid instead of a lease have nothing to do.
+        """
+        return True
+
+    @abstractmethod
+    def snapshots(self, job_ids: list[str]) -> dict[str, dict]:
+        ...
+
+    @abstractmethod
+    def finish(
+        self, job_id: str, status: JobStatus, results: dict | None, error: str | None
+    ) -> None:
+        ...
+
+    @abstractmethod
+    def follower_user_ids(self, job_id: str) -> list[str]:
+        ...
+
+    @abstractmethod
+    def claim(self) -> dict | None:
+        """Move the oldest queued job to processing if a slot is free."""
+
+    def requeue_orphans(self) -> int:
+        return 0
+
+    @abstractmethod
+    def counts(self) -> dict[JobStatus, int]:
+        ...
+
+    @abstractmethod
+    def prune(self) -> int:
+        """Evict finished jobs past JOB_TTL or beyond the newest JOB_MAX_FINISHED."""
+
+
+def _job(data: dict | None) -> dict | None:
+    if data is None:
+        return None
+    return {
+        "id": data["id"],
+        "url": data["url"],
+        "url_hash": data["url_hash"],
+        "user_id": data["user_id"],
+        "probe": data["probe"],
+        "status": JobStatus(data["status"]),
+        "stage": JobStage(data["stage"]) if data["stage"] else None,
+        "results": data["results"] if data["status"] == JobStatus.COMPLETE.value else None,
+        "error": data["error"],
+    }
+
+
+def _snapshot(row) -> dict:
+    return {
+        "status": JobStatus(row["status"]),
+        "stage": JobStage(row["stage"]) if row["stage"] else None,
+    }
+
+
+class SQLiteJobState(JobState):
+    """Job state in JOB_DB_PATH, shared by the processes of one host.
+
+    Processing jobs are owned by a worker pid; jobs of dead pids are requeued.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        url TEXT NOT NULL,
+        url_hash TEXT,
+        leader_id TEXT,
+        user_id TEXT,
+        probe TEXT,
+        status TEXT NOT NULL,
+        stage TEXT,
+        results TEXT,
+        error TEXT,
+        worker_pid INTEGER,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS job_results (
+        key TEXT PRIMARY KEY,
+        results TEXT NOT NULL,
+        updated_at TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS job_counters (
+        status TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    );
+    """
+
+    # Columns added after the first release of the table, applied in place.
+    COLUMNS = [
+        ("url_hash", "TEXT"),
+        ("leader_id", "TEXT"),
+        ("probe", "TEXT"),
+        ("stage", "TEXT"),
+    ]
+
+    INDEXES = """
+    CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at);
+    CREATE INDEX IF NOT EXISTS idx_jobs_url_hash ON jobs(url_hash, status);
+    CREATE INDEX IF NOT EXISTS idx_jobs_leader ON jobs(leader_id);
+    CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs(status, updated_at);
+    """
+
+    # Finished jobs keep their result in job_results, shared by every job for
+    # the same URL hash, instead of carrying a private copy.
+    SELECT = (
+        "SELECT j.*, r.results AS shared_results FROM jobs j"
+        " LEFT JOIN job_results r ON r.key = COALESCE(j.url_hash, j.id)"
+    )
+
+    def init(self) -> None:
+        with session() as conn:
+            conn.executescript(self.SCHEMA)
+            existing = {r["name"] for r in conn.execute("PRAGMA table_info(jobs)")}
+            for name, col_type in self.COLUMNS:
+                if name not in existing:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {col_type}")
+            conn.executescript(self.INDEXES)
+            self._recount(conn)
+
+    def _recount(self, conn) -> None:
+        """Rebuild the live counters from the table; they are kept in step afterwards."""
+        with transaction(conn):
+            for status in COUNTED:
+                value = conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = ? AND leader_id IS NULL",
+                    (status.value,),
+                ).fetchone()[0]
+                conn.execute(
+                    "INSERT OR REPLACE INTO job_counters (status, value) VALUES (?, ?)",
+                    (status.value, value),
+                )
+
+    def _count(self, conn, status: JobStatus | str, delta: int) -> None:
+        if JobStatus(status) in COUNTED:
+            conn.execute(
+                "UPDATE job_counters SET value = value + ? WHERE status = ?",
+                (delta, JobStatus(status).value),
+            )
+
+    def _row_to_job(self, row: sqlite3.Row | None) -> dict | None:
+        if row is None:
+            return None
+        results = row["shared_results"] or row["results"]
+        return _job({
+            **dict(row),
+            "probe": json.loads(row["probe"]) if row["probe"] else None,
+            "results": json.loads(results) if results else None,
+        })
+
+    def _store_results(
+        self, conn, key: str, results: dict, now: str, replace: bool = True
+    ) -> None:
+        conn.execute(
+            f"INSERT OR {'REPLACE' if replace else 'IGNORE'} INTO job_results"
+            " (key, results, updated_at) VALUES (?, ?, ?)",
+            (key, json.dumps(results, default=str), now),
+        )
+
+    def create(self, job_id, url, user_id, url_hash, status, results, probe):
+        now = _now()
+        leader_id = None
+        stage = None
+        with session() as conn, transaction(conn):
+            if url_hash and status == JobStatus.QUEUED:
+                row = conn.execute(
+                    "SELECT id, status, stage FROM jobs WHERE url_hash = ? AND leader_id IS NULL"
+                    " AND status IN (?, ?) LIMIT 1",
+                    (url_hash, JobStatus.QUEUED.value, JobStatus.PROCESSING.value),
+                ).fetchone()
+                if row is not None:
+                    leader_id = row["id"]
+                    status = JobStatus(row["status"])
+                    stage = row["stage"]
+            if results:
+                self._store_results(conn, url_hash or job_id, results, now, replace=False)
+            if not leader_id:
+                self._count(conn, status, 1)
+            conn.execute(
+                "INSERT INTO jobs (id, url, url_hash, leader_id, user_id, probe, status,"
+                " stage, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    job_id,
+                    url,
+                    url_hash,
+                    leader_id,
+                    user_id,
+                    json.dumps(probe, default=str) if probe and not leader_id else None,
+                    status.value,
+                    stage,
+                    now,
+                    now,
+                ),
+            )
+        return status, leader_id
+
+    def get(self, job_id):
+        with session() as conn:
+            row = conn.execute(f"{self.SELECT} WHERE j.id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row)
+
+    def leader(self, url_hash):
+        with session() as conn:
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE url_hash = ? AND leader_id IS NULL"
+                " AND status IN (?, ?) LIMIT 1",
+                (url_hash, JobStatus.QUEUED.value, JobStatus.PROCESSING.value),
+            ).fetchone()
+        return row["id"] if row else None
+
+    def results(self, url_hash):
+        with session() as conn:
+            row = conn.execute(
+                "SELECT results FROM job_results WHERE key = ?", (url_hash,)
+            ).fetchone()
+        return json.loads(row["results"]) if row else None
+
+    def set_stage(self, job_id, stage):
+        with session() as conn:
+            conn.execute(
+                "UPDATE jobs SET stage = ?, updated_at = ? WHERE id = ? OR leader_id = ?",
+                (stage.value, _now(), job_id, job_id),
+            )
+
+    def snapshots(self, job_ids):
+        if not job_ids:
+            return {}
+        placeholders = ", ".join("?" * len(job_ids))
+        with session() as conn:
+            rows = conn.execute(
+                f"SELECT id, status, stage FROM jobs WHERE id IN ({placeholders})", job_ids
+            ).fetchall()
+        return {row["id"]: _snapshot(row) for row in rows}
+
+    def finish(self, job_id, status, results, error):
+        now = _now()
+        with session() as conn, transaction(conn):
+            row = conn.execute(
+                "SELECT url_hash, status FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                return
+            if results is not None:
+                self._store_results(conn, row["url_hash"] or job_id, results, now)
+            self._count(conn, row["status"], -1)
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, probe = NULL, worker_pid = NULL,"
+                " updated_at = ? WHERE id = ? OR leader_id = ?",
+                (status.value, error, now, job_id, job_id),
+            )
+
+    def follower_user_ids(self, job_id):
+        with session() as conn:
+            rows = conn.execute(
+                "SELECT DISTINCT user_id FROM jobs WHERE leader_id = ? AND user_id IS NOT NULL",
+                (job_id,),
+            ).fetchall()
+        return [r["user_id"] for r in rows]
+
+    def claim(self):
+        with session() as conn, transaction(conn):
+            active = conn.execute(
+                "SELECT value FROM job_counters WHERE status = ?",
+                (JobStatus.PROCESSING.value,),
+            ).fetchone()
+            if active is not None and active[0] >= JOB_SLOTS:
+                return None
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE status = ? AND leader_id IS NULL"
+                " ORDER BY created_at LIMIT 1",
+                (JobStatus.QUEUED.value,),
+            ).fetchone()
+            if row is None:
+                return None
+            self._count(conn, JobStatus.QUEUED, -1)
+            self._count(conn, JobStatus.PROCESSING, 1)
+            conn.execute(
+                "UPDATE jobs SET status = ?, worker_pid = ?, updated_at = ?"
+                " WHERE id = ? OR leader_id = ?",
+                (JobStatus.PROCESSING.value, os.getpid(), _now(), row["id"], row["id"]),
+            )
+            job = conn.execute(f"{self.SELECT} WHERE j.id = ?", (row["id"],)).fetchone()
+        return self._row_to_job(job)
+
+    def requeue_orphans(self):
+        with session() as conn, transaction(conn):
+            rows = conn.execute(
+                "SELECT id, worker_pid FROM jobs WHERE status = ? AND leader_id IS NULL",
+                (JobStatus.PROCESSING.value,),
+            ).fetchall()
+            orphans = [r["id"] for r in rows if not pid_alive(r["worker_pid"])]
+            for job_id in orphans:
+                self._count(conn, JobStatus.PROCESSING, -1)
+                self._count(conn, JobStatus.QUEUED, 1)
+                conn.execute(
+                    "UPDATE jobs SET status = ?, stage = NULL, worker_pid = NULL, updated_at = ?"
+                    " WHERE id = ? OR leader_id = ?",
+                    (JobStatus.QUEUED.value, _now(), job_id, job_id),
+                )
+        return len(orphans)
+
+    def counts(self):
+        with session() as conn:
+            rows = conn.execute("SELECT status, value FROM job_counters").fetchall()
+        return {JobStatus(r["status"]): r["value"] for r in rows}
+
+    def prune(self):
+        cutoff = (datetime.now(timezone.utc) - timedelta(seconds=JOB_TTL)).isoformat()
+        finished = tuple(s.value for s in FINISHED)
+        with session() as conn, transaction(conn):
+            removed = conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+                (*finished, cutoff),
+            ).rowcount
+            removed += conn.execute(
+                "DELETE FROM jobs WHERE id IN (SELECT id FROM jobs WHERE status IN (?, ?)"
+                " ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+                (*finished, JOB_MAX_FINISHED),
+            ).rowcount
+            if removed:
+                conn.execute(
+                    "DELETE FROM job_results WHERE"
+                    " NOT EXISTS (SELECT 1 FROM jobs WHERE jobs.url_hash = job_results.key)"
+                    " AND NOT EXISTS (SELECT 1 FROM jobs WHERE jobs.id = job_results.key)"
+                )
+        return removed
+
+
+class SupabaseJobState(JobState):
+    """Job state in Postgres through the functions in job_state.sql.
+
+    Lets several API nodes accept, serve and drain the same queue. Processing
+    jobs hold a lease of JOB_LEASE_SECONDS that stage changes and the worker's
+    heartbeat renew; ``job_claim`` requeues jobs whose lease ran out. Needs
+    the service-role key.
+    """
+
+    def __init__(self):
+        self._client = None
+
+    def _rpc(self, name: str, params: dict):
+        if self._client is None:
+            from supabase import create_client
+
+            self._client = create_client(SUPABASE_URL, SUPABASE_KEY)
+        return self._client.rpc(name, params).execute().data
+
+    def create(self, job_id, url, user_id, url_hash, status, results, probe):
+        row = self._rpc("job_create", {
+            "p_id": job_id,
+            "p_url": url,
+            "p_user_id": user_id,
+            "p_url_hash": url_hash,
+            "p_status": status.value,
+            "p_results": json.loads(json.dumps(results, default=str)) if results else None,
+            "p_probe": json.loads(json.dumps(probe, default=str)) if probe else None,
+        })[0]
+        return JobStatus(row["status"]), row["leader_id"]
+
+    def get(self, job_id):
+        return _job(self._rpc("job_get", {"p_id": job_id}))
+
+    def leader(self, url_hash):
+        return self._rpc("job_leader", {"p_url_hash": url_hash})
+
+    def results(self, url_hash):
+        return self._rpc("job_results", {"p_key": url_hash})
+
+    def set_stage(self, job_id, stage):
+        self._rpc("job_set_stage", {
+            "p_id": job_id, "p_stage": stage.value, "p_lease_seconds": JOB_LEASE_SECONDS,
+        })
+
+    def renew(self, job_id):
+        return bool(self._rpc("job_renew", {
+            "p_id": job_id, "p_worker": _worker_id(), "p_lease_seconds": JOB_LEASE_SECONDS,
+        }))
+
+    def snapshots(self, job_ids):
+        if not job_ids:
+            return {}
+        rows = self._rpc("job_snapshots", {"p_ids": job_ids})
+        return {row["id"]: _snapshot(row) for row in rows}
+
+    def finish(self, job_id, status, results, error):
+        self._rpc("job_finish", {
+            "p_id": job_id,
+            "p_status": status.value,
+            "p_results": json.loads(json.dumps(results, default=str)) if results else None,
+            "p_error": error,
+        })
+
+    def follower_user_ids(self, job_id):
+        return [row["user_id"] for row in self._rpc("job_followers", {"p_id": job_id})]
+
+    def claim(self):
+        return _job(self._rpc("job_claim", {
+            "p_worker": _worker_id(),
+            "p_slots": JOB_SLOTS,
+            "p_lease_seconds": JOB_LEASE_SECONDS,
+        }))
+
+    def counts(self):
+        rows = self._rpc("job_counts", {})
+        return {JobStatus(r["status"]): r["value"] for r in rows}
+
+    def prune(self):
+        return self._rpc("job_prune", {
+            "p_ttl_seconds": int(JOB_TTL), "p_max_finished": JOB_MAX_FINISHED,
+        })
+
+
+BACKENDS = {
+    "sqlite": SQLiteJobState,
+    "supabase": SupabaseJobState,
+}
+
+
+def from_config() -> JobState:
+    try:
+        return BACKENDS[JOB_BACKEND]()
+    except KeyError:
+        raise ValueError(
+            f"Unknown JOB_BACKEND {JOB_BACKEND!r}; expected one of {', '.join(BACKENDS)}"
+        ) from None
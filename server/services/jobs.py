@@ -0,0 +1,233 @@
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from typing import Callable
+
+from config import (
+    JOB_HEARTBEAT_INTERVAL,
+    JOB_POLL_INTERVAL,
+    JOB_PRUNE_INTERVAL,
+    JOB_SUPERVISE_INTERVAL,
+    JOB_WORKERS,
+)
+from models.schemas import JobStage, JobStatus
+from services import disk, job_state
+
+logger = logging.getLogger(__name__)
+
+_ctx = multiprocessing.get_context("spawn")
+_wakeup = None
+_workers: list = []
+_handler: Callable | None = None
+_stop = threading.Event()
+_supervisor: threading.Thread | None = None
+
+# Backend selected by JOB_BACKEND; see services/job_state.py.
+state = job_state.from_config()
+
+
+def init_db() -> None:
+    state.init()
+
+
+def create_job(
+    job_id: str,
+    url: str,
+    user_id: str | None,
+    url_hash: str | None = None,
+    status: JobStatus = JobStatus.QUEUED,
+    results: dict | None = None,
+    probe: dict | None = None,
+) -> JobStatus:
+    """Insert a job, attaching it to an in-flight job for the same URL hash.
+
+    Attached jobs are never claimed by a worker; they mirror their leader's
+    status and results. ``results`` are stored once per URL hash. Returns the
+    status the new job starts in.
+    """
+    status, leader_id = state.create(job_id, url, user_id, url_hash, status, results, probe)
+    if leader_id:
+        logger.info("Job %s attached to in-flight job %s", job_id, leader_id)
+    elif status == JobStatus.QUEUED and _wakeup is not None:
+        _wakeup.put(job_id)
+    return status
+
+
+def get_job(job_id: str) -> dict | None:
+    return state.get(job_id)
+
+
+def in_flight(url_hash: str) -> bool:
+    """Whether a job for ``url_hash`` is queued or processing."""
+    return state.leader(url_hash) is not None
+
+
+def shared_results(url_hash: str) -> dict | None:
+    """Results a finished job left for ``url_hash`` in the shared job store."""
+    return state.results(url_hash)
+
+
+def set_stage(job_id: str, stage: JobStage) -> None:
+    state.set_stage(job_id, stage)
+
+
+def snapshots(job_ids: list[str]) -> dict[str, dict]:
+    """Current status and stage of each of ``job_ids`` in one query."""
+    return state.snapshots(job_ids)
+
+
+def complete_job(job_id: str, results: dict) -> None:
+    state.finish(job_id, JobStatus.COMPLETE, results, None)
+
+
+def fail_job(job_id: str, error: str) -> None:
+    state.finish(job_id, JobStatus.FAILED, None, error)
+
+
+def follower_user_ids(job_id: str) -> list[str]:
+    return state.follower_user_ids(job_id)
+
+
+def claim_next() -> dict | None:
+    """Atomically move the oldest queued job to processing for this process."""
+    return state.claim()
+
+
+def requeue_orphans() -> int:
+    """Put jobs whose worker process died back on the queue."""
+    requeued = state.requeue_orphans()
+    if requeued:
+        logger.info("Requeued %d orphaned jobs", requeued)
+    return requeued
+
+
+def queue_depth() -> int:
+    return state.counts().get(JobStatus.QUEUED, 0)
+
+
+def active_count() -> int:
+    return state.counts().get(JobStatus.PROCESSING, 0)
+
+
+def prune() -> int:
+    """Evict finished jobs past JOB_TTL or beyond the newest JOB_MAX_FINISHED.
+
+    Shared results go once no remaining job refers to them.
+    """
+    removed = state.prune()
+    if removed:
+        logger.info("Pruned %d finished jobs", removed)
+    return removed
+
+
+def worker_count() -> int:
+    return sum(proc.is_alive() for proc in _workers)
+
+
+def _heartbeat(job_id: str, done: threading.Event) -> None:
+    """Renew the job's lease while it runs; a single stage can outlast it."""
+    while not done.wait(JOB_HEARTBEAT_INTERVAL):
+        try:
+            if not state.renew(job_id):
+                logger.warning("Lost the lease on job %s", job_id)
+                return
+        except Exception as e:
+            logger.warning("Lease renewal failed for job %s: %s", job_id, e)
+
+
+def _worker_loop(handler: Callable, wakeup) -> None:
+    logging.basicConfig(level=logging.INFO)
+    pruned_at = time.monotonic()
+    while True:
+        try:
+            job = claim_next()
+        except Exception as e:
+            logger.warning("Job claim failed: %s", e)
+            job = None
+        if job is None:
+            if time.monotonic() - pruned_at > JOB_PRUNE_INTERVAL:
+                pruned_at = time.monotonic()
+                try:
+                    prune()
+                except Exception as e:
+                    logger.warning("Job prune failed: %s", e)
+                try:
+                    disk.sweep()
+                except Exception as e:
+                    logger.warning("Temp directory sweep failed: %s", e)
+            try:
+                wakeup.get(timeout=JOB_POLL_INTERVAL)
+            except queue.Empty:
+                pass
+            continue
+        done = threading.Event()
+        threading.Thread(target=_heartbeat, args=(job["id"], done), daemon=True).start()
+        try:
+            handler(job["id"], job["url"], job["user_id"], job["probe"])
+        except Exception as e:
+            # Handlers fail their own jobs; this catches errors in that path
+            # so one bad job cannot take the worker down with it.
+            logger.exception("Job handler crashed on %s", job["id"])
+            try:
+                fail_job(job["id"], str(e))
+            except Exception as fail_error:
+                logger.warning("Could not fail job %s: %s", job["id"], fail_error)
+        finally:
+            done.set()
+
+
+def _spawn() -> None:
+    proc = _ctx.Process(target=_worker_loop, args=(_handler, _wakeup), daemon=True)
+    proc.start()
+    _workers.append(proc)
+
+
+def _supervise() -> None:
+    """Replace workers that exited and requeue the jobs they were holding."""
+    while not _stop.wait(JOB_SUPERVISE_INTERVAL):
+        try:
+            dead = [proc for proc in _workers if not proc.is_alive()]
+            for proc in dead:
+                logger.warning(
+                    "Job worker %s exited with code %s, respawning", proc.pid, proc.exitcode
+                )
+                _workers.remove(proc)
+                proc.join(0)
+                _spawn()
+            requeue_orphans()
+        except Exception:
+            logger.exception("Job supervisor error")
+
+
+def start_workers(handler: Callable) -> None:
+    """Spawn JOB_WORKERS worker processes that drain the job queue.
+
+    Every API process may run its own pool; how many jobs process at once is
+    bounded by JOB_SLOTS across all of them. A supervisor thread respawns
+    workers that die and requeues their jobs every JOB_SUPERVISE_INTERVAL.
+    """
+    global _wakeup, _handler, _supervisor
+    init_db()
+    requeue_orphans()
+    prune()
+    _wakeup = _ctx.Queue()
+    _handler = handler
+    for _ in range(JOB_WORKERS):
+        _spawn()
+    logger.info("Started %d job workers", len(_workers))
+    _stop.clear()
+    _supervisor = threading.Thread(target=_supervise, name="job-supervisor", daemon=True)
+    _supervisor.start()
+
+
+def stop_workers(timeout: float = 5.0) -> None:
+    _stop.set()
+    if _supervisor is not None:
+        _supervisor.join(timeout)
+    for proc in _workers:
+        proc.terminate()
+    for proc in _workers:
+        proc.join(timeout)
+    _workers.clear()
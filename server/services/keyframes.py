@@ -0,0 +1,119 @@
+import logging
+from pathlib import Path
+
+from config import (
+    KEYFRAME_INTERVAL,
+    KEYFRAME_WIDTH,
+    MAX_KEYFRAMES,
+    PHASH_DISTANCE,
+    SCENE_THRESHOLD,
+)
+
+logger = logging.getLogger(__name__)
+
+HASH_W, HASH_H = 9, 8
+SCORES_FILE = "scores.txt"
+HASHES_FILE = "hashes.raw"
+
+
+def filter_graph(video_index: int, duration: float, frames_dir: Path) -> str:
+    """Select scene cuts plus a periodic floor, then fan out to JPEGs and hash thumbnails.
+
+    The floor gap grows with duration so that even a frame-per-gap sampling
+    covers the whole video with about MAX_KEYFRAMES candidates, and scene cuts
+    closer than a quarter gap to the previous pick are ignored.
+    """
+    floor_gap = max(KEYFRAME_INTERVAL, (duration or 0) / MAX_KEYFRAMES)
+    min_gap = floor_gap / 4
+    select = (
+        f"isnan(prev_selected_t)+gte(t-prev_selected_t,{min_gap:.3f})"
+        f"*(gt(scene,{SCENE_THRESHOLD})+gte(t-prev_selected_t,{floor_gap:.3f}))"
+    )
+    scores = frames_dir / SCORES_FILE
+    return (
+        f"[{video_index}:v:0]select='{select}',"
+        f"metadata=mode=print:file={scores},split=2[full][tiny];"
+        f"[full]scale='min({KEYFRAME_WIDTH},iw)':-1[kf];"
+        f"[tiny]scale={HASH_W}:{HASH_H},format=gray[ph]"
+    )
+
+
+def output_args(frames_dir: Path) -> list[str]:
+    return [
+        "-map", "[kf]", "-fps_mode", "vfr", "-q:v", "3",
+        str(frames_dir / "frame_%04d.jpg"),
+        "-map", "[ph]", "-fps_mode", "vfr", "-f", "rawvideo",
+        str(frames_dir / HASHES_FILE),
+    ]
+
+
+def _parse_scores(path: Path) -> list[tuple[float, float]]:
+    frames: list[tuple[float, float]] = []
+    if not path.exists():
+        return frames
+    for line in path.read_text().splitlines():
+        if line.startswith("frame:"):
+            fields = dict(part.split(":", 1) for part in line.split() if ":" in part)
+            frames.append((float(fields.get("pts_time", 0)), 0.0))
+        elif line.startswith("lavfi.scene_score=") and frames:
+            t, _ = frames[-1]
+            frames[-1] = (t, float(line.split("=", 1)[1]))
+    return frames
+
+
+def _dhash(pixels: bytes) -> int:
+    bits = 0
+    for y in range(HASH_H):
+        row = pixels[y * HASH_W:(y + 1) * HASH_W]
+        for x in range(HASH_W - 1):
+            bits = (bits << 1) | (row[x] > row[x + 1])
+    return bits
+
+
+def frame_hashes(path: Path) -> list[int]:
+    if not path.exists():
+        return []
+    data = path.read_bytes()
+    size = HASH_W * HASH_H
+    return [_dhash(data[i:i + size]) for i in range(0, len(data) - size + 1, size)]
+
+
+def select(frames_dir: Path, duration: float) -> list[tuple[float, Path]]:
+    """Keep distinct candidates and spread at most MAX_KEYFRAMES over the duration.
+
+    Returns ``(seconds, path)`` pairs in time order.
+    """
+    paths = sorted(frames_dir.glob("frame_*.jpg"))
+    scores = _parse_scores(frames_dir / SCORES_FILE)
+    hashes = frame_hashes(frames_dir / HASHES_FILE)
+    if len(scores) != len(paths) or len(hashes) != len(paths):
+        logger.warning(
+            "Keyframe metadata mismatch (%d frames, %d scores, %d hashes)",
+            len(paths), len(scores), len(hashes),
+        )
+        step = (duration or 0) / max(len(paths), 1)
+        kept = [(i * step, path) for i, path in enumerate(paths[:MAX_KEYFRAMES])]
+    else:
+        distinct = []
+        seen: list[int] = []
+        for path, (t, score), h in zip(paths, scores, hashes):
+            if any(bin(h ^ other).count("1") <= PHASH_DISTANCE for other in seen):
+                continue
+            seen.append(h)
+            distinct.append((t, score, path))
+
+        span = duration or (distinct[-1][0] + 1 if distinct else 1)
+        buckets: dict[int, tuple[float, float, Path]] = {}
+        for t, score, path in distinct:
+            idx = min(int(t / span * MAX_KEYFRAMES), MAX_KEYFRAMES - 1)
+            if idx not in buckets or score > buckets[idx][1]:
+                buckets[idx] = (t, score, path)
+        kept = [(buckets[i][0], buckets[i][2]) for i in sorted(buckets)]
+
+    keep = {path for _, path in kept}
+    for path in paths:
+        if path not in keep:
+            path.unlink()
+    for name in (SCORES_FILE, HASHES_FILE):
+        (frames_dir / name).unlink(missing_ok=True)
+    return kept
@@ -0,0 +1,217 @@
+import logging
+import time
+
+from config import LEADERBOARD_TTL
+from services.db import session, transaction
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS leaderboard_users (
+    user_id TEXT PRIMARY KEY,
+    display_name TEXT,
+    avatar_url TEXT,
+    current_score INTEGER NOT NULL DEFAULT 0,
+    tree_state TEXT,
+    streak_days INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_leaderboard_users_score
+    ON leaderboard_users(current_score DESC, user_id);
+CREATE TABLE IF NOT EXISTS leaderboard_members (
+    owner_id TEXT NOT NULL,
+    member_id TEXT NOT NULL,
+    PRIMARY KEY (owner_id, member_id)
+);
+CREATE INDEX IF NOT EXISTS idx_leaderboard_members_member
+    ON leaderboard_members(member_id);
+CREATE TABLE IF NOT EXISTS leaderboards (
+    owner_id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    built_at REAL NOT NULL
+);
+"""
+
+# Added after the table first shipped; created on existing databases by _init.
+# ``source`` is the leaderboard_version() a board was built from.
+COLUMNS = (("source", "TEXT"),)
+
+USER_FIELDS = ("display_name", "avatar_url", "current_score", "tree_state", "streak_days")
+
+_ready = False
+
+
+def _init(conn) -> None:
+    global _ready
+    if not _ready:
+        conn.executescript(SCHEMA)
+        existing = {r["name"] for r in conn.execute("PRAGMA table_info(leaderboards)")}
+        for name, col_type in COLUMNS:
+            if name not in existing:
+                conn.execute(f"ALTER TABLE leaderboards ADD COLUMN {name} {col_type}")
+        _ready = True
+
+
+def _etag(owner_id: str, version: int, source: str | None) -> str:
+    if source:
+        return f'W/"{owner_id}-{version}-{source}"'
+    return f'W/"{owner_id}-{version}"'
+
+
+def _fresh(board, source: str | None) -> bool:
+    """Whether a stored board can be served.
+
+    With the database's leaderboard_version() it must have been built from
+    the same version, whatever its age. Without one (leaderboard_versions.sql
+    not installed) boards are trusted for LEADERBOARD_TTL.
+    """
+    if board is None:
+        return False
+    if source is not None:
+        return board["source"] == source
+    return time.time() - board["built_at"] <= LEADERBOARD_TTL
+
+
+def _bump(conn, member_id: str) -> None:
+    """Invalidate the ETag of every leaderboard that includes ``member_id``."""
+    conn.execute(
+        "UPDATE leaderboards SET version = version + 1 WHERE owner_id IN"
+        " (SELECT owner_id FROM leaderboard_members WHERE member_id = ?)",
+        (member_id,),
+    )
+
+
+def etag(owner_id: str, source: str | None = None) -> str | None:
+    """ETag of a fresh leaderboard, or None when it has to be rebuilt."""
+    with session() as conn:
+        _init(conn)
+        row = conn.execute(
+            "SELECT version, built_at, source FROM leaderboards WHERE owner_id = ?", (owner_id,)
+        ).fetchone()
+    if not _fresh(row, source):
+        return None
+    return _etag(owner_id, row["version"], source)
+
+
+def read(owner_id: str, source: str | None = None) -> tuple[list[dict], str] | None:
+    """Ranked entries for ``owner_id`` and their ETag, or None when not built."""
+    with session() as conn:
+        _init(conn)
+        board = conn.execute(
+            "SELECT version, built_at, source FROM leaderboards WHERE owner_id = ?", (owner_id,)
+        ).fetchone()
+        if not _fresh(board, source):
+            return None
+        rows = conn.execute(
+            "SELECT u.* FROM leaderboard_members m"
+            " JOIN leaderboard_users u ON u.user_id = m.member_id"
+            " WHERE m.owner_id = ? ORDER BY u.current_score DESC, u.user_id",
+            (owner_id,),
+        ).fetchall()
+    entries = []
+    for rank, row in enumerate(rows, start=1):
+        entries.append({
+            "user_id": row["user_id"],
+            "display_name": row["display_name"] or "Anon",
+            "avatar_url": row["avatar_url"],
+            "current_score": row["current_score"],
+            "tree_state": row["tree_state"] or "seedling",
+            "streak_days": row["streak_days"],
+            "is_you": row["user_id"] == owner_id,
+            "rank": rank,
+        })
+    return entries, _etag(owner_id, board["version"], source)
+
+
+def build(owner_id: str, entries: list[dict], source: str | None = None) -> str:
+    """Replace ``owner_id``'s leaderboard with freshly loaded entries.
+
+    ``source`` is the leaderboard_version() read before the entries were
+    loaded, so a change that lands meanwhile forces another rebuild.
+    """
+    with session() as conn:
+        _init(conn)
+        with transaction(conn):
+            conn.execute("DELETE FROM leaderboard_members WHERE owner_id = ?", (owner_id,))
+            for entry in entries:
+                _upsert_user(conn, entry["user_id"], entry)
+                conn.execute(
+                    "INSERT OR IGNORE INTO leaderboard_members (owner_id, member_id)"
+                    " VALUES (?, ?)",
+                    (owner_id, entry["user_id"]),
+                )
+            row = conn.execute(
+                "SELECT version FROM leaderboards WHERE owner_id = ?", (owner_id,)
+            ).fetchone()
+            version = row["version"] + 1 if row else 1
+            conn.execute(
+                "INSERT OR REPLACE INTO leaderboards (owner_id, version, built_at, source)"
+                " VALUES (?, ?, ?, ?)",
+                (owner_id, version, time.time(), source),
+            )
+    return _etag(owner_id, version, source)
+
+
+def _upsert_user(conn, user_id: str, fields: dict) -> None:
+    values = {k: fields[k] for k in USER_FIELDS if k in fields}
+    conn.execute("INSERT OR IGNORE INTO leaderboard_users (user_id) VALUES (?)", (user_id,))
+    if values:
+        assignments = ", ".join(f"{k} = ?" for k in values)
+        conn.execute(
+            f"UPDATE leaderboard_users SET {assignments} WHERE user_id = ?",
+            (*values.values(), user_id),
+        )
+
+
+def update_user(user_id: str, **fields) -> None:
+    """Apply a score or profile change to every leaderboard that shows ``user_id``."""
+    try:
+        with session() as conn:
+            _init(conn)
+            with transaction(conn):
+                tracked = conn.execute(
+                    "SELECT 1 FROM leaderboard_users WHERE user_id = ?", (user_id,)
+                ).fetchone()
+                if tracked is None:
+                    return
+                _upsert_user(conn, user_id, fields)
+                _bump(conn, user_id)
+    except Exception as e:
+        logger.warning("Leaderboard update failed for %s: %s", user_id, e)
+
+
+def set_friendship(user_a: str, user_b: str, accepted: bool) -> None:
+    """Add or remove each user from the other's leaderboard.
+
+    A newly added friend whose stats are not tracked yet forces a rebuild of
+    that leaderboard on its next read.
+    """
+    try:
+        with session() as conn:
+            _init(conn)
+            with transaction(conn):
+                for owner_id, member_id in ((user_a, user_b), (user_b, user_a)):
+                    if accepted:
+                        known = conn.execute(
+                            "SELECT 1 FROM leaderboard_users WHERE user_id = ?", (member_id,)
+                        ).fetchone()
+                        if known is None:
+                            conn.execute(
+                                "DELETE FROM leaderboards WHERE owner_id = ?", (owner_id,)
+                            )
+                            continue
+                        conn.execute(
+                            "INSERT OR IGNORE INTO leaderboard_members (owner_id, member_id)"
+                            " VALUES (?, ?)",
+                            (owner_id, member_id),
+                        )
+                    else:
+                        conn.execute(
+                            "DELETE FROM leaderboard_members WHERE owner_id = ? AND member_id = ?",
+                            (owner_id, member_id),
+                        )
+                    conn.execute(
+                        "UPDATE leaderboards SET version = version + 1 WHERE owner_id = ?",
+                        (owner_id,),
+                    )
+    except Exception as e:
+        logger.warning("Leaderboard friendship update failed: %s", e)
@@ -0,0 +1,215 @@
+import logging
+import os
+import threading
+import time
+import uuid
+
+from postgrest.exceptions import APIError
+
+from config import (
+    LEDGER_BATCH_SIZE,
+    LEDGER_FLUSH_INTERVAL,
+    LEDGER_MAX_ATTEMPTS,
+    LEDGER_MAX_BACKOFF,
+)
+from services import leaderboards, metrics
+from services.db import pid_alive, session, transaction
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS score_ledger (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    analysis_id TEXT NOT NULL,
+    points INTEGER NOT NULL,
+    claimed_by INTEGER,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_score_ledger_claimed ON score_ledger(claimed_by, created_at);
+"""
+
+# Added after the table first shipped; created on existing databases by _init.
+# Rows the database keeps rejecting get dead_at set and are never sent again.
+COLUMNS = (
+    ("attempts", "INTEGER NOT NULL DEFAULT 0"),
+    ("dead_at", "REAL"),
+)
+
+# SQLSTATE classes raised by a bad entry (22: malformed value, 23: unknown
+# analysis or user). Anything else, such as a missing function, a permission
+# error or PostgREST being down, says nothing about the entries themselves.
+DATA_ERROR_CLASSES = ("22", "23")
+
+_ready = False
+_stop = threading.Event()
+_flusher: threading.Thread | None = None
+
+
+def _init(conn) -> None:
+    global _ready
+    if not _ready:
+        conn.executescript(SCHEMA)
+        existing = {r["name"] for r in conn.execute("PRAGMA table_info(score_ledger)")}
+        for name, col_type in COLUMNS:
+            if name not in existing:
+                conn.execute(f"ALTER TABLE score_ledger ADD COLUMN {name} {col_type}")
+        _ready = True
+
+
+def record(user_id: str, analysis_id: str, points: int) -> None:
+    """Queue a score increment locally; it reaches Supabase on the next flush."""
+    with session() as conn:
+        _init(conn)
+        conn.execute(
+            "INSERT INTO score_ledger (id, user_id, analysis_id, points, created_at)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (str(uuid.uuid4()), user_id, analysis_id, points, time.time()),
+        )
+
+
+def _claim(limit: int) -> list:
+    pid = os.getpid()
+    with session() as conn:
+        _init(conn)
+        with transaction(conn):
+            stale = conn.execute(
+                "SELECT DISTINCT claimed_by FROM score_ledger WHERE claimed_by IS NOT NULL"
+            ).fetchall()
+            for row in stale:
+                if row["claimed_by"] != pid and not pid_alive(row["claimed_by"]):
+                    conn.execute(
+                        "UPDATE score_ledger SET claimed_by = NULL WHERE claimed_by = ?",
+                        (row["claimed_by"],),
+                    )
+            rows = conn.execute(
+                "SELECT * FROM score_ledger WHERE claimed_by IS NULL AND dead_at IS NULL"
+                " ORDER BY created_at LIMIT ?",
+                (limit,),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE score_ledger SET claimed_by = ? WHERE id = ?",
+                [(pid, row["id"]) for row in rows],
+            )
+    return rows
+
+
+def _release(ids: list[str], applied: bool) -> None:
+    with session() as conn:
+        if applied:
+            conn.executemany("DELETE FROM score_ledger WHERE id = ?", [(i,) for i in ids])
+        else:
+            conn.executemany(
+                "UPDATE score_ledger SET claimed_by = NULL WHERE id = ?", [(i,) for i in ids]
+            )
+
+
+def _reject(row, error: Exception) -> None:
+    """Count a rejection of one entry; past LEDGER_MAX_ATTEMPTS it is dead-lettered."""
+    attempts = row["attempts"] + 1
+    dead = attempts >= LEDGER_MAX_ATTEMPTS
+    with session() as conn:
+        conn.execute(
+            "UPDATE score_ledger SET attempts = ?, dead_at = ?, claimed_by = NULL WHERE id = ?",
+            (attempts, time.time() if dead else None, row["id"]),
+        )
+    if dead:
+        logger.error(
+            "Score entry %s for user %s rejected %d times, dead-lettered: %s",
+            row["id"], row["user_id"], attempts, error,
+        )
+    else:
+        logger.warning("Score entry %s rejected: %s", row["id"], error)
+
+
+def _is_data_error(error: APIError) -> bool:
+    return str(error.code or "")[:2] in DATA_ERROR_CLASSES
+
+
+def _apply(client, rows: list) -> list[dict]:
+    """Send ``rows`` through apply_score_batch; a batch with a bad entry is halved.
+
+    The database rejects a whole batch over one bad entry (an unknown
+    analysis, a malformed user id), so halving isolates those entries while
+    the rest still apply. Other errors propagate without touching attempts,
+    and the whole batch is retried later.
+    """
+    entries = [
+        {
+            "id": row["id"],
+            "user_id": row["user_id"],
+            "analysis_id": row["analysis_id"],
+            "points": row["points"],
+        }
+        for row in rows
+    ]
+    try:
+        response = client.rpc("apply_score_batch", {"entries": entries}).execute()
+    except APIError as e:
+        if not _is_data_error(e):
+            raise
+        if len(rows) == 1:
+            _reject(rows[0], e)
+            return []
+        middle = len(rows) // 2
+        return _apply(client, rows[:middle]) + _apply(client, rows[middle:])
+    _release([row["id"] for row in rows], applied=True)
+    return response.data or []
+
+
+def flush(client, limit: int = LEDGER_BATCH_SIZE) -> int:
+    """Apply one batch of queued increments through apply_score_batch.
+
+    If the batch cannot be applied for a reason other than a bad entry, the
+    entries not yet applied are released unchanged and the error is raised.
+    """
+    rows = _claim(limit)
+    if not rows:
+        return 0
+    try:
+        with metrics.timed("score_flush"):
+            applied = _apply(client, rows)
+    except Exception:
+        _release([row["id"] for row in rows], applied=False)
+        raise
+    for row in applied:
+        leaderboards.update_user(
+            row["user_id"],
+            current_score=row["current_score"],
+            tree_state=row["tree_state"],
+        )
+    return len(rows)
+
+
+def flush_all(client) -> None:
+    while flush(client):
+        pass
+
+
+def _run(client) -> None:
+    delay = LEDGER_FLUSH_INTERVAL
+    while not _stop.wait(delay):
+        try:
+            flush_all(client)
+            delay = LEDGER_FLUSH_INTERVAL
+        except Exception as e:
+            delay = min(delay * 2, LEDGER_MAX_BACKOFF)
+            logger.error("Score flush failed, retrying in %.0fs: %s", delay, e)
+
+
+def start_flusher(client) -> None:
+    global _flusher
+    _stop.clear()
+    _flusher = threading.Thread(target=_run, args=(client,), name="score-ledger", daemon=True)
+    _flusher.start()
+
+
+def stop_flusher(client) -> None:
+    """Stop the background flusher and drain whatever is still queued."""
+    _stop.set()
+    if _flusher is not None:
+        _flusher.join(LEDGER_FLUSH_INTERVAL + 5)
+    try:
+        flush_all(client)
+    except Exception as e:
+        logger.warning("Final score flush failed, entries kept for next start: %s", e)
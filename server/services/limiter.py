@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import os
+import random
+import time
+import uuid
+
+from config import (
+    GEMINI_LATENCY_TARGET,
+    GEMINI_MAX_CONCURRENCY,
+    GEMINI_MIN_CONCURRENCY,
+    MAX_CONCURRENT_JOBS,
+)
+from services.db import pid_alive, session, transaction
+
+logger = logging.getLogger(__name__)
+
+OK = "ok"
+SLOW = "slow"
+THROTTLED = "throttled"
+
+# Multiplicative decrease per congestion signal; increase is +1 per full window.
+DECREASE = {THROTTLED: 0.5, SLOW: 0.9}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS limiter_state (
+    name TEXT PRIMARY KEY,
+    concurrency REAL NOT NULL,
+    latency_ewma REAL
+);
+CREATE TABLE IF NOT EXISTS limiter_slots (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    acquired_at REAL NOT NULL
+);
+"""
+
+
+class AIMDLimiter:
+    """Cross-process concurrency limit that adapts to upstream latency and throttling.
+
+    State lives in the shared SQLite database so every worker process sees
+    the same limit and the same set of held slots.
+    """
+
+    def __init__(self, name: str, initial: float, minimum: float, maximum: float):
+        self.name = name
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self._ready = False
+
+    def _init(self, conn) -> None:
+        if self._ready:
+            return
+        conn.executescript(SCHEMA)
+        conn.execute(
+            "INSERT OR IGNORE INTO limiter_state (name, concurrency) VALUES (?, ?)",
+            (self.name, self.initial),
+        )
+        self._ready = True
+
+    def try_acquire(self) -> str | None:
+        with session() as conn:
+            self._init(conn)
+            with transaction(conn):
+                limit = conn.execute(
+                    "SELECT concurrency FROM limiter_state WHERE name = ?", (self.name,)
+                ).fetchone()["concurrency"]
+                slots = conn.execute(
+                    "SELECT id, pid FROM limiter_slots WHERE name = ?", (self.name,)
+                ).fetchall()
+                held = 0
+                for slot in slots:
+                    if pid_alive(slot["pid"]):
+                        held += 1
+                    else:
+                        conn.execute("DELETE FROM limiter_slots WHERE id = ?", (slot["id"],))
+                if held >= int(limit):
+                    return None
+                slot_id = uuid.uuid4().hex
+                conn.execute(
+                    "INSERT INTO limiter_slots (id, name, pid, acquired_at) VALUES (?, ?, ?, ?)",
+                    (slot_id, self.name, os.getpid(), time.time()),
+                )
+        return slot_id
+
+    async def acquire(self, poll: float = 0.25) -> str:
+        """Wait for a slot without blocking the event loop on the SQLite write lock."""
+        while True:
+            slot_id = await asyncio.to_thread(self.try_acquire)
+            if slot_id:
+                return slot_id
+            await asyncio.sleep(poll * (1 + random.random()))
+
+    async def release(self, slot_id: str, latency: float, outcome: str = OK) -> None:
+        await asyncio.to_thread(self._release, slot_id, latency, outcome)
+
+    def _release(self, slot_id: str, latency: float, outcome: str = OK) -> None:
+        if outcome == OK and latency > GEMINI_LATENCY_TARGET:
+            outcome = SLOW
+        with session() as conn:
+            self._init(conn)
+            with transaction(conn):
+                conn.execute("DELETE FROM limiter_slots WHERE id = ?", (slot_id,))
+                row = conn.execute(
+                    "SELECT concurrency, latency_ewma FROM limiter_state WHERE name = ?",
+                    (self.name,),
+                ).fetchone()
+                limit = row["concurrency"]
+                if outcome in DECREASE:
+                    limit = max(self.minimum, limit * DECREASE[outcome])
+                else:
+                    limit = min(self.maximum, limit + 1 / limit)
+                ewma = row["latency_ewma"]
+                ewma = latency if ewma is None else 0.8 * ewma + 0.2 * latency
+                conn.execute(
+                    "UPDATE limiter_state SET concurrency = ?, latency_ewma = ? WHERE name = ?",
+                    (limit, ewma, self.name),
+                )
+        if outcome != OK:
+            logger.info("%s limit -> %.2f (%s, %.1fs)", self.name, limit, outcome, latency)
+
+    def stats(self) -> dict:
+        with session() as conn:
+            self._init(conn)
+            row = conn.execute(
+                "SELECT concurrency, latency_ewma FROM limiter_state WHERE name = ?",
+                (self.name,),
+            ).fetchone()
+            held = conn.execute(
+                "SELECT COUNT(*) FROM limiter_slots WHERE name = ?", (self.name,)
+            ).fetchone()[0]
+        return {"limit": row["concurrency"], "in_flight": held, "latency_ewma": row["latency_ewma"]}
+
+
+gemini = AIMDLimiter(
+    "gemini",
+    initial=MAX_CONCURRENT_JOBS,
+    minimum=GEMINI_MIN_CONCURRENCY,
+    maximum=GEMINI_MAX_CONCURRENCY,
+)
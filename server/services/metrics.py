@@ -0,0 +1,92 @@
+import glob
+import os
+import time
+from contextlib import contextmanager
+
+from config import METRICS_DIR
+from services.db import pid_alive
+
+# Worker processes record into per-pid files that the API process merges at
+# scrape time, so the directory has to be known before prometheus_client loads.
+os.environ["PROMETHEUS_MULTIPROC_DIR"] = METRICS_DIR
+os.makedirs(METRICS_DIR, exist_ok=True)
+
+from prometheus_client import (  # noqa: E402
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+STAGE_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600,
+)
+
+stage_seconds = Histogram(
+    "yggdrasil_stage_seconds",
+    "Wall time spent in each pipeline stage.",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+stage_errors = Counter(
+    "yggdrasil_stage_errors_total",
+    "Pipeline stages that raised.",
+    ["stage"],
+)
+jobs_finished = Counter(
+    "yggdrasil_jobs_finished_total",
+    "Jobs that reached a terminal state.",
+    ["status"],
+)
+bytes_downloaded = Counter(
+    "yggdrasil_download_bytes_total",
+    "Media bytes fetched from platforms; streamed inputs use the probed size.",
+    ["mode"],
+)
+bytes_to_gemini = Counter(
+    "yggdrasil_gemini_bytes_total",
+    "Media bytes sent to Gemini, by transport.",
+    ["transport"],
+)
+cache_lookups = Counter(
+    "yggdrasil_cache_lookups_total",
+    "Result cache lookups by tier and outcome.",
+    ["tier", "result"],
+)
+claim_lookups = Counter(
+    "yggdrasil_claim_lookups_total",
+    "Claim index lookups by tier and outcome.",
+    ["tier", "result"],
+)
+
+
+@contextmanager
+def timed(stage: str):
+    """Observe the duration of a block (or decorated function) as ``stage``."""
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        stage_errors.labels(stage).inc()
+        raise
+    finally:
+        stage_seconds.labels(stage).observe(time.perf_counter() - started)
+
+
+def reset() -> None:
+    """Drop sample files left behind by processes that are no longer running."""
+    for path in glob.glob(os.path.join(METRICS_DIR, "*.db")):
+        pid = os.path.basename(path).rsplit("_", 1)[-1].split(".", 1)[0]
+        if pid.isdigit() and not pid_alive(int(pid)):
+            os.unlink(path)
+
+
+def render(*collectors) -> tuple[bytes, str]:
+    """Exposition text merged across processes, plus scrape-time ``collectors``."""
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    for collector in collectors:
+        registry.register(collector)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,68 @@
+import asyncio
+import logging
+from typing import AsyncIterator
+
+from config import PROGRESS_HEARTBEAT, PROGRESS_POLL_INTERVAL
+from models.schemas import JobStatus
+from services import jobs
+
+logger = logging.getLogger(__name__)
+
+TERMINAL = (JobStatus.COMPLETE, JobStatus.FAILED)
+
+# job id -> {subscriber queue: last (status, stage) delivered to it}
+_subscribers: dict[str, dict[asyncio.Queue, tuple]] = {}
+_task: asyncio.Task | None = None
+
+
+async def _poll() -> None:
+    """Read every watched job in one query per tick and fan changes out.
+
+    Runs only while someone is subscribed, so the cost is one indexed lookup
+    per interval for the whole process rather than one request per client poll.
+    """
+    while _subscribers:
+        try:
+            current = await asyncio.to_thread(jobs.snapshots, list(_subscribers))
+        except Exception as e:
+            logger.warning("Progress poll failed: %s", e)
+            current = {}
+        for job_id, snapshot in current.items():
+            key = (snapshot["status"], snapshot["stage"])
+            for queue, last in list(_subscribers.get(job_id, {}).items()):
+                if last != key:
+                    _subscribers[job_id][queue] = key
+                    queue.put_nowait(snapshot)
+        await asyncio.sleep(PROGRESS_POLL_INTERVAL)
+
+
+def _ensure_poller() -> None:
+    global _task
+    if _task is None or _task.done():
+        _task = asyncio.get_running_loop().create_task(_poll())
+
+
+async def watch(job_id: str, status: JobStatus, stage) -> AsyncIterator[dict | None]:
+    """Yield ``{"status", "stage"}`` whenever the job moves on from ``(status, stage)``.
+
+    Yields None after PROGRESS_HEARTBEAT seconds without a change so callers
+    can keep the connection alive, and stops after a terminal status.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    subscribers = _subscribers.setdefault(job_id, {})
+    subscribers[queue] = (status, stage)
+    _ensure_poller()
+    try:
+        while True:
+            try:
+                snapshot = await asyncio.wait_for(queue.get(), PROGRESS_HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield None
+                continue
+            yield snapshot
+            if snapshot["status"] in TERMINAL:
+                return
+    finally:
+        subscribers.pop(queue, None)
+        if not subscribers and _subscribers.get(job_id) is subscribers:
+            del _subscribers[job_id]
@@ -0,0 +1,140 @@
+import math
+import re
+from collections import Counter
+
+from config import SEGMENT_LENGTH, SEGMENT_OVERLAP, SEGMENT_THRESHOLD
+
+_TIMESTAMP = re.compile(r"(\d+):(\d{1,2})(?::(\d{1,2}))?")
+_WORD = re.compile(r"[\w']+")
+
+
+def plan(duration: float) -> list[tuple[float, float]]:
+    """Overlapping ``(start, end)`` windows for a video, or [] when it is short.
+
+    Windows are about SEGMENT_LENGTH long, share SEGMENT_OVERLAP seconds with
+    their neighbour, and are evened out so the last one is not a sliver.
+    """
+    if not duration or duration <= SEGMENT_THRESHOLD:
+        return []
+    stride = SEGMENT_LENGTH - SEGMENT_OVERLAP
+    count = max(1, math.ceil((duration - SEGMENT_OVERLAP) / stride))
+    length = (duration + (count - 1) * SEGMENT_OVERLAP) / count
+    windows = []
+    for i in range(count):
+        start = i * (length - SEGMENT_OVERLAP)
+        windows.append((round(start, 3), round(min(start + length, duration), 3)))
+    return windows
+
+
+def _seconds(match: re.Match) -> int:
+    a, b, c = match.groups()
+    if c is None:
+        return int(a) * 60 + int(b)
+    return int(a) * 3600 + int(b) * 60 + int(c)
+
+
+def parse_timestamp(value: str | None) -> float | None:
+    if not value or not isinstance(value, str):
+        return None
+    match = _TIMESTAMP.search(value)
+    return _seconds(match) if match else None
+
+
+def format_timestamp(seconds: float) -> str:
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{secs:02d}"
+    return f"{minutes}:{secs:02d}"
+
+
+def rebase(value: str | None, offset: float) -> str | None:
+    """Shift segment-relative "M:SS" timestamps to the full video's timeline.
+
+    Every timestamp in ``value`` is shifted, so a range such as "0:30-0:45"
+    keeps both ends; any other text is left as it was.
+    """
+    if not value or not isinstance(value, str):
+        return value
+    return _TIMESTAMP.sub(lambda match: format_timestamp(_seconds(match) + offset), value)
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(_WORD.findall(text.lower()))
+
+
+def _join_transcripts(parts: list[str]) -> str:
+    """Concatenate window transcripts, dropping text repeated across an overlap."""
+    joined: list[str] = []
+    for text in parts:
+        words = text.split()
+        if joined and words:
+            tail = [w.lower().strip(".,!?\"'") for w in joined[-80:]]
+            head = [w.lower().strip(".,!?\"'") for w in words[:80]]
+            for k in range(min(len(tail), len(head)), 2, -1):
+                if tail[-k:] == head[:k]:
+                    words = words[k:]
+                    break
+        joined.extend(words)
+    return " ".join(joined)
+
+
+def _position(item: dict) -> float:
+    """Sort key on the full timeline; items without a readable timestamp go last."""
+    seconds = parse_timestamp(item.get("timestamp"))
+    return math.inf if seconds is None else seconds
+
+
+def _confidence(claim: dict) -> float:
+    try:
+        return float(claim.get("confidence") or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def merge(windows: list[tuple[float, float]], parts: list[dict]) -> dict:
+    """Combine per-window analyses into one result dict on the full timeline.
+
+    Claims and misleading visuals are re-based by their window's start; the
+    same claim seen in two overlapping windows keeps its most confident copy.
+    The overall bias is the label most of the non-neutral video leans to,
+    weighted by window length.
+    """
+    claims: dict[str, dict] = {}
+    visuals: dict[tuple, dict] = {}
+    tactics: dict[str, None] = {}
+    bias = Counter()
+    informational = False
+    for (start, end), part in zip(windows, parts):
+        for claim in part.get("claims") or []:
+            claim = {**claim, "timestamp": rebase(claim.get("timestamp"), start)}
+            key = normalize_text(claim.get("claim", ""))
+            if key not in claims or _confidence(claim) > _confidence(claims[key]):
+                claims[key] = claim
+        analysis = part.get("bias_analysis") or {}
+        for visual in analysis.get("misleading_visuals") or []:
+            visual = {**visual, "timestamp": rebase(visual.get("timestamp"), start)}
+            visuals.setdefault((visual["timestamp"], visual.get("description")), visual)
+        for tactic in analysis.get("manipulation_tactics") or []:
+            tactics.setdefault(tactic, None)
+        label = analysis.get("overall_bias") or "none"
+        if label != "none":
+            bias[label] += end - start
+        informational = informational or part.get("content_type") == "informational"
+
+    ordered = sorted(claims.values(), key=_position)
+    first = parts[0] if parts else {}
+    return {
+        "title": first.get("title", ""),
+        "summary": " ".join(p.get("summary", "") for p in parts if p.get("summary")),
+        "transcript": _join_transcripts([p.get("transcript", "") for p in parts]),
+        "claims": ordered,
+        "perspectives": first.get("perspectives", {}),
+        "bias_analysis": {
+            "overall_bias": bias.most_common(1)[0][0] if bias else "none",
+            "manipulation_tactics": list(tactics),
+            "misleading_visuals": sorted(visuals.values(), key=_position),
+        },
+        "content_type": "informational" if informational else "entertainment",
+    }
@@ -0,0 +1,93 @@
+import hashlib
+import logging
+import time
+from pathlib import Path
+from typing import Iterator
+
+import httpx
+
+from config import GEMINI_API_BASE, GEMINI_API_KEY, UPLOAD_CHUNK_BYTES, UPLOAD_HANDLE_TTL
+from services import metrics
+from services.lru import MISSING, TTLCache
+
+logger = logging.getLogger(__name__)
+
+_http = httpx.Client(base_url=GEMINI_API_BASE, timeout=httpx.Timeout(60.0, connect=10.0))
+
+# content sha256 -> file part; the Files API keeps uploads for 48 hours.
+_handles = TTLCache(4096, 4 * 1024 * 1024, UPLOAD_HANDLE_TTL)
+
+
+def _chunks(path: Path) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        while chunk := f.read(UPLOAD_CHUNK_BYTES):
+            yield chunk
+
+
+def file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    for chunk in _chunks(path):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _wait_active(file: dict, timeout: float = 60.0) -> dict:
+    deadline = time.monotonic() + timeout
+    while file.get("state") == "PROCESSING":
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Upload {file['name']} still processing")
+        time.sleep(1)
+        response = _http.get(f"/v1beta/{file['name']}", params={"key": GEMINI_API_KEY})
+        response.raise_for_status()
+        file = response.json()
+    if file.get("state") == "FAILED":
+        raise RuntimeError(f"Upload {file['name']} failed server-side processing")
+    return file
+
+
+def upload(path: str, mime_type: str) -> dict:
+    """Upload a file through the resumable Files API protocol, streaming from disk.
+
+    Returns a ``file_data`` content part. Identical content uploaded earlier
+    by this process is reused instead of being sent again.
+    """
+    path = Path(path)
+    digest = file_hash(path)
+    cached = _handles.get(digest)
+    if cached is not MISSING:
+        return cached
+    with metrics.timed("upload"):
+        part = _upload(path, mime_type, digest)
+    metrics.bytes_to_gemini.labels("upload").inc(path.stat().st_size)
+    _handles.put(digest, part)
+    return part
+
+
+def _upload(path: Path, mime_type: str, digest: str) -> dict:
+    start = _http.post(
+        "/upload/v1beta/files",
+        params={"key": GEMINI_API_KEY},
+        headers={
+            "X-Goog-Upload-Protocol": "resumable",
+            "X-Goog-Upload-Command": "start",
+            "X-Goog-Upload-Header-Content-Length": str(path.stat().st_size),
+            "X-Goog-Upload-Header-Content-Type": mime_type,
+        },
+        json={"file": {"display_name": f"{digest[:16]}{path.suffix}"}},
+    )
+    start.raise_for_status()
+    upload_url = start.headers["X-Goog-Upload-URL"]
+
+    response = _http.post(
+        upload_url,
+        headers={
+            "Content-Length": str(path.stat().st_size),
+            "X-Goog-Upload-Offset": "0",
+            "X-Goog-Upload-Command": "upload, finalize",
+        },
+        content=_chunks(path),
+    )
+    response.raise_for_status()
+    file = _wait_active(response.json()["file"])
+
+    return {"file_data": {"mime_type": file.get("mimeType", mime_type), "file_uri": file["uri"]}}
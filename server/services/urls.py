@@ -0,0 +1,118 @@
+import re
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+
+PLATFORM_MAP = {
+    "youtube.com": "youtube",
+    "youtu.be": "youtube",
+    "instagram.com": "instagram",
+    "tiktok.com": "tiktok",
+    "twitter.com": "twitter",
+    "x.com": "twitter",
+    "facebook.com": "facebook",
+    "fb.watch": "facebook",
+    "reddit.com": "reddit",
+}
+
+# Path/query patterns that pin down a video id, tried in order per platform.
+# Short links that only resolve through a redirect (vm.tiktok.com, fb.watch)
+# are left to the yt-dlp fallback.
+_ID_RULES: dict[str, list[re.Pattern]] = {
+    "youtube": [
+        re.compile(r"^/(?:shorts|embed|live|v|e)/([A-Za-z0-9_-]{11})"),
+        re.compile(r"^/([A-Za-z0-9_-]{11})/?$"),
+    ],
+    "instagram": [
+        re.compile(r"^/(?:[\w.]+/)?(?:p|reels?|tv)/([A-Za-z0-9_-]+)"),
+    ],
+    "tiktok": [
+        re.compile(r"^/@[^/]+/(?:video|photo)/(\d+)"),
+        re.compile(r"^/(?:v|embed(?:/v2)?)/(\d+)"),
+    ],
+    "twitter": [
+        re.compile(r"^/(?:[^/]+|i(?:/web)?)/status(?:es)?/(\d+)"),
+    ],
+    "facebook": [
+        re.compile(r"^/(?:[^/]+/)?videos/(?:[^/]+/)?(\d+)"),
+        re.compile(r"^/reel/(\d+)"),
+    ],
+    "reddit": [
+        re.compile(r"^/(?:r/[^/]+/)?comments/([a-z0-9]+)"),
+    ],
+}
+
+_YOUTUBE_ID = re.compile(r"^[A-Za-z0-9_-]{11}$")
+
+TRACKING_PARAMS = {"si", "feature", "fbclid", "gclid", "igshid", "igsh", "ref", "ref_src", "s"}
+
+
+def detect_platform(url: str) -> str:
+    hostname = urlparse(url).hostname or ""
+    for domain, platform in PLATFORM_MAP.items():
+        if hostname == domain or hostname.endswith("." + domain):
+            return platform
+    return "other"
+
+
+def _query_id(platform: str, query: dict) -> str | None:
+    if platform == "youtube" and _YOUTUBE_ID.match(query.get("v", "")):
+        return query["v"]
+    if platform == "facebook" and query.get("v", "").isdigit():
+        return query["v"]
+    return None
+
+
+def canonicalize(url: str) -> tuple[str, str] | None:
+    """Return ``(platform, video_id)`` when the URL alone identifies the video."""
+    parsed = urlparse(url if "://" in url else f"https://{url}")
+    platform = detect_platform(parsed.geturl())
+    if platform == "other":
+        return None
+
+    video_id = _query_id(platform, dict(parse_qsl(parsed.query)))
+    if video_id:
+        return platform, video_id
+
+    path = parsed.path
+    if platform == "youtube" and parsed.hostname == "youtu.be":
+        path = "/" + path.lstrip("/").split("/", 1)[0]
+    elif platform == "youtube" and not path.startswith(
+        ("/shorts/", "/embed/", "/live/", "/v/", "/e/")
+    ):
+        return None
+
+    for rule in _ID_RULES[platform]:
+        match = rule.match(path)
+        if match:
+            return platform, match.group(1)
+    return None
+
+
+def normalize(url: str) -> str:
+    """Strip fragments, tracking params and host aliases from a URL."""
+    parsed = urlparse(url.strip() if "://" in url else f"https://{url.strip()}")
+    host = (parsed.hostname or "").lower()
+    for prefix in ("www.", "m.", "mobile."):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+            break
+    query = sorted(
+        (k, v)
+        for k, v in parse_qsl(parsed.query, keep_blank_values=True)
+        if k not in TRACKING_PARAMS and not k.startswith("utm_")
+    )
+    return urlunparse(("https", host, parsed.path.rstrip("/"), "", urlencode(query), ""))
+
+
+def canonical_key(url: str, info: dict | None = None) -> str:
+    """Stable cache key for a video link.
+
+    Uses the platform pattern rules first, then the yt-dlp ``extractor_key``
+    and ``id`` from a probe when one is available, and finally the normalized
+    URL.
+    """
+    ident = canonicalize(url)
+    if ident:
+        return f"{ident[0]}:{ident[1]}"
+    if info and info.get("extractor_key") and info.get("id"):
+        return f"{info['extractor_key'].lower()}:{info['id']}"
+    return normalize(url)
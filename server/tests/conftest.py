@@ -0,0 +1,16 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Tests import the server modules the way main.py does, with server/ on the
+# path, and keep every node-local file in a throwaway directory.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+_state = Path(tempfile.mkdtemp(prefix="yggdrasil-tests-"))
+os.environ.setdefault("JOB_DB_PATH", str(_state / "jobs.db"))
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", str(_state / "metrics"))
+os.environ.setdefault("TEMP_DIR", str(_state / "media"))
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "test.test.test")
+os.environ.setdefault("GEMINI_API_KEY", "test")
@@ -0,0 +1,68 @@
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+from models.schemas import JobStatus
+from services import cache, jobs
+
+RESULT = {"title": "Stored", "summary": "", "claims": []}
+
+
+class EmptyTable:
+    """video_analyses with nothing in it; counts lookups."""
+
+    def __init__(self):
+        self.lookups = 0
+
+    def table(self, name):
+        return self
+
+    def select(self, *args):
+        return self
+
+    def eq(self, *args):
+        return self
+
+    def limit(self, *args):
+        return self
+
+    def execute(self):
+        self.lookups += 1
+        return SimpleNamespace(data=[])
+
+
+@pytest.fixture
+def supabase(monkeypatch):
+    client = EmptyTable()
+    monkeypatch.setattr(cache, "_client", client)
+    jobs.init_db()
+    return client
+
+
+def _url() -> str:
+    return f"https://example.com/video/{uuid.uuid4().hex}"
+
+
+def test_remembered_miss_yields_to_a_result_finished_elsewhere(supabase):
+    url = _url()
+    assert cache.get_cached(url) is None
+    assert cache.get_cached(url) is None
+    assert supabase.lookups == 1
+
+    # Another process finishes the job and stores its result in the job store.
+    job_id = uuid.uuid4().hex
+    jobs.create_job(job_id, url, None, url_hash=cache.url_hash(url))
+    jobs.complete_job(job_id, RESULT)
+
+    assert cache.get_cached(url) == RESULT
+    assert supabase.lookups == 1
+
+
+def test_miss_is_not_remembered_while_a_job_is_in_flight(supabase):
+    url = _url()
+    jobs.create_job(uuid.uuid4().hex, url, None, url_hash=cache.url_hash(url))
+    assert jobs.in_flight(cache.url_hash(url))
+    assert cache.get_cached(url) is None
+    assert cache.get_cached(url) is None
+    assert supabase.lookups == 2
@@ -0,0 +1,119 @@
+import os
+import time
+import uuid
+
+import pytest
+
+from services import disk
+
+
+@pytest.fixture(autouse=True)
+def clean(monkeypatch):
+    monkeypatch.setattr(disk, "TEMP_DISK_BUDGET", 1000)
+    monkeypatch.setattr(disk, "TEMP_DISK_HEADROOM", 0)
+    monkeypatch.setattr(disk, "TEMP_DISK_WAIT", 0)
+    monkeypatch.setattr(disk, "_free_bytes", lambda path: 10_000)
+    yield
+    with disk.session() as conn:
+        disk._init(conn)
+        conn.execute("DELETE FROM disk_reservations")
+
+
+def _job() -> str:
+    return uuid.uuid4().hex
+
+
+def test_reserve_within_budget_and_release():
+    job = _job()
+    disk.reserve(job, 600)
+    assert disk.reserved_bytes() == 600
+    disk.release(job)
+    assert disk.reserved_bytes() == 0
+
+
+def test_reservations_share_the_budget():
+    first, second = _job(), _job()
+    disk.reserve(first, 600)
+    assert not disk._try_reserve(second, 600)
+    with pytest.raises(RuntimeError, match="short of temporary disk"):
+        disk.reserve(second, 600)
+    disk.release(first)
+    disk.reserve(second, 600)
+
+
+def test_rereserving_a_job_replaces_its_reservation():
+    job = _job()
+    disk.reserve(job, 600)
+    disk.reserve(job, 900)
+    assert disk.reserved_bytes() == 900
+
+
+def test_over_budget_is_refused_outright():
+    with pytest.raises(RuntimeError, match="over the"):
+        disk.reserve(_job(), 1001)
+    assert disk.reserved_bytes() == 0
+
+
+def test_free_space_counts_only_unwritten_reservations(monkeypatch):
+    monkeypatch.setattr(disk, "_free_bytes", lambda path: 700)
+    first = _job()
+    disk.reserve(first, 500)
+    assert not disk._try_reserve(_job(), 300)
+    # Once the first job has written its bytes they are already gone from the
+    # free space, so only the new reservation has to fit.
+    monkeypatch.setattr(disk, "_written", lambda path: 500 if path.name == first else 0)
+    assert disk._try_reserve(_job(), 300)
+
+
+def test_reservations_of_dead_processes_are_dropped():
+    with disk.session() as conn:
+        disk._init(conn)
+        conn.execute(
+            "INSERT INTO disk_reservations (job_id, bytes, pid, created_at) VALUES (?, ?, ?, ?)",
+            (_job(), 1000, 2**22 + 1, time.time()),
+        )
+    disk.reserve(_job(), 600)
+    assert disk.reserved_bytes() == 600
+
+
+def _make(name: str, age: float = disk.ORPHAN_GRACE * 2):
+    path = disk._jobs_root(disk.TEMP_DIR) / name
+    path.mkdir(parents=True)
+    stamp = time.time() - age
+    os.utime(path, (stamp, stamp))
+    return path
+
+
+def test_sweep_removes_only_stale_unreserved_job_dirs():
+    stale, recent, reserved = _job(), _job(), _job()
+    for name in (stale, reserved, "not-a-job"):
+        _make(name)
+    _make(recent, age=0)
+    disk.reserve(reserved, 10)
+
+    assert disk.sweep() == 1
+    root = disk._jobs_root(disk.TEMP_DIR)
+    assert not (root / stale).exists()
+    for name in (recent, reserved, "not-a-job"):
+        assert (root / name).is_dir()
+        os.rmdir(root / name)
+
+
+def test_sweep_skips_dirs_that_vanish_while_listing(monkeypatch):
+    gone, stale = _job(), _job()
+    _make(gone)
+    _make(stale)
+    root = disk._jobs_root(disk.TEMP_DIR)
+    scandir = os.scandir
+
+    def racing_scandir(path, *args):
+        if path != root:
+            return scandir(path, *args)
+        # The job finishes and removes its directory right after the listing.
+        entries = list(scandir(path))
+        os.rmdir(root / gone)
+        return iter(entries)
+
+    monkeypatch.setattr(disk.os, "scandir", racing_scandir)
+    assert disk.sweep() == 1
+    assert not (root / stale).exists()
@@ -0,0 +1,38 @@
+import pytest
+
+from services import leaderboards
+
+ENTRIES = [
+    {"user_id": "a", "display_name": "A", "current_score": 10, "tree_state": "seedling"},
+    {"user_id": "b", "display_name": "B", "current_score": 20, "tree_state": "sapling"},
+]
+
+
+@pytest.fixture(autouse=True)
+def empty_boards():
+    with leaderboards.session() as conn:
+        leaderboards._init(conn)
+        conn.execute("DELETE FROM leaderboards")
+
+
+def test_board_is_served_while_the_database_version_matches(monkeypatch):
+    tag = leaderboards.build("a", ENTRIES, "v1")
+    monkeypatch.setattr(leaderboards, "LEADERBOARD_TTL", 0)
+    assert leaderboards.etag("a", "v1") == tag
+    entries, read_tag = leaderboards.read("a", "v1")
+    assert read_tag == tag
+    assert [e["user_id"] for e in entries] == ["b", "a"]
+
+
+def test_board_is_rebuilt_when_the_database_version_moves():
+    leaderboards.build("a", ENTRIES, "v1")
+    assert leaderboards.etag("a", "v2") is None
+    assert leaderboards.read("a", "v2") is None
+
+
+def test_without_a_version_boards_expire_after_the_ttl(monkeypatch):
+    tag = leaderboards.build("a", ENTRIES)
+    assert leaderboards.etag("a") == tag
+    monkeypatch.setattr(leaderboards, "LEADERBOARD_TTL", -1)
+    assert leaderboards.etag("a") is None
+    assert leaderboards.read("a") is None
@@ -0,0 +1,108 @@
+import uuid
+
+import pytest
+from postgrest.exceptions import APIError
+
+from config import LEDGER_MAX_ATTEMPTS
+from services import ledger
+from services.db import session
+
+BAD_USER = "not-a-uuid"
+
+
+class _Call:
+    def __init__(self, client, params):
+        self.client = client
+        self.params = params
+
+    def execute(self):
+        return self.client.execute(self.params)
+
+
+class FakeClient:
+    """apply_score_batch that rejects any batch holding BAD_USER, or every batch with ``error``."""
+
+    def __init__(self, error: dict | None = None):
+        self.error = error
+        self.calls = 0
+        self.applied = []
+
+    def rpc(self, name, params):
+        assert name == "apply_score_batch"
+        return _Call(self, params)
+
+    def execute(self, params):
+        self.calls += 1
+        if self.error:
+            raise APIError(self.error)
+        entries = params["entries"]
+        if any(entry["user_id"] == BAD_USER for entry in entries):
+            raise APIError({"code": "22P02", "message": "invalid input syntax for type uuid"})
+        self.applied.extend(entry["id"] for entry in entries)
+
+        class Response:
+            data = [
+                {"user_id": entry["user_id"], "current_score": 1, "tree_state": "seedling"}
+                for entry in entries
+            ]
+        return Response()
+
+
+@pytest.fixture(autouse=True)
+def empty_ledger(monkeypatch):
+    with session() as conn:
+        ledger._init(conn)
+        conn.execute("DELETE FROM score_ledger")
+    monkeypatch.setattr(ledger.leaderboards, "update_user", lambda *a, **k: None)
+
+
+def _record(count: int, bad: int | None = None) -> None:
+    for i in range(count):
+        user = BAD_USER if i == bad else str(uuid.uuid4())
+        ledger.record(user, "analysis", 1)
+
+
+def _rows() -> list:
+    with session() as conn:
+        return conn.execute("SELECT * FROM score_ledger").fetchall()
+
+
+def test_bad_entry_is_isolated_and_the_rest_apply():
+    _record(20, bad=7)
+    client = FakeClient()
+    assert ledger.flush(client) == 20
+    assert len(client.applied) == 19
+    rows = _rows()
+    assert len(rows) == 1
+    assert rows[0]["user_id"] == BAD_USER
+    assert rows[0]["attempts"] == 1
+    assert rows[0]["claimed_by"] is None
+    assert rows[0]["dead_at"] is None
+
+
+def test_bad_entry_is_dead_lettered_after_max_attempts():
+    _record(1, bad=0)
+    client = FakeClient()
+    for _ in range(LEDGER_MAX_ATTEMPTS):
+        ledger.flush(client)
+    rows = _rows()
+    assert rows[0]["attempts"] == LEDGER_MAX_ATTEMPTS
+    assert rows[0]["dead_at"] is not None
+    assert ledger.flush(client) == 0
+
+
+@pytest.mark.parametrize("error", [
+    {"code": "PGRST202", "message": "Could not find the function"},
+    {"code": "42501", "message": "permission denied"},
+    {"message": "502 Bad Gateway"},
+])
+def test_systemic_error_releases_the_batch_untouched(error):
+    _record(20, bad=7)
+    client = FakeClient(error)
+    with pytest.raises(APIError):
+        ledger.flush(client)
+    assert client.calls == 1
+    rows = _rows()
+    assert len(rows) == 20
+    assert all(row["attempts"] == 0 for row in rows)
+    assert all(row["claimed_by"] is None and row["dead_at"] is None for row in rows)
@@ -0,0 +1,66 @@
+from services import segments
+
+
+def test_rebase_shifts_every_timestamp():
+    assert segments.rebase("0:30-0:45", 60) == "1:30-1:45"
+    assert segments.rebase("at 59:50", 20) == "at 1:00:10"
+
+
+def test_rebase_leaves_other_values_alone():
+    assert segments.rebase("throughout", 60) == "throughout"
+    assert segments.rebase(None, 60) is None
+    assert segments.rebase("", 60) == ""
+    assert segments.rebase(30, 60) == 30
+
+
+def test_parse_timestamp():
+    assert segments.parse_timestamp("1:02:03") == 3723
+    assert segments.parse_timestamp("2:05") == 125
+    assert segments.parse_timestamp("N/A") is None
+    assert segments.parse_timestamp(None) is None
+
+
+def test_merge_orders_claims_without_readable_timestamps_last():
+    windows = [(0, 180), (170, 350)]
+    parts = [
+        {"claims": [
+            {"claim": "Water boils at 100C", "timestamp": "throughout"},
+            {"claim": "The moon is made of cheese", "timestamp": "0:40"},
+        ]},
+        {"claims": [
+            {"claim": "Paris is in France", "timestamp": "0:10"},
+            {"claim": "Cats are mammals", "timestamp": "N/A"},
+            {"claim": "Dogs bark", "timestamp": None},
+            {"claim": "Fish swim"},
+        ]},
+    ]
+    merged = segments.merge(windows, parts)
+    texts = [c["claim"] for c in merged["claims"]]
+    assert texts[:2] == ["The moon is made of cheese", "Paris is in France"]
+    assert merged["claims"][1]["timestamp"] == "3:00"
+    assert set(texts[2:]) == {"Water boils at 100C", "Cats are mammals", "Dogs bark", "Fish swim"}
+
+
+def test_merge_keeps_most_confident_copy_with_null_confidence():
+    windows = [(0, 180), (170, 350)]
+    parts = [
+        {"claims": [{"claim": "Paris is in France", "timestamp": "2:55", "confidence": None}]},
+        {"claims": [{"claim": "Paris is in France.", "timestamp": "0:05", "confidence": 0.9}]},
+    ]
+    merged = segments.merge(windows, parts)
+    assert len(merged["claims"]) == 1
+    assert merged["claims"][0]["confidence"] == 0.9
+
+    parts.reverse()
+    merged = segments.merge(windows, parts)
+    assert merged["claims"][0]["confidence"] == 0.9
+
+
+def test_merge_sorts_visuals_without_timestamps_last():
+    windows = [(0, 180), (170, 350)]
+    parts = [
+        {"bias_analysis": {"misleading_visuals": [{"description": "chart", "timestamp": "null"}]}},
+        {"bias_analysis": {"misleading_visuals": [{"description": "crop", "timestamp": "0:20"}]}},
+    ]
+    visuals = segments.merge(windows, parts)["bias_analysis"]["misleading_visuals"]
+    assert [v["description"] for v in visuals] == ["crop", "chart"]
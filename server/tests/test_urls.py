@@ -0,0 +1,76 @@
+import pytest
+
+from services.urls import canonical_key, canonicalize, detect_platform, normalize
+
+
+@pytest.mark.parametrize(
+    "url, platform",
+    [
+        ("https://www.youtube.com/watch?v=dQw4w9WgXcQ", "youtube"),
+        ("https://youtu.be/dQw4w9WgXcQ", "youtube"),
+        ("https://m.youtube.com/shorts/dQw4w9WgXcQ", "youtube"),
+        ("https://x.com/someone/status/123", "twitter"),
+        ("https://vm.tiktok.com/ZMabc/", "tiktok"),
+        ("https://fb.watch/abc/", "facebook"),
+        ("https://old.reddit.com/r/videos/comments/abc123/", "reddit"),
+        ("https://notyoutube.com/watch?v=dQw4w9WgXcQ", "other"),
+        ("https://youtube.com.evil.example/watch", "other"),
+        ("not a url", "other"),
+    ],
+)
+def test_detect_platform(url, platform):
+    assert detect_platform(url) == platform
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "https://www.youtube.com/watch?v=dQw4w9WgXcQ&si=abc&t=10",
+        "https://youtu.be/dQw4w9WgXcQ?si=abc",
+        "youtube.com/shorts/dQw4w9WgXcQ",
+        "https://www.youtube.com/embed/dQw4w9WgXcQ?feature=share",
+    ],
+)
+def test_youtube_links_share_a_canonical_id(url):
+    assert canonicalize(url) == ("youtube", "dQw4w9WgXcQ")
+    assert canonical_key(url) == "youtube:dQw4w9WgXcQ"
+
+
+@pytest.mark.parametrize(
+    "url, ident",
+    [
+        ("https://www.instagram.com/reel/Cabc_12-/?igsh=x", ("instagram", "Cabc_12-")),
+        ("https://www.tiktok.com/@user/video/7234567890", ("tiktok", "7234567890")),
+        ("https://twitter.com/i/web/status/99", ("twitter", "99")),
+        ("https://www.facebook.com/watch/?v=42", ("facebook", "42")),
+        ("https://www.facebook.com/page/videos/42/", ("facebook", "42")),
+        ("https://www.reddit.com/r/videos/comments/abc123/title/", ("reddit", "abc123")),
+    ],
+)
+def test_canonicalize_other_platforms(url, ident):
+    assert canonicalize(url) == ident
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "https://www.youtube.com/@channel",
+        "https://vm.tiktok.com/ZMabc/",
+        "https://example.com/video/1",
+    ],
+)
+def test_canonicalize_gives_up_without_an_id(url):
+    assert canonicalize(url) is None
+
+
+def test_normalize_strips_tracking_and_aliases():
+    assert normalize(" http://www.Example.com/clip/?utm_source=x&b=2&fbclid=y&a=1#top ") == (
+        "https://example.com/clip?a=1&b=2"
+    )
+    assert normalize("m.example.com/clip") == normalize("https://example.com/clip/")
+
+
+def test_canonical_key_falls_back_to_probe_then_url():
+    url = "https://vm.tiktok.com/ZMabc/?utm_medium=share"
+    assert canonical_key(url, {"extractor_key": "TikTok", "id": "7234567890"}) == "tiktok:7234567890"
+    assert canonical_key(url, {"extractor_key": "TikTok"}) == "https://vm.tiktok.com/ZMabc"